@@ -0,0 +1,164 @@
+"""
+This module is the batch analysis engine of the variability study: it computes the Euclidean distance between the
+final weights of the trained runs and their input images, for all the runs of a sweep at once.
+Only the final row of each run is read (a row of the memory map, or the end of results.txt), by a pool of threads,
+and the final weights are stacked in one (runs, synapses) array, so all the distances are computed by a single
+vectorized operation. The distances are memoized in a JSON cache keyed by the folder, the letter and the modification
+time and size of the result file, so plotting again after a sweep grows only reads the new (or rewritten) runs.
+
+Functions:
+    letter_images: The flattened images of the letters (all_images.pkl, read once).
+    final_weights: Loads the final weights of runs in parallel, stacked.
+    eucl_distances: The Euclidean distance of each run to its letter, memoized on disk.
+    group_distances: Groups the distances by num_cells and dev.
+
+Example Usage:
+```python
+runs = [(folder, 'C', dev, num_cells) for folder, dev, num_cells in find_runs(base_dir)]
+distances = eucl_distances(runs)
+by_cells = group_distances(runs, distances)  # {num_cells: {dev: [distances]}}
+```
+"""
+
+import functools
+import json
+import os
+import pickle
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import result_store
+
+CACHE_FILE = "../../snn_sim_folders/analysis_cache.json"
+IMAGES_FILE = "input_images/letter_imgs/all_images.pkl"
+
+
+@functools.lru_cache(maxsize=None)
+def letter_images(images_file=IMAGES_FILE):
+    """
+    The flattened images of the letters, read once per process.
+
+    Args:
+        images_file (str): The pickle of the dictionary of the images.
+
+    Returns:
+        dict: The image of each letter.
+    """
+    with open(images_file, 'rb') as pickle_file:
+        return pickle.load(pickle_file)
+
+
+def _result_key(folder):
+    """The result file of a folder with its modification time and size, None if the run has no results."""
+    for name in (result_store.DATA_FILE, result_store.TEXT_FILE):
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            return [name, stat.st_mtime_ns, stat.st_size]
+    return None
+
+
+def final_weights(folders, workers=8):
+    """
+    Loads the final weights of runs, with a pool of threads (the reads are I/O bound).
+
+    Args:
+        folders (list of str): The simulation folders, all with the same number of synapses.
+        workers (int): The number of threads.
+
+    Returns:
+        numpy.ndarray: The final weights, (runs, synapses).
+    """
+    if not folders:
+        return np.empty((0, 0))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(result_store.final_row, folders))
+    return np.stack(rows)[:, 1:-1]
+
+
+def _load_cache(cache_file):
+    try:
+        with open(cache_file, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache_file, cache):
+    """Writes the cache through a temporary file renamed at once, so a reader never sees a partial cache."""
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as file:
+        json.dump(cache, file)
+    os.replace(tmp_file, cache_file)
+
+
+def eucl_distances(runs, images=None, cache_file=CACHE_FILE, workers=8):
+    """
+    The Euclidean distance between the final weights of each run, normalized by its number of cells,
+    and the image of its letter. The distances of the runs whose result file did not change are read from the cache,
+    the others are computed together and added to it.
+
+    Args:
+        runs (list of tuple): (folder, letter, dev, num_cells) of each run.
+        images (dict): The flattened image of each letter, defaults to letter_images().
+        cache_file (str): The JSON cache of the distances, '' or None to not use a cache.
+        workers (int): The number of threads reading the runs.
+
+    Returns:
+        numpy.ndarray: The distance of each run, NaN for the runs without results.
+    """
+    images = letter_images() if images is None else images
+    cache = _load_cache(cache_file) if cache_file else {}
+    distances = np.full(len(runs), np.nan)
+    keys = [_result_key(folder) for folder, _, _, _ in runs]
+    missing = []
+    for k, ((folder, letter, _, _), key) in enumerate(zip(runs, keys)):
+        entry = cache.get(f"{os.path.abspath(folder)}|{letter}")
+        if key is None:
+            continue
+        if entry is not None and entry['key'] == key:
+            distances[k] = entry['distance']
+        else:
+            missing.append(k)
+
+    # The runs are grouped by number of synapses, to stack their final weights
+    groups = {}
+    for k in missing:
+        groups.setdefault(np.size(images[runs[k][1]]), []).append(k)
+    for indices in groups.values():
+        weights = final_weights([runs[k][0] for k in indices], workers)
+        cells = np.array([runs[k][3] for k in indices], dtype=float)[:, None]
+        targets = np.stack([np.ravel(images[runs[k][1]]) for k in indices]) / 255.0
+        distances[indices] = np.linalg.norm(weights / cells - targets, axis=1)
+        for k in indices:
+            cache[f"{os.path.abspath(runs[k][0])}|{runs[k][1]}"] = {'key': keys[k], 'distance': distances[k]}
+
+    if cache_file and missing:
+        _save_cache(cache_file, cache)
+    return distances
+
+
+def group_distances(runs, distances, num_cells=None, devs=None):
+    """
+    Groups the distances of the runs by num_cells and dev, the runs without results are left out.
+
+    Args:
+        runs (list of tuple): (folder, letter, dev, num_cells) of each run.
+        distances (numpy.ndarray): The distance of each run, see eucl_distances.
+        num_cells (list of int): The numbers of cells to report, even without runs, defaults to those of the runs.
+        devs (list of float): The devs to report, even without runs, defaults to those of the runs.
+
+    Returns:
+        dict: {num_cells: {dev: [distances]}}.
+    """
+    num_cells = sorted({run[3] for run in runs}) if num_cells is None else num_cells
+    devs = sorted({run[2] for run in runs}) if devs is None else devs
+    grouped = {nc: {dev: [] for dev in devs} for nc in num_cells}
+    for (_, _, dev, nc), distance in zip(runs, distances):
+        if not np.isnan(distance) and nc in grouped and dev in grouped[nc]:
+            grouped[nc][dev].append(float(distance))
+    return grouped
@@ -0,0 +1,274 @@
+"""
+This module is an offline benchmark suite of the hot paths of the simulator, to catch the performance regressions of
+the netlist generator, the OCEAN script templating, the result loaders and the native backend. It needs neither
+Cadence nor existing simulation folders: the netlists, OCEAN scripts and results.txt files are generated in a
+temporary folder, with realistic sizes (from 25x1x2 up to 784x100x8 inputs x outputs x cells).
+Each case reports its best time over several repeats and its peak Python memory (tracemalloc, measured in a separate
+run so it does not slow the timed ones). The results can be saved as the baseline, and each run is compared against
+it: the cases that are slower (or use more memory) than the baseline by more than the tolerance are flagged, and the
+exit status is 1, so the suite can gate a change. The baseline is machine-specific: it records the machine it was
+saved on, and on another machine the flagged cases are only reported as warnings (exit status 0). No baseline is
+shipped, save one on the reference machine (benchmark_baseline.example.json shows the format).
+
+Functions:
+    cases: The benchmark cases, as (name, setup) tuples.
+    measure: Times a case and measures its peak memory.
+    compare: Compares results with a baseline.
+    machine: Describes the machine the benchmarks run on.
+    main: Command line entry point.
+
+Example Usage:
+```bash
+>> python benchmark.py --save          # Stores the results as the baseline of this machine
+>> python benchmark.py                 # Runs all the cases and compares them with benchmark_baseline.json
+>> python benchmark.py --quick -k netlist
+```
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import native_sim
+import result_store
+import subst_run
+from net_generator import NetworkGenerator, SynapseArray
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+OCEAN_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "oceanScript.ocn")
+
+NETLIST_SIZES = [(25, 1, 2), (25, 1, 8), (100, 10, 4), (784, 10, 8), (784, 100, 8)]
+TEMPLATE_SIZES = [(25, 1, 8), (784, 10, 8)]
+RESULTS_SIZES = [(151, 27), (151, 7842), (1501, 786)]  # (rows, columns): ?step 1m over 150 ms, up to 784x10 synapses
+QUICK_LIMIT = 100 * 10 * 4  # --quick skips the cases with more synapse cells than this
+
+
+def _params(num_input, num_output, num_cells, **extra):
+    """The simulation parameters of a synthetic design."""
+    params = {'sim_time': 150e-3, 'spike_duration': 10e-3, 'mem_vth': 12e-3, 'num_input': num_input,
+              'num_output': num_output, 'num_cells': num_cells, 'dev': 0.05, 'netlist': "netlist",
+              'process_dir': ".", 'results_file': "results.txt"}
+    params['save_states'] = " ".join("+".join(f'v("synapse{i}_{o}.cell{j}.I:ix")' for j in range(1, num_cells + 1))
+                                     for o in range(1, num_output + 1) for i in range(1, num_input + 1))
+    params.update(extra)
+    return params
+
+
+def _spikes(num_input, seed=0):
+    """The number of spikes of each input neuron of a synthetic input image."""
+    return 3 + 10 * np.random.default_rng(seed).uniform(size=num_input)
+
+
+def _write_results(path, rows, columns):
+    """Writes a synthetic results.txt with the layout of ocnPrint (4 header lines, time column and waveforms)."""
+    data = np.random.default_rng(0).uniform(0, 2, (rows, columns))
+    data[:, 0] = np.arange(rows) * 1e-3
+    names = ["time"] + [f"syn{k}" for k in range(1, columns - 1)] + [result_store.MEMBRANE_COLUMN]
+    with open(path, "w") as file:
+        file.write("\n" + " ".join(names) + "\n\n\n")
+        np.savetxt(file, data, fmt="%.5g")
+
+
+def cases(workdir, quick=False):
+    """
+    The benchmark cases. Each setup(directory) prepares the inputs of a case outside of the timing,
+    and returns the function that is timed.
+
+    Args:
+        workdir (str): The temporary folder of the generated files.
+        quick (bool): Whether to skip the largest cases.
+
+    Returns:
+        list of tuple: (name, setup) of each case.
+    """
+    result = []  # Each case draws its own inputs, so a case does not depend on the selected ones
+
+    for ni, no, nc in NETLIST_SIZES:
+        if quick and ni * no * nc > QUICK_LIMIT:
+            continue
+        def setup(directory, ni=ni, no=no, nc=nc):
+            generator = NetworkGenerator(os.path.join(directory, "netlist"), ni, no, nc, _spikes(ni))
+            return generator.generate_netlist_file
+        result.append((f"netlist_{ni}x{no}x{nc}", setup))
+
+        def setup(directory, ni=ni, no=no, nc=nc):
+            return lambda: SynapseArray.dense(ni, no, nc)
+        result.append((f"synapses_{ni}x{no}x{nc}", setup))
+
+    for ni, no, nc in TEMPLATE_SIZES:
+        if quick and ni * no * nc > QUICK_LIMIT:
+            continue
+        def setup(directory, ni=ni, no=no, nc=nc):
+            params = _params(ni, no, nc)
+            return lambda: subst_run.substitute_templ(OCEAN_TEMPLATE, os.path.join(directory, "updated.ocn"), params)
+        result.append((f"substitute_templ_{ni}x{no}x{nc}", setup))
+
+    for rows, columns in RESULTS_SIZES:
+        if quick and rows * columns > 151 * 27:
+            continue
+        def setup(directory, rows=rows, columns=columns):
+            _write_results(os.path.join(directory, result_store.TEXT_FILE), rows, columns)
+            return lambda: result_store.load_results(directory)  # Text fallback, the folder is not converted
+        result.append((f"parse_results_{rows}x{columns}", setup))
+
+        def setup(directory, rows=rows, columns=columns):
+            _write_results(os.path.join(directory, result_store.TEXT_FILE), rows, columns)
+            return lambda: result_store.convert_results(directory)
+        result.append((f"convert_results_{rows}x{columns}", setup))
+
+        def setup(directory, rows=rows, columns=columns):
+            _write_results(os.path.join(directory, result_store.TEXT_FILE), rows, columns)
+            result_store.convert_results(directory)
+            return lambda: np.array(result_store.load_results(directory)[-1, 1:-1])  # Final weights from the memory map
+        result.append((f"load_store_{rows}x{columns}", setup))
+
+    native_cases = [("grid", 25, 1, 2, 2e-3, 1), ("event", 25, 1, 4, 30e-3, 1), ("grid", 25, 1, 2, 1e-3, 8)]
+    for mode, ni, no, nc, sim_time, designs in native_cases:
+        def setup(directory, mode=mode, ni=ni, no=no, nc=nc, sim_time=sim_time, designs=designs):
+            synapses = SynapseArray.dense(ni, no, nc)
+            params_list = [_params(ni, no, nc, sim_time=sim_time, dev=0.05 * d) for d in range(designs)]
+            spikes = [_spikes(ni, d) for d in range(designs)]
+            if designs == 1:
+                return lambda: native_sim.simulate(params_list[0], spikes[0], synapses.seeds, synapses.paps,
+                                                   synapses.input_index - 1, synapses.output_index - 1, time_mode=mode)
+            return lambda: native_sim.simulate_batch(params_list, spikes, [synapses.seeds] * designs, [synapses.paps] * designs,
+                                                     synapses.input_index - 1, synapses.output_index - 1, time_mode=mode)
+        name = f"native_{mode}_{ni}x{no}x{nc}_{sim_time * 1e3:g}ms" + (f"_batch{designs}" if designs > 1 else "")
+        result.append((name, setup))
+    return result
+
+
+def measure(setup, workdir, repeats=5):
+    """
+    Times a case and measures its peak memory.
+
+    Args:
+        setup (callable): The setup of the case, returns the function to time.
+        workdir (str): The temporary folder of the case.
+        repeats (int): The number of timed runs, the best one is kept.
+
+    Returns:
+        dict: time (s) and peak_mb (peak of the Python allocations, MB).
+    """
+    os.makedirs(workdir, exist_ok=True)
+    run = setup(workdir)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'time': min(times), 'peak_mb': peak / 1e6}
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Compares results with a baseline.
+
+    Args:
+        results (dict): The measures of each case.
+        baseline (dict): The measures of the baseline, by case.
+        tolerance (float): The relative slowdown (or memory increase) above which a case is flagged.
+
+    Returns:
+        list of str: The flagged cases, with their ratios.
+    """
+    flagged = []
+    for name, measures in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for key, label in (('time', "slower"), ('peak_mb', "more memory")):
+            # Cases below 10 ms or 1 MB are too noisy to flag
+            floor = 1e-2 if key == 'time' else 1.0
+            ratio = measures[key] / max(reference[key], floor)
+            if measures[key] > floor and ratio > 1 + tolerance:
+                flagged.append(f"{name}: {ratio:.2f}x {label} than the baseline")
+    return flagged
+
+
+def machine():
+    """
+    Describes the machine the benchmarks run on: host, CPU model and count, and the versions of Python and numpy.
+
+    Returns:
+        str: The description, stored with the baseline.
+    """
+    cpu = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo", "r") as file:
+            cpu = next((line.split(":", 1)[1].strip() for line in file if line.startswith("model name")), cpu)
+    except OSError:
+        pass
+    return f"{platform.node()} {cpu} x{os.cpu_count()} python {platform.python_version()} numpy {np.__version__}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the simulator hot paths.")
+    parser.add_argument("-k", dest="pattern", default="", help="run the cases whose name matches this regex")
+    parser.add_argument("--quick", action="store_true", help="skip the largest cases")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per case, the best is kept")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file")
+    parser.add_argument("--save", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative slowdown flagged as a regression")
+    args = parser.parse_args(argv)
+
+    baseline, baseline_machine = {}, None
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, "r") as file:
+            stored = json.load(file)
+        baseline, baseline_machine = stored['results'], stored.get('machine')
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="snn_benchmark_")
+    try:
+        print(f"{'case':<40} {'time (s)':>10} {'peak (MB)':>10} {'baseline (s)':>13}")
+        for name, setup in cases(workdir, args.quick):
+            if not re.search(args.pattern, name):
+                continue
+            results[name] = measure(setup, os.path.join(workdir, name), args.repeats)
+            reference = baseline.get(name, {}).get('time')
+            print(f"{name:<40} {results[name]['time']:>10.4f} {results[name]['peak_mb']:>10.1f} "
+                  f"{reference if reference is not None else float('nan'):>13.4f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        baseline.update(results)
+        if baseline_machine != machine():
+            baseline = dict(results)  # The measures of another machine are not kept
+        with open(args.baseline, "w") as file:
+            json.dump({'machine': machine(), 'results': baseline}, file, indent=1, sort_keys=True)
+        print(f"Baseline saved in {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"No baseline in {args.baseline}, save one on this machine with --save")
+        return 0
+    flagged = compare(results, baseline, args.tolerance)
+    if baseline_machine != machine():
+        # The times of another machine are no reference, the differences are only reported
+        print(f"WARNING the baseline was saved on '{baseline_machine}', not on '{machine()}', save one here with --save")
+        for line in flagged:
+            print("WARNING " + line)
+        return 0
+    for line in flagged:
+        print("REGRESSION " + line)
+    return 1 if flagged else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+This module describes the connectivity of the synapses between the input and the output neurons, as a sparse matrix
+in coordinate (COO) form: the 1-based input and output neuron of each synapse, in netlist order (by output neuron,
+then by input neuron, as the dense layer). The netlist, the signals saved by the OCEAN script, the columns of the
+results and the native backend all follow these synapses, so the simulation time and the size of the results grow
+with the number of synapses instead of num_input * num_output.
+The connectivity is selected by params['connectivity']:
+    'dense': all-to-all (the default, the netlist of the original generator).
+    'receptive_field': each output neuron is connected to a square patch of field_size x field_size pixels of the
+        input image, the patches are placed with field_stride over the image (and repeat if there are more outputs).
+    'fan_in': each output neuron is connected to fan_in input neurons drawn at random (connectivity_seed).
+    a path to a .npy/.npz file: a (num_input, num_output) matrix, dense (non-zero entries are synapses) or saved
+        with scipy.sparse.save_npz.
+
+Functions:
+    dense: All-to-all connectivity.
+    receptive_fields: Local receptive fields over the input image.
+    random_fan_in: Random fan-in of each output neuron.
+    from_matrix: Connectivity from a dense or sparse (num_input, num_output) matrix.
+    edges: Connectivity of a design, from its parameters.
+
+Example Usage:
+```python
+input_index, output_index = edges({'num_input': 784, 'num_output': 10, 'connectivity': 'receptive_field',
+                                   'field_size': 7, 'field_stride': 7})
+synapses = SynapseArray.connected(input_index, output_index, num_cells=4)
+```
+"""
+
+import numpy as np
+
+# Parameters that set the connectivity of a design (part of the netlist and batch keys)
+CONNECTIVITY_PARAMS = ('connectivity', 'field_size', 'field_stride', 'fan_in', 'connectivity_seed')
+
+
+def _sorted(input_index, output_index):
+    """Removes the duplicated synapses and sorts them in netlist order, returns 1-based int arrays."""
+    pairs = np.unique(np.column_stack([output_index, input_index]).astype(np.int64), axis=0)
+    return pairs[:, 1] + 1, pairs[:, 0] + 1
+
+
+def dense(num_input, num_output):
+    """
+    All-to-all connectivity, in the order of the original netlist.
+
+    Args:
+        num_input (int): The number of input neurons.
+        num_output (int): The number of output neurons.
+
+    Returns:
+        tuple: The 1-based input and output neuron of each synapse.
+    """
+    i = np.arange(num_input * num_output)
+    return i % num_input + 1, i // num_input + 1
+
+
+def receptive_fields(num_input, num_output, field_size, field_stride=1):
+    """
+    Local receptive fields: output neuron k is connected to the k-th square patch of the (square) input image,
+    the patches being placed every field_stride pixels, row by row, and reused when there are more outputs than patches.
+
+    Args:
+        num_input (int): The number of input neurons, a square number of pixels.
+        num_output (int): The number of output neurons.
+        field_size (int): The side of a patch, in pixels.
+        field_stride (int): The distance between two patches, in pixels.
+
+    Returns:
+        tuple: The 1-based input and output neuron of each synapse.
+    """
+    side = int(round(np.sqrt(num_input)))
+    if side * side != num_input or not 0 < field_size <= side:
+        raise ValueError(f"Receptive fields need a square image and 0 < field_size <= {side}, got num_input={num_input} "
+                         f"and field_size={field_size}")
+    corners = np.arange(0, side - field_size + 1, max(field_stride, 1))
+    rows, cols = np.meshgrid(corners, corners, indexing="ij")
+    patch = (np.arange(field_size)[:, None] * side + np.arange(field_size)[None, :]).ravel()
+    starts = (rows * side + cols).ravel()
+    outputs = np.arange(num_output)
+    input_index = starts[outputs % len(starts)][:, None] + patch[None, :]
+    output_index = np.repeat(outputs, len(patch))
+    return _sorted(input_index.ravel(), output_index)
+
+
+def random_fan_in(num_input, num_output, fan_in, seed=10):
+    """
+    Random fan-in: each output neuron is connected to fan_in distinct input neurons drawn at random.
+
+    Args:
+        num_input (int): The number of input neurons.
+        num_output (int): The number of output neurons.
+        fan_in (int): The number of synapses of each output neuron.
+        seed (int): The seed of the draws.
+
+    Returns:
+        tuple: The 1-based input and output neuron of each synapse.
+    """
+    rng = np.random.default_rng(seed)
+    fan_in = min(fan_in, num_input)
+    input_index = np.argsort(rng.random((num_output, num_input)), axis=1)[:, :fan_in]
+    output_index = np.repeat(np.arange(num_output), fan_in)
+    return _sorted(input_index.ravel(), output_index)
+
+
+def from_matrix(matrix):
+    """
+    Connectivity from a (num_input, num_output) matrix, a NumPy array (the non-zero entries are synapses)
+    or a scipy.sparse matrix (COO, CSR, ...).
+
+    Args:
+        matrix: The connectivity matrix.
+
+    Returns:
+        tuple: The 1-based input and output neuron of each synapse.
+    """
+    if hasattr(matrix, "tocoo"):
+        coo = matrix.tocoo()
+        nonzero = coo.data != 0
+        return _sorted(coo.row[nonzero], coo.col[nonzero])
+    rows, cols = np.nonzero(np.asarray(matrix))
+    return _sorted(rows, cols)
+
+
+def _load_matrix(path):
+    if path.endswith(".npz"):
+        import scipy.sparse  # Only needed for the matrices saved with scipy.sparse.save_npz
+        return scipy.sparse.load_npz(path)
+    return np.load(path)
+
+
+def edges(params):
+    """
+    Connectivity of a design, from params['connectivity'] (see the module description).
+
+    Args:
+        params (dict): The simulation parameters, num_input and num_output must be set.
+
+    Returns:
+        tuple: The 1-based input and output neuron of each synapse, in netlist order.
+    """
+    kind = params.get('connectivity', 'dense') or 'dense'
+    num_input, num_output = params['num_input'], params['num_output']
+    if kind == 'dense':
+        return dense(num_input, num_output)
+    if kind == 'receptive_field':
+        return receptive_fields(num_input, num_output, params['field_size'], params.get('field_stride', 1))
+    if kind == 'fan_in':
+        return random_fan_in(num_input, num_output, params['fan_in'], params.get('connectivity_seed', 10))
+    matrix = _load_matrix(kind)
+    if tuple(matrix.shape) != (num_input, num_output):
+        raise ValueError(f"The connectivity matrix {kind} has shape {matrix.shape}, expected ({num_input}, {num_output})")
+    return from_matrix(matrix)
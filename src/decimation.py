@@ -0,0 +1,101 @@
+"""
+This module downsamples long traces before plotting, with shape-preserving decimations: a plot of a few thousand
+points per trace looks the same as the plot of every sample, but renders much faster for the long runs and the
+hundreds of synapse traces of the large networks. The functions process all the columns of a table at once.
+
+Functions:
+    minmax: Keeps the minimum and the maximum of each bucket (the steps of the weights are never lost).
+    lttb: Largest-Triangle-Three-Buckets, keeps the point of each bucket that best preserves the visual shape.
+    drop_flat: Drops the inner points of the constant runs of each trace, as polylines.
+
+Example Usage:
+```python
+t, w = minmax(data[:, 0], data[:, 1:-1], 1000)   # (2002, num_synapses) each
+axe.add_collection(LineCollection(drop_flat(t, w)))
+```
+"""
+
+import numpy as np
+
+
+def minmax(x, y, buckets):
+    """
+    Min/max decimation: the samples are split in buckets, and the minimum and the maximum of each column are kept
+    in each bucket, in time order. The first and last samples are kept.
+
+    Args:
+        x (numpy.ndarray): The sample times, (n,).
+        y (numpy.ndarray): The traces, (n,) or (n, m).
+        buckets (int): The number of buckets, the traces keep 2 * buckets + 2 points.
+
+    Returns:
+        tuple: The times and the values of the kept points, (k, m) each (the times differ between columns).
+    """
+    x = np.asarray(x)
+    y = np.asarray(y).reshape(len(x), -1)
+    n, m = y.shape
+    if n <= 2 * buckets + 2:
+        return np.repeat(x[:, None], m, axis=1), y
+    size = -(-n // buckets)
+    padded = np.concatenate([y, np.repeat(y[-1:], size * buckets - n, axis=0)]).reshape(buckets, size, m)
+    start = (np.arange(buckets) * size)[:, None]
+    low = np.minimum(start + padded.argmin(axis=1), n - 1)
+    high = np.minimum(start + padded.argmax(axis=1), n - 1)
+    first, second = np.minimum(low, high), np.maximum(low, high)
+    index = np.concatenate([np.zeros((1, m), dtype=np.intp), np.stack([first, second], axis=1).reshape(-1, m),
+                            np.full((1, m), n - 1)])
+    return x[index], np.take_along_axis(y, index, axis=0)
+
+
+def lttb(x, y, points):
+    """
+    Largest-Triangle-Three-Buckets decimation: the first and last samples are kept, and in each bucket the sample
+    that forms the largest triangle with the point kept in the previous bucket and the mean of the next bucket.
+
+    Args:
+        x (numpy.ndarray): The sample times, (n,).
+        y (numpy.ndarray): The traces, (n,) or (n, m).
+        points (int): The number of points kept per trace (at least 3).
+
+    Returns:
+        tuple: The times and the values of the kept points, (points, m) each.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float).reshape(len(x), -1)
+    n, m = y.shape
+    if n <= points or points < 3:
+        return np.repeat(x[:, None], m, axis=1), y
+    edges = np.linspace(1, n - 1, points - 1).astype(np.intp)  # The buckets of the inner points
+    index = np.zeros((points, m), dtype=np.intp)
+    index[-1] = n - 1
+    columns = np.arange(m)
+    for k in range(points - 2):
+        lo, hi = edges[k], edges[k + 1]
+        next_hi = edges[k + 2] if k + 2 < len(edges) else n
+        x_next, y_next = x[hi:next_hi].mean(), y[hi:next_hi].mean(axis=0)
+        x_prev, y_prev = x[index[k]], y[index[k], columns]
+        # Twice the area of the triangles (previous point, candidate, mean of the next bucket)
+        area = np.abs((x_prev - x_next) * (y[lo:hi] - y_prev) - (x_prev - x[lo:hi, None]) * (y_next - y_prev))
+        index[k + 1] = lo + area.argmax(axis=0)
+    return x[index], np.take_along_axis(y, index, axis=0)
+
+
+def drop_flat(x, y):
+    """
+    Drops the inner points of the constant runs of each trace, which do not change its plot: the weights only
+    change when an MTJ switches, so their traces are mostly flat and shrink to a few points.
+
+    Args:
+        x (numpy.ndarray): The times, (n,) or (n, m) as returned by minmax and lttb.
+        y (numpy.ndarray): The traces, (n, m).
+
+    Returns:
+        list of numpy.ndarray: The (time, value) points of each trace, e.g. for a LineCollection.
+    """
+    y = np.asarray(y).reshape(len(y), -1)
+    x = np.broadcast_to(np.asarray(x).reshape(len(y), -1), y.shape)
+    keep = np.ones(y.shape, dtype=bool)
+    keep[1:-1] = (y[1:-1] != y[:-2]) | (y[1:-1] != y[2:])
+    counts = keep.sum(axis=0)
+    points = np.stack([x.T[keep.T], y.T[keep.T]], axis=-1)  # Column by column
+    return np.split(points, np.cumsum(counts)[:-1])
@@ -0,0 +1,236 @@
+"""
+This module tabulates the Neel-Brown switching delay of `mtj_model.va`, tau = tau0 * exp(EE * (1 - |Id / Ic|)),
+over regular grids of the normalized bias current x = |Id / Ic|, of the free layer thickness tsl and of the
+temperature T (EE = Em / (kB * T * 40 * pi) only depends on tsl and T, and the TMR only enters through Ic).
+The grids are refined until the multilinear interpolation is within a relative error bound of the closed form,
+so the hot loop of the native backend can read the delays of all its cells with a vectorized interpolation instead
+of an exponential. The tables are cached on disk, named by the hash of the model parameters, ranges and error bound,
+and a validation mode reports their maximum error against the closed form on random points.
+The Sun duration (durationstatic = sun_coef / |Id - Ic|) needs no table: its logarithm only depends on the device,
+it is computed once per device in sun_coef (see mtj_sampler).
+
+Functions:
+    brown_delay: Closed form of the Neel-Brown delay.
+    DelayTable: A tabulated delay with its vectorized interpolation.
+    build_table: Builds a table within an error bound.
+    load_table: Loads a table from the disk cache, building it on a miss.
+    validate: Maximum error of a table against the closed form.
+
+Example Usage:
+```python
+table = load_table("../../snn_sim_folders/delay_tables", tsl_range=(0.65e-9, 1.95e-9), temp_range=(300, 300))
+tau, inside = table(x, tslreal, 300)
+```
+```bash
+>> python delay_table.py --max-error 1e-3    # Builds (or loads) the default table and validates it
+```
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from mtj_sampler import MTJ_PARAMETERS, K_B
+
+EXP_LIMIT = 85.0      # `explimit of the limited exponential
+BROWN_RANGE = (0.0, 0.8)  # The Neel-Brown model only applies below 0.8 * Ic
+MAX_POINTS = 1 << 20  # Size cap of a table
+
+
+def brown_delay(x, tsl, temp, **model):
+    """
+    Closed form of the mean Neel-Brown switching delay of `mtj_model.va`.
+
+    Args:
+        x (numpy.ndarray): The normalized bias current |Id / Ic|.
+        tsl (numpy.ndarray): The free layer thickness (tslreal), in m.
+        temp (numpy.ndarray): The temperature, in K.
+        **model: Overrides of MTJ_PARAMETERS.
+
+    Returns:
+        numpy.ndarray: The mean delay tau, in s.
+    """
+    p = dict(MTJ_PARAMETERS)
+    p.update(model)
+    em = p['Ms'] * np.asarray(tsl) * np.pi * p['r'] ** 2 * p['Hk'] / 2
+    ee = em / (K_B * np.asarray(temp) * 40 * np.pi)
+    return p['tau0'] * np.exp(np.clip(ee * (1 - np.asarray(x)), -EXP_LIMIT, EXP_LIMIT))
+
+
+class DelayTable:
+    """
+    The Neel-Brown delay tabulated on a regular (x, tsl, T) grid, read by multilinear interpolation.
+    An axis of a single point is a fixed value, e.g. the temperature of a sweep.
+
+    Attributes:
+        axes [list]: The grid of x, tsl and T, evenly spaced 1-D arrays.
+        values [numpy.ndarray]: The delays on the grid, (len(x), len(tsl), len(T)).
+        max_error [float]: The maximum relative error of the interpolation measured when the table was built.
+        model [dict]: The overrides of MTJ_PARAMETERS the table was built with.
+
+    Methods
+    -------
+    __call__(x, tsl, temp):
+        Interpolates the delays, and tells which points are inside the table.
+    save(path):
+        Writes the table in a .npz file.
+    load(path):
+        Reads a table written by save.
+    """
+
+    def __init__(self, axes, values, max_error=np.nan, model=None):
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.values = np.ascontiguousarray(values, dtype=float)
+        self.max_error = float(max_error)
+        self.model = dict(model or {})
+        self._strides = [stride // self.values.itemsize for stride in self.values.strides]
+
+    def __call__(self, x, tsl, temp):
+        coords = [np.asarray(c, dtype=float) for c in (x, tsl, temp)]
+        inside = np.ones(np.broadcast(*coords).shape, dtype=bool)
+        terms = [(0, 1.0)]  # (flat index, weight) of the corners of the cells
+        for axis, c, stride in zip(self.axes, coords, self._strides):
+            inside &= (c >= axis[0]) & (c <= axis[-1])
+            if len(axis) == 1:
+                continue
+            pos = (c - axis[0]) / (axis[1] - axis[0])
+            i = np.clip(np.floor(pos).astype(np.intp), 0, len(axis) - 2)
+            w = np.clip(pos - i, 0.0, 1.0)
+            terms = [(index + (i + k) * stride, weight * (w if k else 1 - w)) for index, weight in terms for k in (0, 1)]
+        flat = self.values.ravel()
+        return sum(flat[index] * weight for index, weight in terms), inside
+
+    def save(self, path):
+        np.savez(path, x=self.axes[0], tsl=self.axes[1], temp=self.axes[2], values=self.values,
+                 max_error=self.max_error, model=json.dumps(self.model))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls([data['x'], data['tsl'], data['temp']], data['values'], data['max_error'],
+                       json.loads(str(data['model'])))
+
+
+def _grid(ranges, points):
+    return [np.linspace(lo, hi, n) if hi > lo else np.array([lo]) for (lo, hi), n in zip(ranges, points)]
+
+
+def _midpoints(axis):
+    return (axis[:-1] + axis[1:]) / 2 if len(axis) > 1 else axis
+
+
+def _error(table, axes, model):
+    """Maximum relative error of the table on the given grid."""
+    mesh = np.meshgrid(*axes, indexing="ij")
+    exact = brown_delay(*mesh, **model)
+    return float(np.max(np.abs(table(*mesh)[0] - exact) / exact))
+
+
+def build_table(max_error=1e-2, x_range=BROWN_RANGE, tsl_range=None, temp_range=(300, 300), points=(9, 5, 3),
+                **model):
+    """
+    Builds a table of the Neel-Brown delay within a relative error bound. The error of the multilinear
+    interpolation of the (convex) delay peaks between the nodes, so it is measured on the midpoints of each axis
+    and of the cells, and the axes whose midpoints exceed the bound are refined until the whole table is within it.
+
+    Args:
+        max_error (float): The bound of the relative error of the interpolation.
+        x_range (tuple): The range of the normalized bias current |Id / Ic|.
+        tsl_range (tuple): The range of tslreal, defaults to tsl * (0.5, 1.5).
+        temp_range (tuple): The range of the temperature, a single point when both bounds are equal.
+        points (tuple): The initial number of points of each axis.
+        **model: Overrides of MTJ_PARAMETERS.
+
+    Returns:
+        DelayTable: The table, its max_error is the measured error.
+    """
+    if tsl_range is None:
+        tsl = model.get('tsl', MTJ_PARAMETERS['tsl'])
+        tsl_range = (0.5 * tsl, 1.5 * tsl)
+    ranges = [x_range, tsl_range, temp_range]
+    points = list(points)
+    while True:
+        axes = _grid(ranges, points)
+        table = DelayTable(axes, brown_delay(*np.meshgrid(*axes, indexing="ij"), **model), model=model)
+        # Error along each axis, at its midpoints and on the nodes of the other axes
+        errors = [_error(table, axes[:k] + [_midpoints(axes[k])] + axes[k + 1:], model) for k in range(len(axes))]
+        refine = [k for k, error in enumerate(errors) if error > max_error / sum(len(axis) > 1 for axis in axes)]
+        if not refine:
+            table.max_error = _error(table, [_midpoints(axis) for axis in axes], model)
+            if table.max_error <= max_error:
+                return table
+            refine = [int(np.argmax(errors))]
+        for k in refine:
+            points[k] = 2 * points[k] - 1
+        if np.prod([len(axis) if k not in refine else points[k] for k, axis in enumerate(axes)]) > MAX_POINTS:
+            raise ValueError(f"The table needs more than {MAX_POINTS} points to be within {max_error}, "
+                             f"narrow its ranges or loosen the error bound")
+
+
+def load_table(cache_dir, max_error=1e-2, x_range=BROWN_RANGE, tsl_range=None, temp_range=(300, 300), **model):
+    """
+    Loads a table from the disk cache, or builds it and adds it to the cache. The entries are named by the hash of
+    the model parameters, the ranges and the error bound, and written through a temporary file renamed at once,
+    so concurrent processes never read a partial table.
+
+    Args:
+        cache_dir (str): The cache directory.
+        max_error, x_range, tsl_range, temp_range, **model: See build_table.
+
+    Returns:
+        DelayTable: The table.
+    """
+    p = dict(MTJ_PARAMETERS)
+    p.update(model)
+    if tsl_range is None:
+        tsl_range = (0.5 * p['tsl'], 1.5 * p['tsl'])
+    key = hashlib.sha256(json.dumps([p, max_error, list(x_range), list(tsl_range), list(temp_range)],
+                                    sort_keys=True).encode()).hexdigest()
+    path = os.path.join(cache_dir, key + ".npz")
+    if os.path.isfile(path):
+        return DelayTable.load(path)
+    table = build_table(max_error, x_range, tsl_range, temp_range, **model)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".npz.tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            table.save(file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return table
+
+
+def validate(table, samples=100000, seed=0):
+    """
+    Maximum relative error of a table against the closed form, on random points inside the table.
+
+    Args:
+        table (DelayTable): The table.
+        samples (int): The number of random points.
+        seed (int): The seed of the points.
+
+    Returns:
+        float: The maximum relative error.
+    """
+    rng = np.random.default_rng(seed)
+    coords = [rng.uniform(axis[0], axis[-1], samples) for axis in table.axes]
+    exact = brown_delay(*coords, **table.model)
+    return float(np.max(np.abs(table(*coords)[0] - exact) / exact))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Builds (or loads) a Neel-Brown delay table and validates it.")
+    parser.add_argument("--cache", default="../../snn_sim_folders/delay_tables", help="cache directory")
+    parser.add_argument("--max-error", type=float, default=1e-2, help="bound of the relative interpolation error")
+    parser.add_argument("--temp", type=float, nargs=2, default=(300, 300), help="temperature range, in K")
+    parser.add_argument("--samples", type=int, default=100000, help="random points of the validation")
+    args = parser.parse_args()
+    table = load_table(args.cache, args.max_error, temp_range=tuple(args.temp))
+    print(f"grid {' x '.join(str(len(axis)) for axis in table.axes)}, built within {table.max_error:.2e}, "
+          f"validated within {validate(table, args.samples):.2e} on {args.samples} random points")
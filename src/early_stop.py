@@ -0,0 +1,88 @@
+"""
+This module ends the Spectre training runs once their weights have settled, as the native backend does with
+params['early_stop'], the quiet window in s (see native_sim). The stop condition is expressed in the netlist: the
+`activity` terminal of every MTJ cell (`mtj_model.va`) sources its state on the global node
+net_generator.ACTIVITY_NODE, and an `Early_stop` instance (`early_stop.va`) loads this node and calls `$finish` once
+its voltage, the number of antiparallel cells, did not change for the window. The window is a desVar of the OCEAN script, so the designs of an
+OCEAN session share the netlist whatever their window. Without early stop, the cells ground their `activity` terminal
+and the netlist has no monitor.
+The monitor prints the stop time in the Spectre log, from which the stop time and reason of the run are recorded in its
+parameters (stop_time and stop_reason, as native_sim.record_stop). With the 'final' output profile, the OCEAN script
+prints every PRINT_STEP (the time of the stop is not known in advance) and the results are trimmed to their first
+and last rows here.
+
+Functions:
+    spectre_stop_time: The time at which the monitor ended a transient, from the Spectre log.
+    record_stop: Records when and why a Spectre run ended in its parameters.
+    trim_final: Keeps the first and last rows of the results of a 'final' run.
+
+Example Usage:
+```python
+params['early_stop'] = 20e-3  # Stop once no MTJ switched for 20 ms
+...                           # Run the OCEAN script
+record_stop(params, os.path.join(params['process_dir'], "psf", "spectre.out"))
+trim_final(params)
+```
+"""
+
+import os
+import re
+
+import output_profile
+import result_store
+from native_sim import TRAN_STEP
+
+STOP_PATTERN = re.compile(r"early_stop: converged at\s+([-+.\deE]+)\s*s")
+
+
+def spectre_stop_time(log_file):
+    """
+    The time at which the Early_stop monitor ended a transient, from the line it printed in the Spectre log.
+
+    Args:
+        log_file (str): The path of the log, e.g. psf/spectre.out in the results directory.
+
+    Returns:
+        float: The stop time in s, None if the run was not stopped (or the log does not exist).
+    """
+    try:
+        with open(log_file, "r", errors="replace") as file:
+            match = STOP_PATTERN.search(file.read())
+    except OSError:
+        return None
+    return float(match.group(1)) if match else None
+
+
+def record_stop(params, log_file):
+    """
+    Records when and why a Spectre run ended in its parameters, stop_time and stop_reason ('converged' after an early
+    stop, 'sim_time' otherwise), so they are written in the header of its binary store and in its metrics.
+
+    Args:
+        params (dict): The simulation parameters.
+        log_file (str): The path of the Spectre log of the run.
+    """
+    stop_time = spectre_stop_time(log_file) if params.get('early_stop', 0) > 0 else None
+    converged = stop_time is not None and stop_time < params['sim_time'] - TRAN_STEP
+    params['stop_time'] = stop_time if converged else float(params['sim_time'])
+    params['stop_reason'] = 'converged' if converged else 'sim_time'
+
+
+def trim_final(params):
+    """
+    Keeps the first and last rows of the results.txt of a run with the 'final' output profile and early stop,
+    printed every PRINT_STEP by the OCEAN script (see output_profile.print_step).
+
+    Args:
+        params (dict): The simulation parameters, with results_file.
+    """
+    if params.get('output_profile', 'full') != 'final' or not params.get('early_stop', 0) > 0:
+        return
+    with open(params['results_file'], "r") as file:
+        lines = file.readlines()
+    header = lines[:result_store.TEXT_HEADER_LINES]
+    rows = [line for line in lines[result_store.TEXT_HEADER_LINES:] if line.strip()]
+    tmp_file = params['results_file'] + ".tmp"
+    with open(tmp_file, "w") as file:
+        file.writelines(header + [rows[i] for i in output_profile.printed_rows(params, rows)])
+    os.replace(tmp_file, params['results_file'])
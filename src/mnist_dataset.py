@@ -0,0 +1,182 @@
+"""
+This module reads the MNIST dataset lazily from its idx files: the image and label files are opened with `np.memmap`,
+so only the selected images are read from disk, and no per-image .npy file is written. It selects images by index,
+by class or as a stratified subset, rescales them to the grids of the small networks (e.g. 5x5 or 10x10, by averaging
+the pixels over the area of each new pixel), and codes whole batches into the number of spikes of each input neuron
+with the formula of `snn_simulator.load_input` (cod_base + cod_max * pixel / 255).
+The images are given to the simulations by name, 'mnist<index>' in params['inp_img'] (e.g. 'mnist10', or a sequence
+'mnist0,mnist1'), and load_input reads them from the memory map of params['mnist_set'], rescaled to params['mnist_size'].
+
+Functions:
+    read_idx: Opens an idx file as a memory map.
+    rescale: Rescales a batch of images by area averaging.
+    rate_code: Codes a batch of images into numbers of spikes.
+    MnistDataset: The images and labels of a set, with selection and batch helpers.
+    load_dataset: Opens a set of the dataset, once per process.
+
+Example Usage:
+```python
+dataset = load_dataset("./input_images/mnist_data", "train")
+indices = dataset.stratified(per_class=10, seed=0)
+for a in dataset.names(indices):          # One simulation per image, streamed from the memory map
+    param_combinations.append(dict(variables, inp_img=a))
+for batch_indices, n_spik, labels in dataset.batches(indices, 64, variables['cod_base'], variables['cod_max'], size=10):
+    ...
+```
+"""
+
+import functools
+import os
+
+import numpy as np
+
+PREFIX = "mnist"  # inp_img names of the MNIST images: mnist<index>
+FILES = {
+    'train': ("train-images.idx3-ubyte", "train-labels.idx1-ubyte"),
+    'test': ("t10k-images.idx3-ubyte", "t10k-labels.idx1-ubyte"),
+}
+IDX_TYPES = {0x08: np.uint8, 0x09: np.int8, 0x0B: '>i2', 0x0C: '>i4', 0x0D: '>f4', 0x0E: '>f8'}
+
+
+def read_idx(path):
+    """
+    Opens an idx file (magic number: two zero bytes, the type code and the number of dimensions,
+    then the big-endian size of each dimension) as a read-only memory map.
+
+    Args:
+        path (str): The path of the idx file.
+
+    Returns:
+        numpy.memmap: The array of the file.
+    """
+    with open(path, "rb") as file:
+        magic = file.read(4)
+        if len(magic) != 4 or magic[:2] != b"\x00\x00" or magic[2] not in IDX_TYPES:
+            raise ValueError(f"{path} is not an idx file")
+        shape = tuple(np.frombuffer(file.read(4 * magic[3]), dtype='>i4'))
+    return np.memmap(path, dtype=IDX_TYPES[magic[2]], mode="r", offset=4 + 4 * len(shape), shape=shape)
+
+
+@functools.lru_cache(maxsize=None)
+def _area_weights(n_in, n_out):
+    """(n_out, n_in) weights of the input pixels covered by each output pixel, each row sums to 1."""
+    edges = np.linspace(0, n_in, n_out + 1)
+    pixels = np.arange(n_in)
+    overlap = np.minimum(pixels[None, :] + 1, edges[1:, None]) - np.maximum(pixels[None, :], edges[:-1, None])
+    return np.clip(overlap, 0, None) / (n_in / n_out)
+
+
+def rescale(images, size):
+    """
+    Rescales a batch of images by area averaging: each new pixel is the mean of the pixels it covers,
+    weighted by the covered fraction, so the intensity range is kept.
+
+    Args:
+        images (numpy.ndarray): The images, (num_images, rows, cols).
+        size (int or tuple): The new (rows, cols), or the side of a square image.
+
+    Returns:
+        numpy.ndarray: The rescaled images, (num_images, *size), float64.
+    """
+    rows, cols = (size, size) if np.isscalar(size) else size
+    return np.einsum('ri,nij,cj->nrc', _area_weights(images.shape[1], rows), np.asarray(images, dtype=np.float64),
+                     _area_weights(images.shape[2], cols), optimize=True)
+
+
+def rate_code(images, cod_base, cod_max):
+    """
+    Codes a batch of images into the number of spikes of each input neuron, proportional to the pixel intensity
+    plus a baseline, as snn_simulator.load_input.
+
+    Args:
+        images (numpy.ndarray): The images, (num_images, ...) with pixels in 0..255.
+        cod_base (float): The number of spikes of a black pixel.
+        cod_max (float): The additional spikes of a white pixel.
+
+    Returns:
+        numpy.ndarray: The number of spikes, (num_images, num_input).
+    """
+    images = np.asarray(images)
+    return cod_base + cod_max * (images.reshape(len(images), -1) / 255.0)
+
+
+class MnistDataset:
+    """
+    The images and labels of a set of the MNIST dataset, memory mapped from their idx files.
+
+    Attributes:
+        images [numpy.memmap]: The images, (num_images, 28, 28) uint8.
+        labels [numpy.memmap]: The labels, (num_images,), None if the label file is missing.
+
+    Methods
+    -------
+    select(indices=None, classes=None):
+        The indices of the images, optionally restricted to some classes.
+    stratified(per_class, classes=None, seed=0):
+        A random subset with the same number of images of each class.
+    pixels(indices, size=0):
+        The flattened pixels of some images, rescaled to size x size.
+    rate_codes(indices, cod_base, cod_max, size=0):
+        The numbers of spikes of some images.
+    batches(indices, batch_size, cod_base, cod_max, size=0):
+        Yields the rate codes of the images by batch.
+    names(indices):
+        The inp_img names of some images.
+    """
+
+    def __init__(self, images_file, labels_file=None):
+        self.images = read_idx(images_file)
+        self.labels = read_idx(labels_file) if labels_file and os.path.isfile(labels_file) else None
+        if self.labels is not None and len(self.labels) != len(self.images):
+            raise ValueError(f"{labels_file} has {len(self.labels)} labels for {len(self.images)} images")
+
+    def __len__(self):
+        return len(self.images)
+
+    def select(self, indices=None, classes=None):
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices, dtype=np.int64)
+        if classes is not None:
+            indices = indices[np.isin(self.labels[indices], classes)]
+        return indices
+
+    def stratified(self, per_class, classes=None, seed=0):
+        rng = np.random.default_rng(seed)
+        labels = np.asarray(self.labels)
+        classes = np.unique(labels) if classes is None else classes
+        picks = [rng.choice(np.flatnonzero(labels == c), per_class, replace=False) for c in classes]
+        return np.sort(np.concatenate(picks))
+
+    def pixels(self, indices, size=0):
+        images = np.asarray(self.images[np.asarray(indices)])  # Only the selected images are read from the file
+        if size and size != images.shape[1]:
+            images = rescale(images, size)
+        return images.reshape(len(images), -1)
+
+    def rate_codes(self, indices, cod_base, cod_max, size=0):
+        return rate_code(self.pixels(indices, size), cod_base, cod_max)
+
+    def batches(self, indices, batch_size, cod_base, cod_max, size=0):
+        for start in range(0, len(indices), batch_size):
+            batch = np.asarray(indices[start:start + batch_size])
+            labels = None if self.labels is None else np.asarray(self.labels[batch])
+            yield batch, self.rate_codes(batch, cod_base, cod_max, size), labels
+
+    @staticmethod
+    def names(indices):
+        return [f"{PREFIX}{index}" for index in indices]
+
+
+@functools.lru_cache(maxsize=None)
+def load_dataset(directory, subset='train'):
+    """
+    Opens a set of the dataset, once per process (the memory maps are shared by the runs of a worker).
+
+    Args:
+        directory (str): The folder of the idx files.
+        subset (str): 'train' or 'test'.
+
+    Returns:
+        MnistDataset: The dataset.
+    """
+    images_file, labels_file = FILES[subset]
+    return MnistDataset(os.path.join(directory, images_file), os.path.join(directory, labels_file))
@@ -0,0 +1,167 @@
+"""
+This module samples the device parameters of the MTJs of all the synapse cells in bulk, as the `@(initial_step)` bloc
+of `mtj_model.va` does for each instance: the oxide thickness (toxreal), the free layer thickness (tslreal) and the
+TMR (TMRreal) are drawn from the per-device `mtj_seed` values of the netlist (SynapseArray.seeds), and the constants
+that only depend on them (Ro, Em, EE, IcP, IcAP, sun_coef) are computed once, as arrays with the shape of the seeds.
+The native backend builds its MTJs from these arrays, and they can be stored with a run as a compact `devices.npz`,
+so the switching behaviour of the synapses can be correlated with their sampled parameters.
+
+Note: the draws follow the distributions of the model (uniform or gauss variability of `RV`) with reproducible
+hashes of the seeds, they are those of the native backend, not the `$rdist_*` draws of a Spectre run.
+
+Functions:
+    seeded_uniform: Draw reproducible uniform numbers from per-device seeds.
+    seeded_normal: Draw reproducible normal numbers from per-device seeds.
+    sample_devices: Draws the device parameters and computes the derived constants of every MTJ.
+    save_devices: Writes the devices of a run in the compact devices.npz of its folder.
+    load_devices: Loads the devices.npz of a simulation folder.
+
+Example Usage:
+```python
+synapses = SynapseArray.dense(25, 1, 4)
+devices = sample_devices(synapses.seeds, dev=0.05)
+save_devices(abs_process_dir, devices, synapses)
+ic_p = load_devices(abs_process_dir)['IcP']  # (num_synapses, num_cells)
+```
+"""
+
+import os
+
+import numpy as np
+
+DEVICE_FILE = "devices.npz"
+
+# Electrical constants of mtj_model.va
+E_CHARGE = 1.6e-19    # elementary charge
+U_B = 9.27e-28        # Bohr magneton
+K_B = 1.38e-23        # Boltzmann constant
+EULER_C = 0.577       # Euler's constant
+
+# Default parameters of mtj_model.va (round shape, HITACHI prototypes)
+MTJ_PARAMETERS = {
+    'alpha': 0.027, 'gamma': 1.76e7, 'P': 0.52, 'Hk': 1433, 'Ms': 15800, 'PhiBas': 0.4, 'Vh': 0.5,
+    'tsl': 1.3e-9, 'r': 16e-9, 'tox': 8.5e-10, 'TMR': 0.7, 'tau0': 8.7e-10,
+    'brown_threshold_AP2P': 0.15, 'brown_threshold_P2AP': 0.1, 'RA': 5, 'STO_dev': 1,
+}
+
+# The per-device arrays of sample_devices: sampled parameters, then derived constants
+DEVICE_ARRAYS = ('toxreal', 'tslreal', 'TMRreal', 'Ro', 'Em', 'EE', 'IcP', 'IcAP', 'sun_coef')
+
+
+def seeded_uniform(seeds, draw):
+    """
+    Draw uniform numbers in [0, 1) from per-device seeds, with a splitmix64 hash of (seed, draw).
+    The same seed and draw index always give the same number, as the seeded `$rdist_*` functions of Verilog-A.
+
+    Args:
+        seeds (numpy.ndarray): Integer seeds, one per device.
+        draw (int): Index of the draw in the sequence of each device.
+
+    Returns:
+        numpy.ndarray: Uniform numbers with the shape of seeds.
+    """
+    x = np.asarray(seeds).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    x = x + np.uint64(((draw + 1) * 0xD1B54A32D192ED03) & 0xFFFFFFFFFFFFFFFF)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
+def seeded_normal(seeds, draw, mean, std):
+    """
+    Draw normal numbers from per-device seeds (Box-Muller on two seeded uniform draws).
+
+    Args:
+        seeds (numpy.ndarray): Integer seeds, one per device.
+        draw (int): Index of the draw in the sequence of each device.
+        mean (float or numpy.ndarray): Mean of the distribution.
+        std (float or numpy.ndarray): Standard deviation of the distribution.
+
+    Returns:
+        numpy.ndarray: Normal numbers with the shape of seeds.
+    """
+    u1 = 1.0 - seeded_uniform(seeds, 2 * draw)
+    u2 = seeded_uniform(seeds, 2 * draw + 1)
+    return mean + std * np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * u2)
+
+
+def sample_devices(seeds, dev=0.0, rv=2, temp=300, **model):
+    """
+    Draws the device parameters of every MTJ from its seed, and computes the constants derived from them,
+    as the `@(initial_step)` bloc of `mtj_model.va`.
+
+    Args:
+        seeds (numpy.ndarray): The mtj_seed of each cell, any shape, e.g. (num_synapses, num_cells).
+        dev (float or numpy.ndarray): The relative deviation of the variability, broadcast against seeds.
+        rv (int): The variability mode of the model (gl_RV): 0 none, 1 uniform, 2 gauss.
+        temp (float): The temperature (gl_T), in K.
+        **model: Overrides of MTJ_PARAMETERS.
+
+    Returns:
+        dict: One float64 array with the shape of seeds for each name of DEVICE_ARRAYS.
+    """
+    p = dict(MTJ_PARAMETERS)
+    p.update(model)
+    seeds = np.asarray(seeds)
+    dev = np.asarray(dev, dtype=float)
+
+    if rv == 1:      # uniform variability
+        draw = [seeded_uniform(seeds, i) for i in range(3)]
+        toxreal = p['tox'] - p['tox'] * dev + 2 * p['tox'] * dev * draw[0]
+        tslreal = p['tsl'] - p['tsl'] * dev + 2 * p['tsl'] * dev * draw[1]
+        TMRreal = p['TMR'] - p['TMR'] * dev + 2 * p['TMR'] * dev * draw[2]
+    elif rv == 2:    # gauss variability
+        toxreal = np.abs(seeded_normal(seeds, 0, p['tox'], p['tox'] * dev))
+        tslreal = np.abs(seeded_normal(seeds, 1, p['tsl'], p['tsl'] * dev))
+        TMRreal = np.abs(seeded_normal(seeds, 2, p['TMR'], p['TMR'] * dev))
+    else:            # no variability
+        toxreal = np.full(seeds.shape, p['tox'])
+        tslreal = np.full(seeds.shape, p['tsl'])
+        TMRreal = np.full(seeds.shape, p['TMR'])
+
+    surface = np.pi * p['r'] ** 2
+    fa = 3322.53 / p['RA']
+    Ro = (toxreal * 1.0e10 / (fa * np.sqrt(p['PhiBas']) * surface * 1.0e12)) \
+        * np.exp(1.025 * toxreal * 1.0e10 * np.sqrt(p['PhiBas']))
+    Em = p['Ms'] * tslreal * surface * p['Hk'] / 2
+    EE = Em / (K_B * temp * 40 * np.pi)
+    pola = np.sqrt(TMRreal * (TMRreal + 2)) / (2 * (TMRreal + 1))
+    IcP = p['alpha'] * p['gamma'] * E_CHARGE * p['Ms'] * tslreal * p['Hk'] / (40 * np.pi * (U_B * pola)) * surface
+    # Sun model: durationstatic = sun_coef / abs(Id - Ic)
+    sun_coef = (EULER_C + np.log(np.pi * np.pi * EE / 4)) * E_CHARGE * 1000 * p['Ms'] * surface \
+        * tslreal * (1 + p['P'] ** 2) / (4 * np.pi * 2 * U_B * p['P'] * 10000)
+    return {'toxreal': toxreal, 'tslreal': tslreal, 'TMRreal': TMRreal, 'Ro': Ro, 'Em': Em, 'EE': EE,
+            'IcP': IcP, 'IcAP': IcP.copy(), 'sun_coef': sun_coef}
+
+
+def save_devices(folder, devices, synapses=None, dtype=np.float32):
+    """
+    Writes the devices of a run in the devices.npz of its folder (compressed, in single precision by default).
+
+    Args:
+        folder (str): The simulation folder.
+        devices (dict): The arrays of sample_devices, (num_synapses, num_cells).
+        synapses (SynapseArray): The synapses of the run, their input_index, output_index, seeds and paps are stored.
+        dtype (numpy.dtype): The type of the stored parameters and constants.
+    """
+    arrays = {name: np.asarray(devices[name], dtype=dtype) for name in DEVICE_ARRAYS}
+    if synapses is not None:
+        arrays.update(input_index=synapses.input_index.astype(np.int32),
+                      output_index=synapses.output_index.astype(np.int32),
+                      seeds=np.asarray(synapses.seeds), paps=np.asarray(synapses.paps, dtype=np.int8))
+    np.savez_compressed(os.path.join(folder, DEVICE_FILE), **arrays)
+
+
+def load_devices(folder):
+    """
+    Loads the devices.npz of a simulation folder.
+
+    Args:
+        folder (str): The simulation folder.
+
+    Returns:
+        dict: The stored arrays, see save_devices.
+    """
+    with np.load(os.path.join(folder, DEVICE_FILE)) as data:
+        return {name: data[name] for name in data.files}
@@ -0,0 +1,847 @@
+"""
+This module is a native NumPy backend that simulates the SNN without Cadence Spectre. It ports the behaviour of
+the three Verilog-A models used by the netlist, and evaluates them on the same fixed time grid as the transient
+analysis of `oceanScript.ocn`:
+
+    - `in_neuron.va`: sawtooth spike train of the input neurons, set by `n_spikes`, `spike_duration` and `presenting_time`.
+    - `out_neuron.va`: leaky integrate-and-fire output neurons, with threshold, firing pulse and post-fire discharge.
+    - `mtj_model.va`: PMA MTJs with the Sun (above critical current) and Neel-Brown (below critical current) switching
+      models, process variability (RV), stochasticity (STO) and initial state (PAP).
+
+The network state is stored as a struct of arrays: every MTJ quantity is a `(num_designs, num_synapses, num_cells)`
+array, so each time step updates all the synapses and all their cells at once. Several designs of a sweep can be
+stacked along the leading design axis (`simulate_batch`), designs with fewer cells per synapse are padded and masked,
+so the Python overhead of the time loop is paid once for all of them.
+
+Two time advances are available: 'grid' takes every step of the fixed grid, 'event' jumps from spike edge to
+spike edge (the input voltages are piecewise linear, so the membrane is integrated analytically in between) and only
+takes grid steps where an above() crossing or a switching of `mtj_model.va` can happen, or an output neuron fires.
+The runtime of the event mode scales with the number of events rather than with the simulated time.
+
+The sampled waveforms are written to a `results.txt` that has the same layout as the `ocnPrint` of `oceanScript.ocn`,
+time | synapse1 | synapse2 | ... | membrane_out_neuron, so the plotting scripts can be used unchanged.
+
+Note: the random numbers of the Spectre `$rdist_*` functions can not be reproduced, the native backend draws from
+the same distributions (seeded by the same per-device `mtj_seed` values) but the results are statistically,
+not bitwise, equivalent to Spectre.
+
+Functions:
+    simulate: Run the transient simulation of a design and return the sampled waveforms.
+    simulate_batch: Run the transient simulation of several designs at once.
+    _run_events: Event-driven time advance of a network (time_mode 'event').
+    batch_key: Key of the designs that can be stacked in the same batch.
+    write_results: Write the sampled waveforms in the ocnPrint layout.
+    record_stop: Record the stop time and reason of a run in its parameters.
+    save_devices: Write the sampled devices of a design in its folder (mtj_sampler.DEVICE_FILE).
+    run_native: Entry point used by `snn_simulator.run_simulation`.
+    run_native_batch: Entry point used by `snn_simulator.run_batch`.
+
+Example Usage:
+```python
+times, weights, membrane = simulate(params, n_spik_vec, seeds, paps)
+write_results("results.txt", times, weights, membrane)
+```
+"""
+
+import os
+
+import numpy as np
+
+import connectivity
+import result_store
+import mtj_sampler
+import delay_table
+import output_profile
+from mtj_sampler import MTJ_PARAMETERS, seeded_uniform, seeded_normal
+
+# Global design variables, same values as the desVar of oceanScript.ocn
+OCEAN_DESVARS = {
+    'gl_STO': 1,
+    'gl_RV': 2,
+    'gl_T': 300,
+    'gl_Temp_var': 0,
+}
+
+TRAN_STEP = 100e-9    # ?step ?maxstep ?minstep of the tran analysis
+PRINT_STEP = output_profile.PRINT_STEP  # ?step of ocnPrint (full output profile)
+RESULTS_HEADER_LINES = 4  # lines skipped by the loaders of results.txt (skip_header=4)
+DELAY_TABLES = "../../snn_sim_folders/delay_tables"  # default cache of the switching delay tables
+
+EXP_LIMIT = 85.0      # `explimit of the limited exponential
+
+# Parameters of out_neuron.va
+LIF_PARAMETERS = {
+    'Rcharge': 100e6, 'Rdischarge': 200e6, 'Rpostdischarge': 10e3, 'Cmem': 300e-12, 'Roff': 1e300,
+}
+
+# Parameters of in_neuron.va
+SPIKE_AMPLITUDE = 150e-3
+SPIKE_MINIMUM = -90e-3
+
+
+def _limexp(x):
+    return np.exp(np.clip(x, -EXP_LIMIT, EXP_LIMIT))
+
+
+class InputNeurons:
+    """
+    Vectorized port of `in_neuron.va`: each input neuron emits a spike that starts at 150 mV and decreases
+    linearly to -90 mV during `spike_duration`, then stays at 0 V until the end of its window
+    `presenting_time / n_spikes`, after which a new spike starts.
+    When a sequence of images is presented (port of `in_neuron_seq.va`), the time is cut in segments of
+    `presenting_time`, the window of each segment is set by the number of spikes of its image, and the
+    spike trains restart at the beginning of each segment.
+
+    Attributes:
+        t_window [numpy.ndarray]: The spiking window of each input neuron, for each segment (..., num_segments, num_input).
+        presenting_time [float]: The duration of a segment.
+        t0 [numpy.ndarray]: The start time of the current spike of each input neuron.
+        segment [int]: The segment of the current spikes.
+
+    Methods
+    -------
+    voltages(t):
+        Returns the voltages of all the input neurons at time t (time steps must be visited in order).
+    voltages_at(t):
+        Returns the voltages and slopes of all the input neurons at any time t.
+    next_edge(t):
+        Returns the time of the next spike edge (or segment start) after t.
+    """
+
+    def __init__(self, n_spik_vec, spike_duration, presenting_time, sequence=False):
+        spike_duration = np.asarray(spike_duration, dtype=float)
+        self.spike_duration = spike_duration
+        self.slope = -(SPIKE_AMPLITUDE - SPIKE_MINIMUM) / spike_duration
+        n_spik_vec = np.asarray(n_spik_vec, dtype=float)
+        if not sequence:
+            n_spik_vec = n_spik_vec[..., None, :]  # A single segment
+        self.presenting_time = presenting_time
+        self.t_window = presenting_time / n_spik_vec
+        self.t0 = np.zeros_like(self.t_window[..., 0, :])
+        self.segment = 0
+
+    def _segment(self, t):
+        return min(int(np.floor(t / self.presenting_time)), self.t_window.shape[-2] - 1)
+
+    def voltages(self, t):
+        k = self._segment(t)
+        t_window = self.t_window[..., k, :]
+        t_ = t - self.t0
+        restart = (t_ > t_window) | (k != self.segment)
+        self.segment = k
+        self.t0 = np.where(restart, t, self.t0)
+        t_ = np.where(restart, 0.0, t_)
+        ramp = (t_ <= t_window) & (t_ <= self.spike_duration)
+        return np.where(ramp, self.slope * t_ + SPIKE_AMPLITUDE, 0.0)
+
+    def voltages_at(self, t):
+        """Voltages and their time derivatives at time t, for an exactly periodic spike train (event-driven mode)."""
+        k = self._segment(t)
+        t_window = self.t_window[..., k, :]
+        elapsed = t - k * self.presenting_time
+        phase = elapsed - np.floor(elapsed / t_window) * t_window
+        ramp = phase <= np.minimum(self.spike_duration, t_window)
+        return np.where(ramp, self.slope * phase + SPIKE_AMPLITUDE, 0.0), np.where(ramp, self.slope, 0.0)
+
+    def next_edge(self, t):
+        """The first spike edge (start or end of a ramp) of any input neuron, or segment start, after time t."""
+        k = self._segment(t)
+        t_window = self.t_window[..., k, :]
+        start = k * self.presenting_time
+        n = np.floor((t - start) / t_window)
+        ramp_end = start + n * t_window + np.minimum(self.spike_duration, t_window)
+        edge = np.where(ramp_end > t, ramp_end, start + (n + 1) * t_window).min()
+        if k < self.t_window.shape[-2] - 1:
+            edge = min(edge, (k + 1) * self.presenting_time)
+        return edge
+
+
+class OutputNeurons:
+    """
+    Vectorized port of `out_neuron.va`: the membrane capacitor is charged through Rcharge by the synapses while
+    the neuron is not firing. When the membrane reaches mem_vth, the neuron fires: it drives its terminal with the
+    potentiation/depression pulse, and discharges the capacitor through Rpostdischarge.
+
+    Attributes:
+        membrane [numpy.ndarray]: The membrane potential (capacitor voltage) of each output neuron.
+        state [numpy.ndarray]: 1 while the neuron fires, 0 otherwise.
+        tfire [numpy.ndarray]: The last time the neuron was not firing.
+        res_discharge [numpy.ndarray]: The current resistance of the discharge branch.
+
+    Methods
+    -------
+    fire_voltage(t):
+        Returns the voltage of the firing pulse t seconds after the firing started.
+    settle(t, g_sum, gv_sum, idle):
+        Sets the switch and discharge branches of the idle neurons and returns their output node voltages.
+    advance(t, g_sum, gv_sum, dt):
+        Updates the neurons at time t, given the total conductance and current of their synapses,
+        integrates the membrane capacitor over a time step and returns the voltages of the output nodes.
+    drift(v_start, v_end, duration, s):
+        Returns the membrane potential of idle neurons after an analytic advance of s seconds.
+    integrate(v_out, dt):
+        Integrates the membrane capacitor over a time step.
+    """
+
+    def __init__(self, shape, mem_vth, **lif):
+        p = dict(LIF_PARAMETERS)
+        p.update(lif)
+        self.p = p
+        self.mem_vth = np.asarray(mem_vth, dtype=float)
+        self.membrane = np.zeros(shape)
+        self.state = np.zeros(shape, dtype=bool)
+        self.tfire = np.zeros(shape)
+        self.res_discharge = np.full(shape, p['Roff'])
+        self.switch_on = np.ones(shape, dtype=bool)
+
+    @staticmethod
+    def fire_voltage(t):
+        return np.select(
+            [t <= 0.5e-6, t <= 6.5e-6, t <= 7e-6, t <= 7.2e-6, t <= 8.2e-6, t <= 8.4e-6],
+            [-100e-3 / 0.5e-6 * t + 150e-3, -100e-3, (100e-3 / 0.5e-6) * (t - 7e-6),
+             (100e-3 / 0.2e-6) * (t - 7e-6), 100e-3, (100e-3 / 0.2e-6) * (-t + 8.4e-6)],
+            0.0)
+
+    def settle(self, t, g_sum, gv_sum, idle=True):
+        """Sets the LIF switch and discharge of the idle neurons at time t and returns their output node voltages."""
+        p = self.p
+        self.tfire = np.where(idle, t, self.tfire)
+        # Not firing: the output node is set by the synapses, loaded by Rcharge when the LIF switch is on
+        v_open = gv_sum / np.maximum(g_sum, 1e-30)
+        discharge = idle & (v_open < self.membrane)
+        self.switch_on = idle & ~discharge
+        g_load = np.where(self.switch_on, 1.0 / p['Rcharge'], 0.0)
+        self.res_discharge = np.where(discharge, p['Rdischarge'], self.res_discharge)
+        return (gv_sum + g_load * self.membrane) / np.maximum(g_sum + g_load, 1e-30)
+
+    def advance(self, t, g_sum, gv_sum, dt):
+        p = self.p
+        idle = (self.membrane < self.mem_vth) & ~self.state
+        v_out = self.settle(t, g_sum, gv_sum, idle)
+        if not idle.all():
+            # Firing: the output node is driven by the firing pulse, then the neuron is reset
+            firing = ~idle
+            t_fire = t - self.tfire
+            ended = firing & (t_fire > 8.4e-6)
+            v_out = np.where(firing, self.fire_voltage(t_fire), v_out)
+            self.res_discharge = np.where(firing, np.where(ended, p['Roff'], p['Rpostdischarge']),
+                                          self.res_discharge)
+            self.switch_on = self.switch_on | ended
+            self.state = firing & ~ended
+        self.integrate(v_out, dt)
+        return v_out
+
+    def drift(self, v_start, v_end, duration, s):
+        """
+        Membrane potential after a time s of an idle segment where the output nodes go linearly from v_start
+        to v_end in duration, with the switch and discharge of the start (analytic solution of the RC circuit).
+        """
+        p = self.p
+        g_charge = np.where(self.switch_on, 1.0 / p['Rcharge'], 0.0)
+        g_total = g_charge + 1.0 / self.res_discharge
+        k = g_total / p['Cmem']
+        b = g_charge * (v_end - v_start) / duration / g_total
+        a = g_charge * v_start / g_total - b / k
+        return a + b * s + (self.membrane - a) * np.exp(-k * s)
+
+    def integrate(self, v_out, dt):
+        p = self.p
+        g_charge = np.where(self.switch_on, 1.0 / p['Rcharge'], 0.0)
+        g_total = g_charge + 1.0 / self.res_discharge
+        v_inf = g_charge * v_out / g_total
+        self.membrane = v_inf + (self.membrane - v_inf) * np.exp(-g_total * dt / p['Cmem'])
+
+
+class MTJArray:
+    """
+    Vectorized port of `mtj_model.va` for all the cells of all the synapses, each attribute is an array
+    of shape (num_designs, num_synapses, num_cells), where the cells beyond the num_cells of a design are masked.
+    The device parameters (toxreal, tslreal, TMRreal) are drawn once from
+    the per-device seeds, and the derived constants (Ro, Em, IcP, IcAP, ...) are computed once,
+    as in the `@(initial_step)` bloc of the model (see mtj_sampler.sample_devices).
+
+    Attributes:
+        ix [numpy.ndarray]: The state of each MTJ (0: parallel, 1: anti-parallel).
+        mask [numpy.ndarray]: True for the cells that exist in their design.
+        toxreal, tslreal, TMRreal [numpy.ndarray]: The sampled device parameters.
+        devices [dict]: The sampled device parameters and the derived constants (see mtj_sampler.DEVICE_ARRAYS).
+        delay_table [DelayTable]: When set, the Neel-Brown delays are interpolated in it (see delay_table).
+
+    Methods
+    -------
+    conductances(vb):
+        Returns the conductance of each MTJ under the bias vb = V(T1,T2).
+    update(t, vb, rngs):
+        Evaluates the above() events and the switching of each MTJ at time t.
+    """
+
+    def __init__(self, seeds, paps, dev=0.0, rv=OCEAN_DESVARS['gl_RV'], sto=OCEAN_DESVARS['gl_STO'],
+                 temp=OCEAN_DESVARS['gl_T'], mask=None, delay_table=None, **model):
+        p = dict(MTJ_PARAMETERS)
+        p.update(model)
+        self.p = p
+        self.sto = sto
+        self.temp = temp
+        self.delay_table = delay_table
+        seeds = np.asarray(seeds)
+        self.mask = np.ones(seeds.shape, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+        # Sampled device parameters and derived constants, computed once for all the cells
+        self.devices = mtj_sampler.sample_devices(seeds, dev, rv, temp, **model)
+        for name, values in self.devices.items():
+            setattr(self, name, values)
+
+        self.ix = np.array(np.broadcast_to(paps, seeds.shape), dtype=np.int8)
+        # Times of the last above() events (1e9 when disarmed)
+        self.P_APt = np.full(seeds.shape, 1e9)
+        self.AP_Pt = np.full(seeds.shape, 1e9)
+        self.NP_APt = np.full(seeds.shape, 1e9)
+        self.NAP_Pt = np.full(seeds.shape, 1e9)
+        # Previous values of the above() expressions, only valid for the synapses that were hot at the previous step
+        self._prev = [np.full(seeds.shape, -1.0) for _ in range(4)]
+        self._was_hot = np.zeros(seeds.shape[:-1], dtype=bool)
+
+        # Below this bias no above() event can fire and no cell of the synapse can switch (R >= Ro)
+        ic_ro = np.where(self.mask, np.minimum(self.IcP, self.IcAP) * self.Ro, np.inf)
+        self.quiet_bias = np.minimum(min(p['brown_threshold_P2AP'], p['brown_threshold_AP2P']), ic_ro.min(axis=-1))
+        self._r = np.where(self.ix == 0, self.Ro, self.Ro * (1 + self.TMRreal))
+
+    @staticmethod
+    def _flat(x):
+        """View of a per-cell array as (num_designs * num_synapses, num_cells)."""
+        return x.reshape(-1, x.shape[-1])
+
+    def conductances(self, vb):
+        """Conductance of each MTJ under the bias vb = V(T1,T2), according to its current state."""
+        self._rap = self.Ro * (1 + self.TMRreal / (1 + vb * vb / (self.p['Vh'] ** 2)))
+        self._r = np.where(self.ix == 0, self.Ro, self._rap)
+        return self.mask / self._r
+
+    def _duration(self, mean, rngs, designs):
+        """
+        Switching duration drawn according to the STO mode, each design from its own generator (rngs), so that
+        its draws do not depend on the other designs of its batch.
+        """
+        if self.sto not in (1, 2):
+            return mean
+        duration = np.empty(np.shape(mean))
+        for d in np.unique(designs):
+            cells = designs == d
+            if self.sto == 1:
+                duration[cells] = rngs[d].exponential(mean[cells])
+            else:
+                duration[cells] = np.abs(rngs[d].normal(mean[cells], mean[cells] * self.p['STO_dev']))
+        return duration
+
+    def _models(self, vb, ix, ro, rap, ic_p, ic_ap):
+        """Cells under the Sun and Neel-Brown switching conditions of the model, for their state ix."""
+        p = self.p
+        vc = -vb
+        parallel = ix == 0
+        ic_r_p = ic_p * ro
+        ic_r_ap = ic_ap * rap
+        # Sun model (current higher than critical current)
+        sun_p = parallel & (vb >= ic_r_p)
+        sun_ap = ~parallel & (vc >= ic_r_ap)
+        # Neel-Brown model (current lower than critical current)
+        brown_p = parallel & ~sun_p & (vb > p['brown_threshold_P2AP']) & (vb < 0.8 * ic_r_p)
+        brown_ap = ~parallel & ~sun_ap & (vc > p['brown_threshold_AP2P']) & (vc < 0.8 * ic_r_ap)
+        return sun_p, sun_ap, brown_p, brown_ap
+
+    def _tabulated(self, ratio, tsl, ee):
+        """Neel-Brown delays read from the delay table, the closed form is kept for the points outside of it."""
+        tau, inside = self.delay_table(ratio, tsl, self.temp)
+        outside = ~inside
+        if outside.any():
+            tau[outside] = self.p['tau0'] * _limexp(ee[outside] * (1 - ratio[outside]))
+        return tau
+
+    def inert(self, vb):
+        """
+        Synapses where nothing can happen under the bias vb (num_designs, num_synapses, 1): they are either
+        below their quiet_bias, or none of their cells is under a switching condition for its current state.
+        """
+        inert = np.abs(vb[..., 0]) < self.quiet_bias
+        h = np.flatnonzero(~inert)
+        if len(h):
+            flat = self._flat
+            models = self._models(vb.reshape(-1, 1)[h], *(flat(x)[h] for x in (self.ix, self.Ro, self._rap,
+                                                                               self.IcP, self.IcAP)))
+            active = np.logical_or.reduce(models) & flat(self.mask)[h]
+            inert.ravel()[h] = ~active.any(axis=1)
+        return inert
+
+    def signature(self, vb, synapses):
+        """
+        Signs of the above() expressions and of the switching bounds of the cells of the given flat synapses,
+        with the conductances of the last call. Along a linear bias, a synapse whose signature does not change
+        has no above() event and stays out of the switching conditions.
+        """
+        p = self.p
+        flat = self._flat
+        vb = vb.reshape(-1, 1)[synapses]
+        vc = -vb
+        ro, rap, ic_p, ic_ap = (flat(x)[synapses] for x in (self.Ro, self._rap, self.IcP, self.IcAP))
+        idd = vb / flat(self._r)[synapses]
+        exprs = (idd - ic_p, -idd - ic_ap, np.broadcast_to(vb - p['brown_threshold_P2AP'], idd.shape),
+                 np.broadcast_to(vc - p['brown_threshold_AP2P'], idd.shape),
+                 vb - ic_p * ro, vb - 0.8 * ic_p * ro, vc - ic_ap * rap, vc - 0.8 * ic_ap * rap)
+        return np.stack(exprs) >= 0
+
+    def update(self, t, vb, rngs):
+        """
+        Evaluate the above() events and the switching of the MTJs, with the conductances of the last call,
+        and the random generator of each design.
+        """
+        p = self.p
+        # Only the synapses biased above their quiet_bias can have events or switch, the others are skipped
+        hot = np.abs(vb[..., 0]) >= self.quiet_bias
+        if not hot.any():
+            self._was_hot[...] = False
+            return
+        h = np.flatnonzero(hot)
+        flat = self._flat
+        vb = vb.reshape(-1, 1)[h]
+        vc = -vb
+        ix, mask, ro, rap, ic_p, ic_ap = (flat(x)[h] for x in (self.ix, self.mask, self.Ro, self._rap, self.IcP, self.IcAP))
+        idd = vb / flat(self._r)[h]
+        P_APt, AP_Pt, NP_APt, NAP_Pt = (flat(x)[h] for x in (self.P_APt, self.AP_Pt, self.NP_APt, self.NAP_Pt))
+
+        # above() events, evaluated in the order of the model. All the expressions are negative
+        # for the synapses that were not hot at the previous step.
+        exprs = [idd - ic_p, -idd - ic_ap, np.broadcast_to(vb - p['brown_threshold_P2AP'], idd.shape),
+                 np.broadcast_to(vc - p['brown_threshold_AP2P'], idd.shape)]
+        was_hot = self._was_hot.ravel()[h][:, None]
+        cross = []
+        for prev, expr in zip(self._prev, exprs):
+            cross.append(~(was_hot & (flat(prev)[h] >= 0)) & (expr >= 0))
+            flat(prev)[h] = expr
+        self._was_hot = hot
+        P_APt[cross[0]] = t
+        NP_APt[cross[0]] = 1e9
+        AP_Pt[cross[1]] = t
+        NAP_Pt[cross[1]] = 1e9
+        NP_APt[cross[2]] = t
+        AP_Pt[cross[2]] = 1e9
+        NAP_Pt[cross[2]] = 1e9
+        NAP_Pt[cross[3]] = t
+        P_APt[cross[3]] = 1e9
+        NP_APt[cross[3]] = 1e9
+        for x, value in zip((self.P_APt, self.AP_Pt, self.NP_APt, self.NAP_Pt), (P_APt, AP_Pt, NP_APt, NAP_Pt)):
+            flat(x)[h] = value
+
+        sun_p, sun_ap, brown_p, brown_ap = self._models(vb, ix, ro, rap, ic_p, ic_ap)
+        active = (sun_p | sun_ap | brown_p | brown_ap) & mask
+        if not active.any():
+            return
+
+        a = np.nonzero(active)
+        i_a, ic_p, ic_ap = idd[a], ic_p[a], ic_ap[a]
+        sp, sap, bp = sun_p[a], sun_ap[a], brown_p[a]
+        with np.errstate(divide='ignore', over='ignore'):
+            sun_coef, ee = flat(self.sun_coef)[h][a], flat(self.EE)[h][a]
+            ratio = np.abs(i_a / np.where(bp, ic_p, ic_ap))
+            if self.delay_table is None:
+                brown = p['tau0'] * _limexp(ee * (1 - ratio))
+            else:
+                brown = self._tabulated(ratio, flat(self.tslreal)[h][a], ee)
+            mean = np.where(sp, sun_coef / np.abs(i_a - ic_p),
+                   np.where(sap, sun_coef / np.abs(-i_a - ic_ap), brown))
+        start = np.where(sp, P_APt[a], np.where(sap, AP_Pt[a], np.where(bp, NP_APt[a], NAP_Pt[a])))
+        switch = self._duration(mean, rngs, h[a[0]] // self.ix.shape[1]) <= (t - start)
+        if switch.any():
+            ix[a[0][switch], a[1][switch]] ^= 1
+            flat(self.ix)[h] = ix
+
+
+class _Network:
+    """The input neurons, output neurons and MTJs of a batch, wired by the synapses (pre -> post)."""
+
+    def __init__(self, inputs, outputs, mtjs, pre, post, rngs):
+        self.inputs, self.outputs, self.mtjs = inputs, outputs, mtjs
+        self.pre, self.post, self.rngs = pre, post, rngs
+        num_designs, num_synapses = mtjs.ix.shape[:2]
+        self.shape = (num_designs, outputs.membrane.shape[1])
+        # Flat index of the output neuron of each synapse in each design, to sum the synapses currents
+        self.post_flat = (np.arange(num_designs)[:, None] * self.shape[1] + post[None, :]).ravel()
+        # The bias of the previous step sets the bias dependence of the TMR
+        self.vb = np.zeros((num_designs, num_synapses, 1))
+
+    def sums(self, v_in):
+        """Total conductance and current (times the conductance) of the synapses of each output neuron."""
+        g_syn = self.mtjs.conductances(self.vb).sum(axis=2)
+        size = self.shape[0] * self.shape[1]
+        g_sum = np.bincount(self.post_flat, weights=g_syn.ravel(), minlength=size)
+        gv_sum = np.bincount(self.post_flat, weights=(g_syn * v_in).ravel(), minlength=size)
+        return g_sum.reshape(self.shape), gv_sum.reshape(self.shape)
+
+    def step(self, t, v_input, dt):
+        """Time step at t, from the voltages of the input neurons."""
+        v_in = v_input[:, self.pre]
+        v_out = self.outputs.advance(t, *self.sums(v_in), dt)
+        self.vb = (v_out[:, self.post] - v_in)[:, :, None]
+        self.mtjs.update(t, self.vb, self.rngs)
+
+    def weights(self):
+        return (self.mtjs.ix * self.mtjs.mask).sum(axis=2)
+
+
+class _Convergence:
+    """
+    Early stop of a batch: the states of the MTJs are compared after each time step (they can not switch during the
+    jumps of the event mode), and the batch has converged once none of them switched for a quiet window of simulated
+    time since the last switching. It is checked at the samples, so a run stops on a sample. The quiet window only
+    starts at the first switching (the output neurons must fire before the MTJs learn), and a window of 0 never stops.
+    """
+
+    def __init__(self, mtjs, window):
+        self.mtjs, self.window = mtjs, window
+        self.ix = mtjs.ix.copy()
+        self.last_switch = np.inf
+
+    def observe(self, t):
+        if self.window > 0 and not np.array_equal(self.mtjs.ix, self.ix):
+            self.ix = self.mtjs.ix.copy()
+            self.last_switch = t
+
+    def converged(self, t):
+        return self.window > 0 and t - self.last_switch >= self.window  # False until the first switching
+
+
+def _first_crossing(vb_start, vb_end, bias):
+    """Smallest fraction s in [0, 1] where vb_start + s * (vb_end - vb_start) reaches +/-bias (inf if none)."""
+    delta = vb_end - vb_start
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = (np.sign(delta) * bias - vb_start) / delta
+    s = np.where((delta != 0) & (s >= 0) & (s <= 1), s, np.inf)
+    return s.min()
+
+
+def _run_events(network, sim_time, step, times, weights, membrane, bisections=40, convergence=None):
+    """
+    Event-driven time advance. Between two spike edges the input voltages are linear, so the output nodes are
+    linear too (the conductances are frozen) and the membrane capacitor is integrated analytically. A segment is
+    cut short at the first time a synapse becomes biased above its quiet_bias (an above() event or a switching can
+    happen), a synapse already above it changes its signature, or an output neuron reaches its threshold or toggles
+    its discharge branch. From there, fine time steps are taken as on the grid until the network is quiet again.
+    Returns the number of samples taken, fewer than len(times) when the convergence stopped the run early.
+    """
+    inputs, outputs, mtjs = network.inputs, network.outputs, network.mtjs
+    pre, post = network.pre, network.post
+    eps = step * 1e-6
+    sample = 0
+    t = 0.0
+    while t <= sim_time + eps:
+        v_input, slope = inputs.voltages_at(t)
+        v_in = v_input[:, pre]
+        g_sum, gv_sum = network.sums(v_in)
+        fine = outputs.state.any() or (outputs.membrane >= outputs.mem_vth).any()
+        if not fine:
+            v_out = outputs.settle(t, g_sum, gv_sum)
+            vb_start = v_out[:, post] - v_in
+            hot = np.abs(vb_start) >= mtjs.quiet_bias
+            # Synapses biased above their quiet_bias, but with no cell that can switch, can be jumped over
+            # as long as their signature does not change (once their above() expressions are known)
+            fine = hot.any() and not (mtjs.inert(vb_start[:, :, None]) & mtjs._was_hot)[hot].all()
+        if not fine:
+            duration = max(min(inputs.next_edge(t), sim_time) - t, step)
+            v_in_end = (v_input + slope * duration)[:, pre]
+            gv_end = network.sums(v_in_end)[1]
+            g_load = np.where(outputs.switch_on, 1.0 / outputs.p['Rcharge'], 0.0)
+            v_out_end = (gv_end + g_load * outputs.membrane) / np.maximum(g_sum + g_load, 1e-30)
+            vb_end = v_out_end[:, post] - v_in_end
+            s_end = duration * min(1.0, _first_crossing(vb_start, vb_end, np.where(hot, np.inf, mtjs.quiet_bias)))
+            # Output neurons: threshold crossing or discharge toggle, located by bisection
+            v_open_start = gv_sum / np.maximum(g_sum, 1e-30)
+            v_open_slope = (gv_end - gv_sum) / np.maximum(g_sum, 1e-30) / duration
+            discharging = ~outputs.switch_on
+
+            h = np.flatnonzero(hot)
+            signature = mtjs.signature(vb_start, h) if len(h) else None
+
+            def event(s):
+                vm = outputs.drift(v_out, v_out_end, duration, s)
+                if ((vm >= outputs.mem_vth) | ((v_open_start + v_open_slope * s < vm) != discharging)).any():
+                    return True
+                return signature is not None and \
+                    (mtjs.signature(vb_start + (vb_end - vb_start) * s / duration, h) != signature).any()
+
+            if event(s_end):
+                low, high = 0.0, s_end
+                for _ in range(bisections):
+                    mid = 0.5 * (low + high)
+                    low, high = (low, mid) if event(mid) else (mid, high)
+                s_end = low
+            if s_end >= step:
+                while sample < len(times) and times[sample] < t + s_end - eps:
+                    membrane[:, sample] = outputs.drift(v_out, v_out_end, duration, times[sample] - t)
+                    weights[:, sample] = network.weights()
+                    sample += 1
+                    if convergence is not None and convergence.converged(times[sample - 1]):
+                        return sample
+                outputs.membrane = outputs.drift(v_out, v_out_end, duration, s_end)
+                network.vb = (vb_start + (vb_end - vb_start) * s_end / duration)[:, :, None]
+                # The above() expressions of the hot synapses kept their sign, their previous values stay valid
+                mtjs._was_hot = hot
+                t += s_end
+                continue
+        # Fine time step, as on the grid
+        sampled = sample < len(times) and times[sample] < t + step - eps
+        if sampled:
+            membrane[:, sample] = outputs.membrane
+        network.step(t, v_input, step)
+        if convergence is not None:
+            convergence.observe(t)
+        if sampled:
+            weights[:, sample] = network.weights()
+            sample += 1
+            if convergence is not None and convergence.converged(times[sample - 1]):
+                return sample
+        t += step
+    return sample
+
+
+def batch_key(params):
+    """
+    Key of a design, the designs with the same key share the time grid (and time_mode, switching_delay, early_stop,
+    the sampling step of their output profile), the number of presented images and the network shape and connectivity,
+    and can be stacked in the same batch.
+    The number of cells per synapse may differ (it is padded).
+
+    Args:
+        params (dict): The simulation parameters of the design.
+
+    Returns:
+        tuple: The key of the design.
+    """
+    desvars = tuple(params.get(k, v) for k, v in OCEAN_DESVARS.items())
+    num_images = len(str(params.get('inp_img', '')).split(',')) * params.get('epochs', 1)  # Segments of the inputs
+    synapses = tuple(params.get(k) for k in connectivity.CONNECTIVITY_PARAMS)  # The designs share pre and post
+    return (params['num_input'], params['num_output'], params['sim_time'], params.get('time_mode', 'grid'),
+            params.get('switching_delay', 'closed_form'), params.get('early_stop', 0), output_profile.sample_step(params),
+            num_images) + synapses + desvars
+
+
+def simulate(params, n_spik_vec, seeds, paps, pre=None, post=None, step=TRAN_STEP, print_step=PRINT_STEP,
+             time_mode='grid'):
+    """
+    Run the transient simulation of the SNN on a fixed time grid.
+
+    Args:
+        params (dict): The simulation parameters (sim_time, spike_duration, mem_vth, num_input, num_output, dev,
+            and optionally the desVar overrides gl_STO, gl_RV, gl_T, gl_Temp_var, the noise seed native_seed,
+            switching_delay 'table' to interpolate the Neel-Brown delays in the delay_table cache delay_tables,
+            and early_stop, the quiet window in s after which a run whose MTJs stopped switching is ended).
+            time_mode is read from params by run_native and run_native_batch.
+        n_spik_vec (numpy.ndarray): The number of spikes of each input neuron, (num_input,), or (num_images, num_input)
+            for a sequence of images, each presented for sim_time / num_images.
+        seeds (numpy.ndarray): The mtj_seed of each cell, shape (num_synapses, num_cells).
+        paps (numpy.ndarray): The initial state of each cell, shape (num_synapses, num_cells).
+        pre (numpy.ndarray): The 0-based input neuron of each synapse, defaults to the dense netlist order.
+        post (numpy.ndarray): The 0-based output neuron of each synapse, defaults to the dense netlist order.
+        step (float): The time step of the simulation.
+        print_step (float): The time step of the sampled waveforms.
+        time_mode (str): 'grid' to advance on the fixed time grid, 'event' to advance from spike edge to spike edge
+            and only take time steps where an MTJ can switch or an output neuron fires.
+
+    Returns:
+        tuple: times (num_samples,), weights (num_samples, num_synapses) as the sum of ix over the cells of
+        each synapse, and membrane (num_samples, num_output). After an early stop, the samples end at the stop time.
+    """
+    times, weights, membrane = simulate_batch([params], [n_spik_vec], [seeds], [paps], pre, post, step, print_step,
+                                              time_mode)
+    return times, weights[0], membrane[0]
+
+
+def simulate_batch(params_list, n_spik_vecs, seeds_list, paps_list, pre=None, post=None,
+                   step=TRAN_STEP, print_step=PRINT_STEP, time_mode='grid'):
+    """
+    Run the transient simulation of several designs at once, stacked along a leading design axis.
+    The designs must have the same batch_key, their seeds and initial states are padded to the largest
+    number of cells, and the padded cells are masked (no conductance, no switching, not in the weights).
+
+    Args:
+        params_list (list of dict): The simulation parameters of each design (see simulate).
+        n_spik_vecs (list of numpy.ndarray): The number of spikes of each input neuron, for each design (see simulate).
+        seeds_list (list of numpy.ndarray): The mtj_seed of each cell, (num_synapses, num_cells) for each design.
+        paps_list (list of numpy.ndarray): The initial state of each cell, (num_synapses, num_cells) for each design.
+        pre (numpy.ndarray): The 0-based input neuron of each synapse, defaults to the dense netlist order.
+        post (numpy.ndarray): The 0-based output neuron of each synapse, defaults to the dense netlist order.
+        step (float): The time step of the simulation.
+        print_step (float): The time step of the sampled waveforms.
+        time_mode (str): 'grid' or 'event' (see simulate). In event mode the designs share the time steps,
+            so a batch takes a fine step as soon as one of its designs needs it.
+            With early_stop, a batch stops once the MTJs of all its designs were quiet for the window.
+
+    Returns:
+        tuple: times (num_samples,), weights (num_designs, num_samples, num_synapses)
+        and membrane (num_designs, num_samples, num_output).
+    """
+    if len({batch_key(params) for params in params_list}) != 1:
+        raise ValueError("The designs of a batch must have the same num_input, num_output, sim_time, time_mode "
+                         "and desVars")
+    params = params_list[0]
+    desvars = {k: params.get(k, v) for k, v in OCEAN_DESVARS.items()}
+    if desvars['gl_Temp_var'] != 0:
+        raise NotImplementedError("Temperature variation (Temp_var=1) is not ported to the native backend")
+
+    num_designs = len(params_list)
+    num_input, num_output = params['num_input'], params['num_output']
+    num_synapses = len(seeds_list[0])
+    max_cells = max(np.shape(seeds)[1] for seeds in seeds_list)
+    if pre is None:
+        pre = np.arange(num_synapses) % num_input
+        post = np.arange(num_synapses) // num_input
+
+    # Stack the designs, padding the cells
+    seeds = np.zeros((num_designs, num_synapses, max_cells), dtype=np.int64)
+    paps = np.zeros((num_designs, num_synapses, max_cells), dtype=np.int8)
+    mask = np.zeros((num_designs, num_synapses, max_cells), dtype=bool)
+    for d, (design_seeds, design_paps) in enumerate(zip(seeds_list, paps_list)):
+        num_cells = np.shape(design_seeds)[1]
+        seeds[d, :, :num_cells] = design_seeds
+        paps[d, :, :num_cells] = design_paps
+        mask[d, :, :num_cells] = True
+    column = np.ones((num_designs, 1))
+
+    n_spik = np.asarray(n_spik_vecs, dtype=float)
+    num_images = n_spik.shape[1] if n_spik.ndim == 3 else 1  # A sequence of images, (num_designs, num_images, num_input)
+    inputs = InputNeurons(n_spik, column * [[p['spike_duration']] for p in params_list], params['sim_time'] / num_images,
+                          sequence=n_spik.ndim == 3)
+    outputs = OutputNeurons((num_designs, num_output), column * [[p['mem_vth']] for p in params_list])
+    table = None
+    if params.get('switching_delay', 'closed_form') == 'table':
+        table = delay_table.load_table(params.get('delay_tables', DELAY_TABLES), temp_range=(desvars['gl_T'],) * 2)
+    mtjs = MTJArray(seeds, paps, np.reshape([p['dev'] for p in params_list], (num_designs, 1, 1)),
+                    rv=desvars['gl_RV'], sto=desvars['gl_STO'], temp=desvars['gl_T'], mask=mask, delay_table=table)
+    # One generator per design, seeded as when the design is simulated alone: in grid mode, a design switches
+    # the same way in any batch
+    rngs = [np.random.default_rng(p.get('native_seed', 10)) for p in params_list]
+
+    num_steps = int(round(params['sim_time'] / step))
+    every = max(int(round(print_step / step)), 1)
+    sample_steps = np.arange(0, num_steps + 1, every)
+    times = sample_steps * step
+    weights = np.empty((num_designs, len(sample_steps), num_synapses))
+    membrane = np.empty((num_designs, len(sample_steps), num_output))
+
+    network = _Network(inputs, outputs, mtjs, pre, post, rngs)
+    convergence = _Convergence(mtjs, params.get('early_stop', 0))
+    if time_mode == 'grid':
+        sample = 0
+        for n in range(num_steps + 1):
+            t = n * step
+            sampled = sample < len(sample_steps) and n == sample_steps[sample]
+            if sampled:
+                membrane[:, sample] = outputs.membrane
+            network.step(t, inputs.voltages(t), step)
+            convergence.observe(t)
+            if sampled:
+                weights[:, sample] = network.weights()
+                sample += 1
+                if convergence.converged(times[sample - 1]):
+                    break
+    elif time_mode == 'event':
+        sample = _run_events(network, params['sim_time'], step, times, weights, membrane, convergence=convergence)
+    else:
+        raise ValueError(f"Unknown time_mode '{time_mode}', expected 'grid' or 'event'")
+
+    # After an early stop, the remaining samples were not simulated
+    return times[:sample], weights[:, :sample], membrane[:, :sample]
+
+
+def write_results(results_file, times, weights, membrane, column_names=None, params=None):
+    """
+    Write the sampled waveforms in the layout of the ocnPrint of oceanScript.ocn:
+    time | synapse1 | synapse2 | ... | membrane_out_neuron, after RESULTS_HEADER_LINES header lines.
+    Unless params['result_store'] is False, the binary store of result_store is written next to it.
+
+    Args:
+        results_file (str): The path of the results file.
+        times (numpy.ndarray): The sampled times.
+        weights (numpy.ndarray): The sampled weights, shape (num_samples, num_synapses).
+        membrane (numpy.ndarray): The sampled membrane potentials, the first output neuron is written.
+        column_names (list of str): The names of the weight columns.
+        params (dict): The simulation parameters, recorded in the header of the binary store.
+    """
+    if column_names is None:
+        column_names = [f"synapse{i + 1}" for i in range(weights.shape[1])]
+    names = ["time"] + list(column_names) + [result_store.MEMBRANE_COLUMN]
+    data = np.column_stack([times, weights, np.asarray(membrane).reshape(len(times), -1)[:, 0]])
+    header = "\n".join(["", " ".join(names), "", ""])
+    np.savetxt(results_file, data, fmt="%.5g", delimiter=" ", header=header, comments="")
+    if params is not None and params.get('result_store', True):
+        result_store.save_results(os.path.dirname(os.path.abspath(results_file)), data, names, params)
+
+
+def record_stop(params, times):
+    """
+    Record when and why a run ended in its parameters, stop_time and stop_reason ('converged' after an early stop,
+    'sim_time' otherwise), so they are written in the header of its binary store and in its metrics.
+
+    Args:
+        params (dict): The simulation parameters.
+        times (numpy.ndarray): The sampled times of the run.
+    """
+    params['stop_time'] = float(times[-1])
+    params['stop_reason'] = 'converged' if times[-1] < params['sim_time'] - TRAN_STEP else 'sim_time'
+
+
+def save_devices(params, synapses):
+    """
+    Write the device parameters and derived constants of the MTJs of a design in the devices.npz of its folder,
+    as sampled by the native backend (see mtj_sampler).
+
+    Args:
+        params (dict): The simulation parameters, including results_file, dev and the desVar overrides.
+        synapses (SynapseArray): The synapses of the design, in netlist order.
+    """
+    desvars = {k: params.get(k, v) for k, v in OCEAN_DESVARS.items()}
+    devices = mtj_sampler.sample_devices(synapses.seeds, params['dev'], desvars['gl_RV'], desvars['gl_T'])
+    mtj_sampler.save_devices(os.path.dirname(os.path.abspath(params['results_file'])), devices, synapses)
+
+
+def _write_design(params, times, weights, membrane, synapses):
+    """Writes the results of a design, with the rows and the synapses of its output profile (see output_profile)."""
+    record_stop(params, times)
+    rows = output_profile.printed_rows(params, times)
+    columns = output_profile.printed_columns(params, synapses.input_index, synapses.output_index)
+    column_names = [f"synapse{synapses.input_index[c]}_{synapses.output_index[c]}" for c in columns]
+    write_results(params['results_file'], times[rows], weights[rows][:, columns], membrane[rows], column_names, params)
+    if params.get('save_devices'):
+        save_devices(params, synapses)
+
+
+def run_native(params, n_spik_vec, synapses):
+    """
+    Simulate a design with the native backend and write its results file.
+
+    Args:
+        params (dict): The simulation parameters, including results_file and save_states.
+        n_spik_vec (numpy.ndarray): The number of spikes of each input neuron.
+        synapses (SynapseArray): The synapses of the network, in netlist order.
+    """
+    times, weights, membrane = simulate(params, n_spik_vec, synapses.seeds, synapses.paps,
+                                        synapses.input_index - 1, synapses.output_index - 1,
+                                        print_step=output_profile.sample_step(params),
+                                        time_mode=params.get('time_mode', 'grid'))
+    _write_design(params, times, weights, membrane, synapses)
+
+
+def run_native_batch(params_list, n_spik_vecs, synapses_list):
+    """
+    Simulate several designs in one batch with the native backend, and write the results file of each design.
+
+    Args:
+        params_list (list of dict): The simulation parameters of each design, including results_file.
+        n_spik_vecs (list of numpy.ndarray): The number of spikes of each input neuron, for each design.
+        synapses_list (list of SynapseArray): The synapses of each design, in netlist order.
+    """
+    synapses = synapses_list[0]
+    times, weights, membrane = simulate_batch(params_list, n_spik_vecs, [design.seeds for design in synapses_list],
+                                              [design.paps for design in synapses_list],
+                                              synapses.input_index - 1, synapses.output_index - 1,
+                                              print_step=output_profile.sample_step(params_list[0]),
+                                              time_mode=params_list[0].get('time_mode', 'grid'))
+    for d, params in enumerate(params_list):
+        _write_design(params, times, weights[d], membrane[d], synapses_list[d])
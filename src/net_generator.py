@@ -1,12 +1,46 @@
 '''
 Spice simulation with Spectre simulator requires a netlist file that includes the description of all the components of the circuit, and describes how these componenents are wired. The framework allows flexible geneartion of the netlist according to the desired network to be simulated. Only some network parameters should be given, for the corresponding netlist to be automatically generated.  The follwoing module `net_generator.py` which contains diffrent classes is responsible of generating the netlist.
-Circuit componenents are mangaged by the follwing classes : `Synapse`, `Synapse_subskt`, `Input_neuron`, `Output_neuron`, each contains a `generate_netlist_bloc` method that sets a string template bloc specific to that componenent and which should be added to the netlist file.
+Circuit componenents are mangaged by the follwing classes : `Synapse`, `Synapse_subskt`, `Input_neuron`, `Output_neuron`, `Early_stop`, each contains a `generate_netlist_bloc` method that sets a string template bloc specific to that componenent and which should be added to the netlist file.
+`SynapseArray` describes all the synapses of the network at once as a struct of arrays (neuron indexes, seeds and initial states drawn in bulk), it is the one used by `NetworkGenerator`.
 The class `Netlist` concatinates the instances of the componenets in a list, and generates a string bloc of a single componenent ready to be inserted in the final netlist.
 The class `NetworkGenerator` is the main class that assembles all the components by iterating the appending method of `Netlist` class. and trigers the netlist generation method of `Netlist`.
 Finally `Separotor` is a class to add a separation between a group of similar componenets for a bette rformatting.
+The blocs are streamed: the components are generated lazily and each bloc is written to a buffered file as soon as it is generated,
+so the memory used stays flat and the generation time grows linearly with the size of the network.
 '''
 
+import os
 import random
+
+import numpy as np
+
+# Header of the netlist (includes, subcircuits, global parameters), to which the components blocs are appended
+NETLIST_HEADER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "netlist_ocn", "netlist")
+WRITE_BUFFER = 1 << 20  # Size of the write buffer of the netlist file, in bytes
+FIRE_STEP = 100e-9      # Time step of the firing pulses of the output neurons with a step policy (the fixed grid)
+SEGMENT_EDGE = 1e-9     # Rise time of the steps of the pwl numbers of spikes of a sequence, in s
+ACTIVITY_NODE = "mtj_activity"  # Global node of the states of the MTJs, watched by the early stop (see early_stop.va)
+_header_cache = {}
+
+
+def read_header(path=NETLIST_HEADER):
+    """
+    Reads the header of the netlist, the content is cached and only read again if the file is modified.
+
+    Args:
+        path (str): The path to the header of the netlist.
+
+    Returns:
+        str: The content of the header.
+    """
+    mtime = os.stat(path).st_mtime_ns
+    cached = _header_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r") as file0:
+            cached = (mtime, file0.read())
+        _header_cache[path] = cached
+    return cached[1]
+
 class Synapse:
     """
     A class to specify a netlist bloc that describes an MTJ-based synapse of the SNN, 
@@ -44,6 +78,76 @@ class Synapse:
             self.input_index, self.output_index, self.input_index, self.output_index
         ) + paps_str + " \\\n\t\t" + seeds_str + "\n"
 
+class SynapseArray:
+    """
+    A struct of arrays that describes all the MTJ-based synapses of the SNN, instead of one Synapse instance
+    per synapse. The seeds and initial states of all the cells are drawn in bulk from a seeded NumPy generator,
+    and the netlist blocs are formatted from the arrays, a chunk of synapses at a time.
+    In legacy mode, they are drawn with `random.randint` in the same order as the Synapse instances after
+    `random.seed(seed)`, which reproduces the netlists generated before SynapseArray.
+
+    Attributes:
+        input_index [numpy.ndarray]: The index of the input neuron of each synapse, shape (n_synapses,).
+        output_index [numpy.ndarray]: The index of the output neuron of each synapse, shape (n_synapses,).
+        seeds [numpy.ndarray]: The seed of each MTJ of each synapse, shape (n_synapses, num_cells).
+        paps [numpy.ndarray]: The initial state of each MTJ of each synapse, shape (n_synapses, num_cells).
+
+    Methods
+    -------
+    dense(num_input, num_output, num_cells, seed=10, legacy=False):
+        Creates the synapses of a fully connected network, in netlist order.
+    connected(input_index, output_index, num_cells, seed=10, legacy=False):
+        Creates the synapses of a sparse network, given the neurons of each synapse (see the connectivity module).
+    chunks(size=4096):
+        Yields consecutive slices of the array, to stream their blocs into the netlist.
+    generate_netlist_bloc():
+        Generates the string bloc of all the synapses of the array in the final netlist file.
+    """
+
+    def __init__(self, input_index, output_index, seeds, paps):
+        self.input_index = np.asarray(input_index)
+        self.output_index = np.asarray(output_index)
+        self.seeds = np.asarray(seeds)
+        self.paps = np.asarray(paps)
+
+    @classmethod
+    def dense(cls, num_input, num_output, num_cells, seed=10, legacy=False):
+        i = np.arange(num_input * num_output)
+        return cls.connected(i % num_input + 1, i // num_input + 1, num_cells, seed, legacy)
+
+    @classmethod
+    def connected(cls, input_index, output_index, num_cells, seed=10, legacy=False):
+        num_synapses = len(input_index)
+        if legacy:
+            random.seed(seed)
+            draws = np.array([[random.randint(0, 9999) for _ in range(num_cells)] +
+                              [random.randint(0, 1) for _ in range(num_cells)] for _ in range(num_synapses)],
+                             dtype=np.int64).reshape(num_synapses, 2 * num_cells)
+            seeds, paps = draws[:, :num_cells], draws[:, num_cells:]
+        else:
+            rng = np.random.default_rng(seed)
+            seeds = rng.integers(0, 10000, size=(num_synapses, num_cells))
+            paps = rng.integers(0, 2, size=(num_synapses, num_cells))
+        return cls(input_index, output_index, seeds, paps)
+
+    def __len__(self):
+        return len(self.input_index)
+
+    def __getitem__(self, index):
+        return SynapseArray(self.input_index[index], self.output_index[index], self.seeds[index], self.paps[index])
+
+    def chunks(self, size=4096):
+        for start in range(0, len(self), size):
+            yield self[start:start + size]
+
+    def generate_netlist_bloc(self):
+        num_cells = self.seeds.shape[1]
+        template = ("synapse{0}_{1} (input{0} output{1}) compound_synapse "
+                    + " ".join("PAP{}={{{}}}".format(i + 1, i + 2) for i in range(num_cells)) + " \\\n\t\t"
+                    + " ".join("seed{}={{{}}}".format(i + 1, num_cells + i + 2) for i in range(num_cells)) + "\n")
+        rows = np.column_stack([self.input_index, self.output_index, self.paps, self.seeds]).tolist()
+        return "".join(template.format(*row) for row in rows)
+
 class Synapse_subskt:
     """
     A class to specify a netlist bloc of the synapse subcircuit named compound_synapse, 
@@ -52,9 +156,11 @@ class Synapse_subskt:
     generate_netlist_bloc is a method that returns the subcircuit template to be included in the netlist.
     It takes an initial template, adds parameters to it : either to set stochasticity, variability,
     temperature and its variation or not, and sets as parameters the initial state of the MTJ, and the seed. 
+    The activity terminal of the cells is grounded, or tied to the global ACTIVITY_NODE for the early stop.
 
     Attributes:
         num_cells [int]: The number of MTJ cells in each synapse.
+        activity [str]: The node of the activity terminal of the cells, '0' without early stop.
 
 
     Methods
@@ -63,20 +169,23 @@ class Synapse_subskt:
         Generates a string bloc specefic to the compound_synapse subcircuit in the final netlist file. 
     """
 
-    def __init__(self, num_cells):
+    def __init__(self, num_cells, activity="0"):
         self.num_cells = num_cells
+        self.activity = activity
 
     def generate_netlist_bloc(self):
         template = ("subckt compound_synapse in_ter out_ter \n"
                     "parameters {} \n")
+        if self.activity != "0":
+            template = "global 0 {}\n".format(self.activity) + template
 
         parameters = " ".join(["seed{}".format(i+1) for i in range(self.num_cells)] +
                               ["PAP{}".format(i+1) for i in range(self.num_cells)])
         
         cells = ""
         for i in range(self.num_cells): #Here we define synapse terminals in a way to let MTJs T2 terminal node same as synapse's input node
-            cell_line = ("\tcell{} (out_ter in_ter) cellPMAMTJ   param1=gl_STO   param2=gl_RV   param3=gl_T   param4=gl_Temp_var param7=RV_dev   "
-                         "param5=PAP{}   param6=seed{}\n".format(i+1, i+1, i+1))
+            cell_line = ("\tcell{} (out_ter in_ter {}) cellPMAMTJ   param1=gl_STO   param2=gl_RV   param3=gl_T   param4=gl_Temp_var param7=RV_dev   "
+                         "param5=PAP{}   param6=seed{}\n".format(i+1, self.activity, i+1, i+1))
             cells += cell_line
         
         netlist_bloc = template.format( parameters) + cells + "ends compound_synapse\n"
@@ -90,9 +199,14 @@ class Input_neuron:
     and the duration of presenting an input example to the netowrk). That sting bloc will then be included
     in the final netlist.
  
+    When a sequence of images is presented, the neuron is an Input_neuron_seq (in_neuron_seq.va) that gets
+    one number of spikes per image, each image being presented for sim_time divided by the number of images.
+    Its numbers of spikes are the voltage of a pwl vsource, which steps at the beginning of each image.
+
     Attributes:
         input_index [int]: The index of this input neuron.
-        n_spikes [int]: The number of spikes this neuron will generate.
+        n_spikes [int or list of int]: The number of spikes this neuron will generate (for each presented image).
+        presenting_time [float]: The time each image of a sequence is presented.
 
     Methods
     -------
@@ -100,12 +214,27 @@ class Input_neuron:
         Generates a string bloc specefic to that input neuron in the final netlist file. 
     """
 
-    def __init__(self, input_index, n_spikes):
+    def __init__(self, input_index, n_spikes, presenting_time=None):
         self.input_index = input_index
         self.n_spikes = n_spikes
+        self.presenting_time = presenting_time
+
+    def wave(self):
+        """The (time, value) points of the pwl vsource of a sequence, a step where the number of spikes changes."""
+        points = [(0, self.n_spikes[0])]
+        for k in range(1, len(self.n_spikes)):
+            if self.n_spikes[k] != self.n_spikes[k - 1]:
+                start = k * self.presenting_time
+                points += [(start - SEGMENT_EDGE, self.n_spikes[k - 1]), (start, self.n_spikes[k])]
+        return " ".join(f"{t:.12g} {n}" for t, n in points)
 
     def generate_netlist_bloc(self):
-        
+        if np.ndim(self.n_spikes):
+            template = ("input_spikes{} (n_spikes{} 0) vsource type=pwl wave=[{}]\n"
+                        "input_neuron{} (input{} 0 n_spikes{}) Input_neuron_seq r=0 spike_duration=spike_duration "
+                        "presenting_time=sim_time/{} \n")
+            return template.format(self.input_index, self.input_index, self.wave(),
+                                   self.input_index, self.input_index, self.input_index, len(self.n_spikes))
         template = ( "input_neuron{} (input{} 0) Input_neuron r=0 n_spikes={} spike_duration=spike_duration presenting_time=sim_time \n") 
         return template.format(self.input_index, self.input_index, self.n_spikes)
 
@@ -118,7 +247,8 @@ class Output_neuron:
 
     Attributes:
         output_index [int]: The index of this output neuron.
-
+        fire_step [float]: The time step of its firing pulses with the spike step policy (see step_policy),
+            None for the fixed time step.
 
     Methods
     -------
@@ -126,13 +256,29 @@ class Output_neuron:
         Generates a string bloc specefic to that output neuron in the final netlist file. 
     """
 
-    def __init__(self, output_index):
+    def __init__(self, output_index, fire_step=None):
         self.output_index = output_index 
+        self.fire_step = fire_step
 
     def generate_netlist_bloc(self):
-        template = ( "output_neuron{} (output{}) LIF_neuron mem_vth=mem_vth\n" )
-        
-        return template.format(self.output_index, self.output_index)
+        template = ( "output_neuron{} (output{}) LIF_neuron mem_vth=mem_vth{}\n" )
+        fire_step = f" fire_step={self.fire_step:g}" if self.fire_step else ""
+        return template.format(self.output_index, self.output_index, fire_step)
+
+class Early_stop:
+    """
+    A class to specify the netlist bloc of the early stop monitor (early_stop.va), which loads the global
+    ACTIVITY_NODE of the states of the MTJs and ends the transient once they did not switch for a quiet window.
+    The window is the early_stop desVar of the OCEAN script.
+
+    Methods
+    -------
+    generate_netlist_bloc():
+        Generates the monitor instance as a string.
+    """
+
+    def generate_netlist_bloc(self):
+        return "early_stop_monitor ({}) Early_stop window=early_stop\n".format(ACTIVITY_NODE)
 
 class Separator:
     """
@@ -147,42 +293,71 @@ class Separator:
     def generate_netlist_bloc(self):
         return "\n//===================================================\n"     
 
+class Include:
+    """
+    A class to include another netlist file, e.g. the time-step policy written per run next to the netlist.
+    A relative path is resolved from the directory of the netlist.
+
+    Attributes:
+        file_name [str]: The path of the included file.
+
+    Methods
+    -------
+    generate_netlist_bloc():
+        Generates the include statement as a string.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def generate_netlist_bloc(self):
+        return f'include "{self.file_name}"\n'
+
 class Netlist:
     """
     A class which assemles the instances of all the components, it then generates the netlist file
     add_component is a method that appends the instances of the componenets in one list called components.
+    add_components appends a group of components, which can be a generator that is only consumed when the file is written.
     generate_netlist_file is a method that generates the diffrent parts of the netlist by using the generate_netlist_bloc()
-    which is commun to all the components classes. 
+    which is commun to all the components classes, and streams them into a buffered file after the cached header.
     
     Attributes:
         file_path [str]: The path to the file where the netlist will be written.
-        components [list]: The list of components instances (synapses, neurons, etc.).
+        header_path [str]: The path to the header of the netlist.
+        components [list]: The list of groups of components instances (synapses, neurons, etc.).
 
     Methods
     -------
     add_component(component):
         appends the instance of each omponenent to the components list.
+    add_components(components):
+        appends a group of components (list or generator) to the components list.
+    generate_netlist_blocs():
+        Yields the string bloc of each component, in order.
     generate_netlist_file():
         Writes the netlist to a file.
     """
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, header_path=NETLIST_HEADER):
         self.file_path = file_path
-        self.components = [] # The netlist will be built inside this list
+        self.header_path = header_path
+        self.components = [] # The netlist will be built from the groups of components of this list
 
     def add_component(self, component):
-        self.components.append(component)                       
+        self.components.append((component,))
 
-    def generate_netlist_file(self):
-        content = ""
-        with open("netlist_ocn/netlist", "r") as file0:
-            content += file0.read()
+    def add_components(self, components):
+        self.components.append(components)
 
-        for component in self.components:
-            content += component.generate_netlist_bloc()        # use the class instances of componenets stroed in components to generate template and add it to content
+    def generate_netlist_blocs(self):
+        for group in self.components:
+            for component in group:
+                yield component.generate_netlist_bloc()     # use the class instances of componenets to generate their template
 
-        with open(self.file_path, "w") as file1:
-            file1.write(content)
+    def generate_netlist_file(self):
+        with open(self.file_path, "w", buffering=WRITE_BUFFER) as file1:
+            file1.write(read_header(self.header_path))
+            file1.writelines(self.generate_netlist_blocs())
 
 
 class NetworkGenerator:
@@ -197,49 +372,78 @@ class NetworkGenerator:
         num_output [int]: The number of output neurons in the network.
         num_cells [int]: The number of MTJ cells in each synapse.
         netlist [Netlist]: The netlist object that will be written to a file.
-        n_spik_vec [list of int]: A list containing the number of spikes for each input neuron.
+        n_spik_vec [list of int]: A list containing the number of spikes for each input neuron,
+            or an array (num_images, num_input) when a sequence of images is presented.
+        seed [int]: The seed of the draws of the MTJs seeds and initial states.
+        legacy [bool]: Draw them with the `random` module as the original Synapse instances (see SynapseArray).
+        connectivity [tuple]: The 1-based input and output neuron of each synapse (see the connectivity module),
+            None for a fully connected network.
+        step_policy [str]: The netlist file of the time-step policy, included at the end of the netlist
+            (see the step_policy module), None for the fixed time step.
+        sim_time [float]: The simulated time, which sets the steps of the pwl numbers of spikes of a sequence.
+        early_stop [bool]: Whether the MTJs drive the ACTIVITY_NODE watched by an Early_stop monitor.
 
     Methods
     -------
+    generate_synapses():
+        Creates the SynapseArray of the network in netlist order (their seeds and initial states are drawn here),
+        it is also used by the native backend which does not need the netlist file.
     generate_netlist_file():
         similar to the generate_netlist_file of the Netlist class, but instead of generating a single component, 
         it operates globally, ie: it generates the whole netlist by iterating through the method of Netlist class.
     """
 
-    def __init__(self, file_path, num_input, num_output, num_cells, n_spik_vec):
+    def __init__(self, file_path, num_input, num_output, num_cells, n_spik_vec, seed=10, legacy=False, connectivity=None,
+                 step_policy=None, sim_time=None, early_stop=False):
         self.file_path = file_path
         self.num_input = num_input
         self.num_output = num_output
         self.num_cells = num_cells
         self.netlist = Netlist(file_path)
         self.n_spik_vec = n_spik_vec # a list of a flattned array, containing n_spikes for each input neuron
+        self.seed = seed
+        self.legacy = legacy
+        self.connectivity = connectivity
+        self.step_policy = step_policy
+        self.sim_time = sim_time
+        self.early_stop = early_stop
+
+    def generate_synapses(self):
+        if self.connectivity is None:
+            return SynapseArray.dense(self.num_input, self.num_output, self.num_cells, self.seed, self.legacy)
+        return SynapseArray.connected(*self.connectivity, self.num_cells, self.seed, self.legacy)
 
     def generate_netlist_file(self):
-        self.netlist.add_component(Synapse_subskt(self.num_cells))
+        self.netlist.add_component(Synapse_subskt(self.num_cells, ACTIVITY_NODE if self.early_stop else "0"))
         self.netlist.add_component(Separator())
 
-        num_synapses = self.num_input * self.num_output
-        
-        # add the synapses 
-        for i in range(1, num_synapses + 1):
-            input_index = (i - 1) % self.num_input + 1
-            output_index = (i - 1) // self.num_input + 1
-            synapse = Synapse(input_index, output_index, self.num_cells)
-            self.netlist.add_component(synapse)
+        # add the synapses, their blocs are formatted and written by chunks
+        self.netlist.add_components(self.generate_synapses().chunks())
 
         self.netlist.add_component(Separator())
 
         # add input neurons
-        for i in range(1, self.num_input + 1):
-            input_neuron = Input_neuron(i, self.n_spik_vec[i-1])
-            self.netlist.add_component(input_neuron)
+        if np.ndim(self.n_spik_vec) == 2:  # A sequence of images, (num_images, num_input)
+            presenting_time = self.sim_time / len(self.n_spik_vec)
+            self.netlist.add_components(Input_neuron(i, list(self.n_spik_vec[:, i-1]), presenting_time)
+                                        for i in range(1, self.num_input + 1))
+        else:
+            self.netlist.add_components(Input_neuron(i, self.n_spik_vec[i-1]) for i in range(1, self.num_input + 1))
 
         self.netlist.add_component(Separator())
 
         # add output neurons 
-        for i in range(1, self.num_output + 1):
-            output_neuron = Output_neuron(i)
-            self.netlist.add_component(output_neuron)
+        fire_step = FIRE_STEP if self.step_policy else None  # The firing pulses are not part of the step policy
+        self.netlist.add_components(Output_neuron(i, fire_step) for i in range(1, self.num_output + 1))
+
+        # the monitor of the states of the MTJs, which ends the run once they are quiet (see early_stop)
+        if self.early_stop:
+            self.netlist.add_component(Early_stop())
+
+        # include the time-step policy, written per run next to the netlist (see step_policy)
+        if self.step_policy:
+            self.netlist.add_component(Separator())
+            self.netlist.add_component(Include(self.step_policy))
 
         self.netlist.generate_netlist_file()
 
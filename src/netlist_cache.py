@@ -0,0 +1,151 @@
+"""
+This module provides a content-addressed cache of the generated netlists, shared by all the simulations of a sweep.
+The netlist only depends on its structural inputs (input image coding, network size and connectivity, number of cells,
+seeds, header, the include of a step policy, the monitor of the early stop, and sim_time for a sequence of images,
+whose pwl numbers of spikes step at the beginning of each image), while the other swept parameters (dev, the window of
+the early stop, ...) only reach Spectre through the desVars of the OCEAN script.
+Each netlist is generated once, in a cache entry named by the hash of these inputs, and is hard-linked into the
+`netlist_ocn` folder of every simulation that uses it (or copied, when a hard link is not possible).
+The least recently used entries are evicted when the size of the cache exceeds its cap; the simulation folders keep
+their hard links, so evicting an entry never removes the netlist of a simulation.
+
+Functions:
+    netlist_key: Computes the hash of the structural inputs of a netlist.
+    NetlistCache: The cache directory, with fetch, link and evict methods.
+
+Example Usage:
+```python
+cache = NetlistCache("../../snn_sim_folders/netlist_cache", max_bytes=1 << 30)
+key = netlist_key(params, n_spik_vec, read_header())
+cache.link(key, f"{abs_process_dir}/netlist_ocn", generate)  # generate(directory) writes the netlist_ocn folder
+```
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import connectivity
+
+STRUCTURAL_PARAMS = ('inp_img', 'epochs', 'num_input', 'num_output', 'num_cells', 'cod_base', 'cod_max', 'netlist_seed',
+                     'legacy_rng', 'step_policy')
+
+
+def netlist_key(params, n_spik_vec, header):
+    """
+    Computes the key of a netlist, the hash of the inputs that set its content.
+
+    Args:
+        params (dict): The simulation parameters, only the STRUCTURAL_PARAMS and the connectivity are used.
+        n_spik_vec (numpy.ndarray): The number of spikes of each input neuron (the coded input image).
+        header (str): The header of the netlist.
+
+    Returns:
+        str: The hexadecimal sha256 of the inputs.
+    """
+    digest = hashlib.sha256()
+    structure = {k: params.get(k) for k in STRUCTURAL_PARAMS}
+    structure['early_stop'] = params.get('early_stop', 0) > 0  # The monitor, its window is a desVar
+    digest.update(json.dumps(structure, sort_keys=True, default=str).encode())
+    digest.update(np.ascontiguousarray(n_spik_vec, dtype=np.float64).tobytes())
+    for index in connectivity.edges(params):  # The synapses of the design (a connectivity matrix file may change)
+        digest.update(np.ascontiguousarray(index, dtype=np.int64).tobytes())
+    if np.ndim(n_spik_vec) == 2:  # A sequence of images, the steps of its pwl sources are at absolute times
+        digest.update(repr(float(params['sim_time'])).encode())
+    digest.update(header.encode())
+    return digest.hexdigest()
+
+
+class NetlistCache:
+    """
+    A directory of netlist folders named by their key, shared by the simulations of a sweep (and by the processes of a Pool).
+    A new entry is generated in a temporary folder and renamed at once, so concurrent processes never see a partial netlist.
+
+    Attributes:
+        cache_dir [str]: The path of the cache directory.
+        max_bytes [int]: The size cap of the cache, the least recently used entries are evicted above it.
+
+    Methods
+    -------
+    fetch(key, generate):
+        Returns the folder of the entry, generating it with generate(directory) if it is not cached.
+    link(key, dest_dir, generate):
+        Links the files of the entry into dest_dir, and evicts the old entries.
+    evict(keep=()):
+        Removes the least recently used entries until the cache fits in max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=1 << 30):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def fetch(self, key, generate):
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry):
+            os.utime(entry)  # Mark as recently used
+            return entry
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=self.cache_dir)
+        try:
+            generate(tmp_dir)
+            os.rename(tmp_dir, entry)
+        except OSError:
+            # Another process renamed the same entry first, keep its netlist
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(entry):
+                raise
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return entry
+
+    def link(self, key, dest_dir, generate):
+        os.makedirs(dest_dir, exist_ok=True)
+        for _ in range(3):  # The entry can be evicted by another process between fetch and link
+            entry = self.fetch(key, generate)
+            try:
+                for name in os.listdir(entry):
+                    _link_file(os.path.join(entry, name), os.path.join(dest_dir, name))
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            raise FileNotFoundError(f"The netlist cache entry {key} was evicted while linking it")
+        self.evict(keep=(key,))
+        return dest_dir
+
+    def evict(self, keep=()):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, name, entry))
+            except FileNotFoundError:
+                continue  # Evicted by another process
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, name, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name in keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def _link_file(src, dest):
+    """Hard links src to dest, falls back to a copy when the file system does not allow it (e.g. across devices)."""
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(src, dest)
@@ -0,0 +1,158 @@
+"""
+This module sets what a run writes in its results, chosen per sweep by params['output_profile']:
+    'full': every synapse, every PRINT_STEP (1 ms), Spectre keeps every time point (the original output).
+    'decimated': every synapse, every params['print_step'].
+    'final': every synapse, the initial and final states only (e.g. for the distance to the image of the
+        variability study, which only uses the last row). With early_stop, the OCEAN script prints every PRINT_STEP
+        and the rows are trimmed after the run (see early_stop.trim_final), as the stop time is not known in advance.
+    'subset': the synapses of params['output_synapses'] only, every params['print_step'].
+The `save(...)` statement and the transient strobe of the OCEAN script, the signals and the step of its `ocnPrint`,
+and the rows and columns written by the native backend are generated to match, so the volume of the psf folder and
+of the results and the time to load them shrink with the profile. The results keep their layout
+(time | synapses | membrane), so the loaders and the plotting scripts are unchanged.
+
+Functions:
+    print_step: The time step of the printed rows.
+    strobe_period: The strobe period of the transient analysis.
+    sample_step: The sampling step of the native backend.
+    printed_columns: The printed synapses among some synapses.
+    printed_synapses: The synapses written in the results.
+    save_signals: The MTJ states saved by Spectre.
+    printed_rows: The rows of the sampled waveforms written by the native backend.
+
+Example Usage:
+```python
+params['output_profile'] = 'subset'
+params['output_synapses'] = [(1, 1), (13, 1)]  # (input, output) neurons, 1-based
+input_index, output_index = printed_synapses(params)
+```
+"""
+
+import numpy as np
+
+import connectivity
+
+PROFILES = ('full', 'decimated', 'final', 'subset')
+PRINT_STEP = 1e-3  # ?step of the ocnPrint of the full profile
+
+
+def _profile(params):
+    profile = params.get('output_profile', 'full')
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown output_profile '{profile}', expected one of {', '.join(PROFILES)}")
+    return profile
+
+
+def print_step(params):
+    """
+    The time step of the printed rows: PRINT_STEP for 'full', sim_time for 'final' (the rows at 0 and sim_time,
+    or PRINT_STEP with early_stop, so the last state of a stopped run is printed), params['print_step'] otherwise.
+
+    Args:
+        params (dict): The simulation parameters.
+
+    Returns:
+        float: The time step, in s.
+    """
+    profile = _profile(params)
+    if profile == 'full':
+        return PRINT_STEP
+    if profile == 'final':
+        return PRINT_STEP if params.get('early_stop', 0) > 0 else params['sim_time']
+    return params.get('print_step', PRINT_STEP)
+
+
+def strobe_period(params):
+    """
+    The strobe period of the transient analysis, so that Spectre only writes the printed time points in the psf
+    folder ('' for 'full': every time point is kept).
+
+    Args:
+        params (dict): The simulation parameters.
+
+    Returns:
+        float or str: The strobe period, in s.
+    """
+    return "" if _profile(params) == 'full' else print_step(params)
+
+
+def sample_step(params):
+    """
+    The sampling step of the native backend: the print step, except for 'final' which is sampled every
+    PRINT_STEP, so that an early stop (early_stop) is still detected.
+
+    Args:
+        params (dict): The simulation parameters.
+
+    Returns:
+        float: The time step, in s.
+    """
+    return PRINT_STEP if _profile(params) == 'final' else print_step(params)
+
+
+def printed_columns(params, input_index, output_index):
+    """
+    The printed synapses among some synapses: all of them, or for 'subset' those of params['output_synapses'].
+
+    Args:
+        params (dict): The simulation parameters.
+        input_index (numpy.ndarray): The 1-based input neuron of each synapse.
+        output_index (numpy.ndarray): The 1-based output neuron of each synapse.
+
+    Returns:
+        numpy.ndarray: The indices of the printed synapses, in the order of the synapses.
+    """
+    if _profile(params) != 'subset':
+        return np.arange(len(input_index))
+    selected = {(int(i), int(o)) for i, o in params.get('output_synapses') or []}
+    keep = np.flatnonzero([(i, o) in selected for i, o in zip(input_index, output_index)])
+    if len(keep) != len(selected):
+        raise ValueError(f"output_synapses has {len(selected) - len(keep)} synapses that are not in the connectivity")
+    return keep
+
+
+def printed_synapses(params):
+    """
+    The synapses written in the results, in netlist order (see printed_columns).
+
+    Args:
+        params (dict): The simulation parameters.
+
+    Returns:
+        tuple: The 1-based input and output neuron of each printed synapse.
+    """
+    input_index, output_index = connectivity.edges(params)
+    keep = printed_columns(params, input_index, output_index)
+    return input_index[keep], output_index[keep]
+
+
+def save_signals(params):
+    """
+    The MTJ states saved by Spectre, the arguments of save('v ...) in the OCEAN script.
+
+    Args:
+        params (dict): The simulation parameters.
+
+    Returns:
+        str: The quoted signal patterns.
+    """
+    if _profile(params) != 'subset':
+        return '"synapse*.cell*.I:ix"'
+    return " ".join(f'"synapse{i}_{o}.cell*.I:ix"' for i, o in zip(*printed_synapses(params)))
+
+
+def printed_rows(params, times):
+    """
+    The rows of the sampled waveforms written by the native backend: every row, or for 'final'
+    the first and the last (the last row is the stop time of a run stopped early).
+
+    Args:
+        params (dict): The simulation parameters.
+        times (numpy.ndarray): The sampled times.
+
+    Returns:
+        numpy.ndarray: The indices of the rows.
+    """
+    if _profile(params) == 'final':
+        return np.unique([0, len(times) - 1])
+    return np.arange(len(times))
@@ -6,21 +6,30 @@ distances across multiple letters.
 Functions:
     eucl_dist: Calculate and plot Euclidean distances for a specific letter.
     avg_eucl_dist: Calculate and plot average Euclidean distances across multiple letters.
-    calculate_dist: Helper function to calculate Euclidean distances for a given letter.
+    find_runs: Helper function to find the trained folders of a letter, from the run catalog or by globbing.
+    calculate_dist: Helper function to calculate Euclidean distances for a given letter (see analysis_engine).
     plot_distances: Helper function to plot the Euclidean distances.
 
 Example Usage:
 ```python
 eucl_dist(trained_letters_dict, 'I')
 avg_eucl_dist(trained_letters_dict)
+avg_eucl_dist(catalog_letters_dict)  # runs selected in the run catalog by their parameters
 ```
+From the command line, the curated folders of trained_letters_dict are used unless --catalog is given:
+    python plot_eucl_dist.py [--catalog [CATALOG]]
 """
 
 import numpy as np
 import os
+import argparse
 import glob
-import pickle
 import matplotlib.pyplot as plt
+import run_catalog
+import analysis_engine
+import native_sim
+import result_store
+import snn_simulator
 
 '''
 Input images are stored in binary formats (individually: .npy arrays, 
@@ -60,6 +69,20 @@ trained_letters_dict = {
     'X': "../../snn_sim_folders/dat_1225_*_pross_*_letX*",
 }
 
+# Only with --catalog: the runs registered by snn_simulator are selected by their parameters in the run catalog.
+# The selection pins every parameter of snn_simulator.variables and the desVar overrides to their default, except the
+# swept axes and the settings that do not change the results, so runs of other sweeps (another sim_time, coding,
+# output_profile, netlist_seed, ...) registered in the same catalog are not mixed in, including under a new parameter.
+RUN_CATALOG = "../../snn_sim_folders/catalog.sqlite"
+SWEPT_PARAMS = ('inp_img', 'dev', 'num_cells')
+RUN_SETTINGS = ('session_points', 'netlist_cache', 'netlist_cache_size', 'result_store', 'run_catalog', 'sweep_manifest',
+                'max_retries', 'job_timeout', 'core_budget', 'spectre_threads', 'cluster_address', 'scratch_dir',
+                'scratch_keep', 'metrics_file', 'delay_tables', 'save_devices')
+CATALOG_PARAMS = {name: value for name, value in result_store.json_params({**native_sim.OCEAN_DESVARS,
+                                                                           **snn_simulator.variables}).items()
+                  if name not in SWEPT_PARAMS + RUN_SETTINGS}  # The catalog stores the scalar parameters (see json_params)
+catalog_letters_dict = {letter: dict(CATALOG_PARAMS, inp_img=letter) for letter in trained_letters_dict}
+
 VR_std = [i / 100 for i in range(0, 25, 5)]
 mtjs = [2, 4, 6, 8]
 
@@ -71,16 +94,10 @@ def eucl_dist(trained_letters_dict, specific_letter):
         trained_letters_dict (dict): Dictionary containing base directories for trained letters.
         specific_letter (str): The letter to calculate distances for.
     """
-    # Load the all_images dictionary from the pickle file
-    all_images = "input_images/letter_imgs/all_images.pkl"
-    with open(all_images, 'rb') as pickle_file:
-        images = pickle.load(pickle_file)
-
-    specific_letter_image = images[specific_letter]
     base_dir = trained_letters_dict.get(specific_letter)
     
     if base_dir:
-        euclidean_distances = calculate_dist(base_dir, specific_letter_image)
+        euclidean_distances = calculate_dist(base_dir, specific_letter)
         plot_distances(euclidean_distances, f'Euclidean Distance vs VR_std for Letter "{specific_letter}"')
     else:
         print(f"Base directory for letter '{specific_letter}' not found in the provided dictionary.")
@@ -92,22 +109,10 @@ def avg_eucl_dist(trained_letters_dict):
     Args:
         trained_letters_dict (dict): Dictionary containing base directories for trained letters.
     """
-    # Load the all_images dictionary from the pickle file
-    all_images = "input_images/letter_imgs/all_images.pkl"
-    with open(all_images, 'rb') as pickle_file:
-        images = pickle.load(pickle_file)
-
-    # Initialize a structure to hold the distances
-    average_distances = {nc: {dev: [] for dev in VR_std} for nc in mtjs}
-    
-    for letter, base_dir in trained_letters_dict.items():
-        specific_letter_image = images[letter]
-        euclidean_distances = calculate_dist(base_dir, specific_letter_image)
-        
-        # Accumulate the distances for averaging
-        for num_cells in mtjs:
-            for dev in VR_std:
-                average_distances[num_cells][dev] += euclidean_distances[num_cells][dev]
+    # The runs of all the letters are analysed at once
+    runs = [(folder, letter, dev, num_cells) for letter, base_dir in trained_letters_dict.items()
+            for folder, dev, num_cells in find_runs(base_dir)]
+    average_distances = analysis_engine.group_distances(runs, analysis_engine.eucl_distances(runs), mtjs, VR_std)
 
     # Average the distances across letters
     for num_cells in mtjs:
@@ -119,34 +124,47 @@ def avg_eucl_dist(trained_letters_dict):
 
     plot_distances(average_distances, 'Average Euclidean Distance vs VR_std Across Letters')
 
-def calculate_dist(base_dir, letter_image):
+def find_runs(base_dir):
     """
-    Helper function to calculate Euclidean distances for a given letter.
+    Helper function to find the trained folders of a letter, with their dev and num_cells.
 
     Args:
-        base_dir (str): Base directory containing the trained folders.
-        letter_image (numpy.ndarray): The image of the specific letter.
+        base_dir (str or dict): A glob pattern of the trained folders (dev and num_cells are parsed from their names),
+            or the parameters selecting the finished runs in the RUN_CATALOG, e.g. catalog_letters_dict['C'].
 
     Returns:
-        dict: Dictionary containing Euclidean distances for each combination of num_cells and VR_std.
+        list of tuple: (folder, dev, num_cells) of each run.
     """
-    trained_folders = sorted(glob.glob(base_dir))
-    euclidean_distances = {nc: {dev: [] for dev in VR_std} for nc in mtjs}
-
-    for trained_folder in trained_folders:
+    if isinstance(base_dir, dict):
+        # A parameter missing from a run (registered before it existed, or a desVar not overridden) has its default
+        runs = [run for run in run_catalog.RunCatalog(RUN_CATALOG).select(status='done', inp_img=base_dir['inp_img'])
+                if all(run['params'].get(name, CATALOG_PARAMS.get(name)) == value
+                       for name, value in base_dir.items())]
+        return [(run['process_dir'], float(run['params']['dev']), int(run['params']['num_cells'])) for run in runs]
+
+    runs = []
+    for trained_folder in sorted(glob.glob(base_dir)):
         folder_name = os.path.basename(trained_folder)
         parts = folder_name.split('_')
         dev = float(parts[-2].replace('dev', ''))
         num_cells = int(parts[-1].replace('cells', ''))
+        runs.append((trained_folder, dev, num_cells))
+    return runs
 
-        data_file = os.path.join(trained_folder, "results.txt")
-        if os.path.exists(data_file):
-            data = np.genfromtxt(data_file, delimiter="", skip_header=4)
-            final_weights_flat = data[-1, 1:-1]
-            euclidean_distance = np.linalg.norm(final_weights_flat/num_cells - (letter_image/255.0))
-            euclidean_distances[num_cells][dev].append(euclidean_distance)
-    
-    return euclidean_distances
+def calculate_dist(base_dir, letter):
+    """
+    Helper function to calculate Euclidean distances for a given letter.
+
+    Args:
+        base_dir (str or dict): Glob pattern of the trained folders, or parameters of the runs in the catalog (see find_runs).
+        letter (str): The letter the runs were trained on.
+
+    Returns:
+        dict: Dictionary containing Euclidean distances for each combination of num_cells and VR_std.
+    """
+    runs = [(folder, letter, dev, num_cells) for folder, dev, num_cells in find_runs(base_dir)]
+    # Final rows read in parallel, distances memoized in analysis_engine.CACHE_FILE
+    return analysis_engine.group_distances(runs, analysis_engine.eucl_distances(runs), mtjs, VR_std)
 
 def plot_distances(euclidean_distances, title):
     """
@@ -167,18 +185,30 @@ def plot_distances(euclidean_distances, title):
     axe1.set_title(title)
     axe1.legend()
 
-# To calculate for a single letter
-eucl_dist(trained_letters_dict, 'I')
-# eucl_dist(trained_letters_dict, 'C')
-# eucl_dist(trained_letters_dict, 'K')
-eucl_dist(trained_letters_dict, 'L')
-# eucl_dist(trained_letters_dict, 'P')
-# eucl_dist(trained_letters_dict, 'H')
-eucl_dist(trained_letters_dict, 'O')
-# eucl_dist(trained_letters_dict, 'F')
-# eucl_dist(trained_letters_dict, 'T')
-eucl_dist(trained_letters_dict, 'U')
-
-# To calculate the average across multiple letters
-avg_eucl_dist(trained_letters_dict)
-plt.show()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plot the Euclidean distances of the trained letters.")
+    parser.add_argument("--catalog", nargs="?", const=RUN_CATALOG, default=None,
+                        help=f"select the runs of catalog_letters_dict in the run catalog (default: {RUN_CATALOG}) "
+                             "instead of globbing the folders of trained_letters_dict")
+    args = parser.parse_args()
+    if args.catalog:
+        if not os.path.isfile(args.catalog):
+            parser.error(f"no run catalog at {args.catalog}")
+        RUN_CATALOG = args.catalog
+        trained_letters_dict = catalog_letters_dict
+
+    # To calculate for a single letter
+    eucl_dist(trained_letters_dict, 'I')
+    # eucl_dist(trained_letters_dict, 'C')
+    # eucl_dist(trained_letters_dict, 'K')
+    eucl_dist(trained_letters_dict, 'L')
+    # eucl_dist(trained_letters_dict, 'P')
+    # eucl_dist(trained_letters_dict, 'H')
+    eucl_dist(trained_letters_dict, 'O')
+    # eucl_dist(trained_letters_dict, 'F')
+    # eucl_dist(trained_letters_dict, 'T')
+    eucl_dist(trained_letters_dict, 'U')
+
+    # To calculate the average across multiple letters
+    avg_eucl_dist(trained_letters_dict)
+    plt.show()
@@ -2,59 +2,118 @@
 This script processes and plots simulation results for an SNN.
 It loads data from a specified results file, plots the weights history, the output 
 neuron membrane potential, and compares initial and final weights.
+With --batch, the figures of many simulation folders (glob patterns) are rendered headless (Agg backend)
+by a pool of processes, and saved next to each run (weights_history, membrane and weights, as PNG or PDF).
+The weight traces are decimated with min/max buckets and the membrane with LTTB (see decimation), and the weight
+images take the shape of the input image from the parameters of the run, so large runs render in seconds.
 
 Functions:
     parse_arguments: Parse command-line arguments.
-    load_data: from results.txt, organized as :  time | synapse1 | synapse2 | ... | membrane_out_neuron.
+    load_data: from results.npy (or results.txt), organized as :  time | synapse1 | synapse2 | ... | membrane_out_neuron.
+    weight_images: Arrange the weights of the synapses as the input image of each output neuron.
     plot_weights_history: Plot the weights history.
     plot_membrane_potential: Plot the output neuron membrane potential.
     plot_weights_comparison: Plot initial and final weights comparison.
+    render_folder: Render and save the figures of a folder, headless.
+    render_sweep: Render the folders of a sweep in a process pool.
     main: Main function to orchestrate loading data and plotting results.
 
 Example Usage:
 ```
 >> python plot_weig_membr.py simulations_folder_name
+>> python plot_weig_membr.py --batch "../../snn_sim_folders/dat_1225_*" --format png pdf -j 8
 ```
 """
                    
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
+from matplotlib.collections import LineCollection
 import os
+import re
 import sys
+import glob
 import argparse
+from multiprocessing import Pool
+import result_store
+import decimation
+
+MAX_POINTS = 2000  # points of each plotted trace after decimation
+MAX_VECTOR_TRACES = 100  # above this number of weight traces, they are rasterized in PDF figures
+FIGURES = ("weights_history", "membrane", "weights")
 
 def parse_arguments():
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(description="Plot simulation results.")
-    parser.add_argument("folder_name", help="Folder containing the simulation results.")
+    parser.add_argument("folder_name", nargs="+", help="Folder containing the simulation results (glob patterns with --batch).")
+    parser.add_argument("--batch", action="store_true", help="render the figures of all the folders headless and save them")
+    parser.add_argument("--format", nargs="+", default=["png"], help="formats of the saved figures (png, pdf, ...)")
+    parser.add_argument("-j", dest="processes", type=int, default=None, help="rendering processes (default: all the cores)")
     return parser.parse_args()
 
 def load_data(folder_name):
-    """Load data from the results file."""
+    """Load data from the results store (results.npy), or from the results file when the folder is not converted."""
     file_path = os.path.join(folder_name, "results.txt")
-    if not os.path.isfile(file_path):
+    if not os.path.isfile(file_path) and not os.path.isfile(os.path.join(folder_name, result_store.DATA_FILE)):
         print(f"Error: File {file_path} does not exist.")
         sys.exit(1)
-    return np.genfromtxt(file_path, delimiter="", skip_header=4)
+    return result_store.load_results(folder_name)
+
+def weight_images(weights, header=None):
+    """
+    Arrange the weights of the synapses as the input image seen by each output neuron, side by side.
+    The shape of the image and the synapse of each column are taken from the header of the results store
+    (num_input, num_output and the synapse<input>_<output> column names); without header, the weights are those
+    of a single output neuron, in a square image when their number is a square.
+
+    Args:
+        weights (numpy.ndarray): The weight of each synapse.
+        header (dict): The header of the results store (see result_store.load_header).
+
+    Returns:
+        numpy.ndarray: The image of the weights.
+    """
+    params = (header or {}).get('params') or {}
+    num_input = int(params.get('num_input') or len(weights))
+    num_output = int(params.get('num_output') or 1)
+    pairs = [re.search(r"synapse(\d+)_(\d+)", name) for name in ((header or {}).get('columns') or [])[1:-1]]
+    if len(pairs) == len(weights) and all(pairs):
+        inputs = np.array([int(pair.group(1)) for pair in pairs]) - 1
+        outputs = np.array([int(pair.group(2)) for pair in pairs]) - 1
+    else:  # Netlist order of a dense layer
+        inputs, outputs = np.arange(len(weights)) % num_input, np.arange(len(weights)) // num_input
+    images = np.zeros((num_output, num_input))
+    images[outputs, inputs] = weights
+    side = int(round(np.sqrt(num_input)))
+    shape = (side, side) if side * side == num_input else (1, num_input)
+    return np.hstack([image.reshape(shape) for image in images])
 
 def plot_weights_history(data):
     """Plot the weights history."""
-    plt.figure(figsize=(5, 5))
-    plt.plot(1e3 * data[:, 0], data[:, 1:-1])
+    fig = plt.figure(figsize=(5, 5))
+    t, w = decimation.minmax(1e3 * data[:, 0], data[:, 1:-1], MAX_POINTS // 2)
+    traces = decimation.drop_flat(t, w)
+    # One collection draws all the traces, rasterized in vector formats when there are many
+    lines = LineCollection(traces, colors=plt.rcParams['axes.prop_cycle'].by_key()['color'],
+                           rasterized=len(traces) > MAX_VECTOR_TRACES)
+    plt.gca().add_collection(lines)
+    plt.gca().autoscale()
     plt.title("Weights history")
     plt.xlabel("Time (ms)")
     plt.ylabel("Weight state")
     plt.grid(True)
+    return fig
 
 def plot_membrane_potential(data):
     """Plot the output neuron membrane potential."""
-    plt.figure(figsize=(5, 5))
-    plt.plot(1e3 * data[:, 0], 1e3 * data[:, -1], color="green")
+    fig = plt.figure(figsize=(5, 5))
+    t, v = decimation.lttb(data[:, 0], data[:, -1], MAX_POINTS)
+    plt.plot(1e3 * t, 1e3 * v, color="green")
     plt.title("Output neuron membrane potential")
     plt.xlabel("Time (ms)")
     plt.ylabel("Mem potential (mV)")
     plt.grid(True)
+    return fig
 
 def plot_weights_comparison(init_weights_img, final_weights_img):
     """Plot initial and final weights comparison."""
@@ -77,16 +136,68 @@ def plot_weights_comparison(init_weights_img, final_weights_img):
     plt.tight_layout()
     return fig
 
+def render_folder(folder_name, formats=("png",)):
+    """
+    Render the figures of a simulation folder headless, and save them in the folder.
+
+    Args:
+        folder_name (str): The simulation folder.
+        formats (tuple of str): The formats of the saved figures.
+
+    Returns:
+        str: The folder, or an error message when it could not be rendered.
+    """
+    try:
+        data = result_store.load_results(folder_name)
+        header = result_store.load_header(folder_name)
+        figures = [plot_weights_history(data), plot_membrane_potential(data),
+                   plot_weights_comparison(weight_images(data[0, 1:-1], header), weight_images(data[-1, 1:-1], header))]
+        for name, fig in zip(FIGURES, figures):
+            for fmt in formats:
+                fig.savefig(os.path.join(folder_name, f"{name}.{fmt}"), format=fmt)
+        return folder_name
+    except Exception as exc:
+        return f"{folder_name}: {exc}"
+    finally:
+        plt.close("all")
+
+def _init_worker():
+    plt.switch_backend("Agg")
+    plt.rcParams.update({'font.size': 14, 'font.family': 'serif'})
+
+def render_sweep(patterns, formats=("png",), processes=None):
+    """
+    Render the figures of the folders of a sweep in a pool of processes, with the Agg backend.
+
+    Args:
+        patterns (list of str): Glob patterns of the simulation folders.
+        formats (tuple of str): The formats of the saved figures.
+        processes (int): The number of processes, all the cores by default.
+
+    Returns:
+        list of str: The rendered folders, or the errors of the folders that could not be rendered.
+    """
+    folders = sorted({folder for pattern in patterns for folder in glob.glob(pattern) if os.path.isdir(folder)})
+    with Pool(processes, initializer=_init_worker) as pool:
+        return list(pool.imap_unordered(_render, [(folder, tuple(formats)) for folder in folders]))
+
+def _render(args):
+    return render_folder(*args)
+
 def main():
     """Main function to orchestrate loading data and plotting results."""
     args = parse_arguments()
-    data = load_data(args.folder_name)
+    if args.batch:
+        for line in render_sweep(args.folder_name, args.format, args.processes):
+            print(line)
+        return
 
-    init_weights_flat = data[0, 1:-1]
-    init_weights_img = init_weights_flat.reshape((5, 5))
+    folder_name = args.folder_name[0]
+    data = load_data(folder_name)
+    header = result_store.load_header(folder_name)
 
-    final_weights_flat = data[-1, 1:-1]
-    final_weights_img = final_weights_flat.reshape((5, 5))
+    init_weights_img = weight_images(data[0, 1:-1], header)
+    final_weights_img = weight_images(data[-1, 1:-1], header)
 
     # Update matplotlib global parameters for font
     plt.rcParams.update({'font.size': 14, 'font.family': 'serif'})
@@ -96,7 +207,7 @@ def main():
     fig = plot_weights_comparison(init_weights_img, final_weights_img)
 
     # Save figure to home directory if needed
-    # plt.savefig(os.path.join(os.path.expanduser("~"), os.path.basename(args.folder_name) + ".pdf"), format='pdf')
+    # plt.savefig(os.path.join(os.path.expanduser("~"), os.path.basename(folder_name) + ".pdf"), format='pdf')
 
     plt.show()
 
@@ -0,0 +1,162 @@
+"""
+This module stores the waveforms of a simulation in a binary columnar format, next to the `results.txt` written by
+`ocnPrint`: `results.npy` holds the float64 table time | synapse1 | synapse2 | ... | membrane_out_neuron in column-major
+order (each waveform is contiguous on disk), and `results.json` holds the column names and the simulation parameters.
+The loaders open `results.npy` as a read-only memory map, without parsing nor copying, so analysing hundreds of
+simulations is bound by the disk reads of the used columns; they fall back to parsing `results.txt` when a
+simulation folder has not been converted.
+
+Functions:
+    column_names: Names of the columns, from the save_states string of the OCEAN script.
+    save_results: Writes the binary store of a simulation folder from an array.
+    convert_results: Converts the results.txt of a simulation folder into the binary store.
+    load_results: Loads the table of a simulation folder (memory map, or parsed text as fallback).
+    final_row: Loads the last row of the table of a simulation folder.
+    load_header: Loads the JSON header of a simulation folder.
+    json_params: The simulation parameters that can be stored as JSON.
+
+Example Usage:
+```python
+convert_results(abs_process_dir, params)
+data = load_results(abs_process_dir)
+final_weights = data[-1, 1:-1]
+```
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+
+TEXT_FILE = "results.txt"
+DATA_FILE = "results.npy"
+HEADER_FILE = "results.json"
+TEXT_HEADER_LINES = 4
+MEMBRANE_COLUMN = 'v("output_neuron1:membrane")'
+
+
+def column_names(save_states):
+    """
+    Names of the columns of the results, from the save_states string given to ocnPrint.
+
+    Args:
+        save_states (str): The signals of the synapses, separated by spaces, the cells of a synapse joined by '+'.
+
+    Returns:
+        list of str: time, one name per synapse and the membrane.
+    """
+    synapses = re.sub(r"\s*\+\s*", "+", save_states).split()
+    return ["time"] + synapses + [MEMBRANE_COLUMN]
+
+
+def json_params(params):
+    """The simulation parameters that can be stored in the JSON header (save_states is rebuilt from the columns)."""
+    return {k: v for k, v in params.items()
+            if k != 'save_states' and isinstance(v, (str, int, float, bool, type(None)))}
+
+
+def save_results(folder, data, columns=None, params=None):
+    """
+    Writes the binary store of a simulation folder.
+
+    Args:
+        folder (str): The simulation folder.
+        data (numpy.ndarray): The table of the waveforms, (num_samples, num_columns).
+        columns (list of str): The names of the columns.
+        params (dict): The simulation parameters to record in the header.
+    """
+    data = np.asfortranarray(data, dtype=np.float64)
+    tmp_file = os.path.join(folder, DATA_FILE + ".tmp")
+    with open(tmp_file, "wb") as file:
+        np.save(file, data)
+    os.replace(tmp_file, os.path.join(folder, DATA_FILE))  # A store is either complete or absent
+    header = {"shape": list(data.shape), "columns": columns, "params": json_params(params or {})}
+    with open(os.path.join(folder, HEADER_FILE), "w") as file:
+        json.dump(header, file, indent=1)
+
+
+def convert_results(folder, params=None, remove_text=False):
+    """
+    Converts the results.txt of a simulation folder into the binary store.
+
+    Args:
+        folder (str): The simulation folder.
+        params (dict): The simulation parameters, the column names are taken from params['save_states'] when set,
+            otherwise from the header of the text file.
+        remove_text (bool): Whether to remove results.txt once converted.
+    """
+    text_file = os.path.join(folder, TEXT_FILE)
+    data = np.loadtxt(text_file, skiprows=TEXT_HEADER_LINES, ndmin=2)
+    if params and params.get('save_states'):
+        columns = column_names(params['save_states'])
+    else:
+        with open(text_file, "r") as file:
+            lines = [file.readline() for _ in range(TEXT_HEADER_LINES)]
+        columns = max((line.split() for line in lines), key=len) or None
+    if columns is not None and len(columns) != data.shape[1]:
+        columns = None
+    save_results(folder, data, columns, params)
+    if remove_text:
+        os.remove(text_file)
+
+
+def load_results(folder, mmap=True):
+    """
+    Loads the table of the waveforms of a simulation folder: time | synapse1 | ... | membrane_out_neuron.
+
+    Args:
+        folder (str): The simulation folder.
+        mmap (bool): Whether to memory map the binary store (read-only) instead of reading it.
+
+    Returns:
+        numpy.ndarray: The table, (num_samples, num_columns).
+    """
+    data_file = os.path.join(folder, DATA_FILE)
+    if os.path.isfile(data_file):
+        return np.load(data_file, mmap_mode="r" if mmap else None)
+    return np.genfromtxt(os.path.join(folder, TEXT_FILE), delimiter="", skip_header=TEXT_HEADER_LINES)
+
+
+def final_row(folder, block=1 << 16):
+    """
+    Loads the last row of the table of a simulation folder (e.g. the final weights), without reading the others:
+    a single row of the memory map, or the last line of results.txt read from its end.
+
+    Args:
+        folder (str): The simulation folder.
+        block (int): The size of the first block read from the end of results.txt, doubled until it holds the line.
+
+    Returns:
+        numpy.ndarray: The row, (num_columns,).
+    """
+    data_file = os.path.join(folder, DATA_FILE)
+    if os.path.isfile(data_file):
+        return np.array(np.load(data_file, mmap_mode="r")[-1])
+    with open(os.path.join(folder, TEXT_FILE), "rb") as file:
+        end = file.seek(0, os.SEEK_END)
+        size = min(block, end)
+        while True:
+            file.seek(end - size)
+            chunk = file.read(size).rstrip()
+            start = chunk.rfind(b"\n")
+            if start >= 0 or size == end:
+                return np.array(chunk[start + 1:].split(), dtype=np.float64)
+            size = min(2 * size, end)
+
+
+def load_header(folder):
+    """
+    Loads the JSON header of a simulation folder.
+
+    Args:
+        folder (str): The simulation folder.
+
+    Returns:
+        dict: shape, columns and params of the store, None if the folder has not been converted.
+    """
+    header_file = os.path.join(folder, HEADER_FILE)
+    if not os.path.isfile(header_file):
+        return None
+    with open(header_file, "r") as file:
+        return json.load(file)
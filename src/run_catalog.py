@@ -0,0 +1,205 @@
+"""
+This module keeps a catalog of the simulations in a local SQLite database under the results root, so the runs can be
+selected by their parameters instead of globbing the simulation folders and parsing their names.
+Each run is registered when it starts (status 'running') and updated when it ends ('done' or 'failed') with its wall
+time and summary metrics of its results. All its parameters are stored as JSON, and also in an indexed
+(run, name, value) table, so any parameter, including a new sweep axis, can be queried.
+Every access opens its own short connection, so the processes of a Pool can update the same catalog. The catalog keeps
+the default rollback journal of SQLite (WAL needs a shared memory file that network file systems do not support), so it
+can live on a shared results root, and its schema is created once, when the database file is new.
+
+Functions:
+    RunCatalog: The catalog database, with register, finish and select methods.
+    record_runs: Context manager that registers runs and records their outcome.
+    summarize: Summary metrics of the results of a simulation folder.
+
+Example Usage:
+```python
+catalog = RunCatalog("../../snn_sim_folders/catalog.sqlite")
+for run in catalog.select(inp_img='C', num_cells=[4, 8], status='done'):
+    print(run['process_dir'], run['params']['dev'], run['metrics'])
+```
+"""
+
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+import result_store
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    process_dir TEXT,
+    results_file TEXT,
+    backend TEXT,
+    status TEXT,
+    started REAL,
+    wall_time REAL,
+    params TEXT,
+    metrics TEXT
+);
+CREATE TABLE IF NOT EXISTS run_params (
+    run_id INTEGER REFERENCES runs(id) ON DELETE CASCADE,
+    name TEXT,
+    value
+);
+CREATE INDEX IF NOT EXISTS run_params_name_value ON run_params (name, value);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status);
+"""
+SCHEMA_VERSION = 1
+RUN_COLUMNS = ('id', 'process_dir', 'results_file', 'backend', 'status', 'started', 'wall_time', 'params', 'metrics')
+_created = set()  # The catalogs whose schema this process has already checked
+
+
+class RunCatalog:
+    """
+    A SQLite catalog of the simulation runs.
+
+    Attributes:
+        path [str]: The path of the database file.
+
+    Methods
+    -------
+    register(params):
+        Adds a run with status 'running', returns its id.
+    finish(run_id, params, status='done', metrics=None):
+        Sets the status, the paths, the wall time and the metrics of a run.
+    select(status=None, **filters):
+        Returns the runs whose parameters match the filters (a value, or a list of values).
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        if self.path in _created:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as connection:
+            # The schema version is read once per process, the DDL only runs on a new database
+            if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                connection.execute("PRAGMA journal_mode=DELETE")  # A catalog created in WAL mode keeps it in its file
+                connection.executescript(SCHEMA + f"PRAGMA user_version = {SCHEMA_VERSION};")
+        _created.add(self.path)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=60)
+        connection.execute("PRAGMA foreign_keys=ON")
+        return _Closing(connection)
+
+    def register(self, params):
+        params = result_store.json_params(params)
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO runs (process_dir, results_file, backend, status, started, params) VALUES (?, ?, ?, ?, ?, ?)",
+                (params.get('process_dir'), params.get('results_file'), params.get('backend', 'spectre'), 'running',
+                 time.time(), json.dumps(params)))
+            run_id = cursor.lastrowid
+            connection.executemany("INSERT INTO run_params (run_id, name, value) VALUES (?, ?, ?)",
+                                   [(run_id, name, value) for name, value in params.items()])
+        return run_id
+
+    def finish(self, run_id, params, status='done', metrics=None):
+        params = result_store.json_params(params)
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE runs SET process_dir = ?, results_file = ?, status = ?, wall_time = ? - started, params = ?, "
+                "metrics = ? WHERE id = ?",
+                (params.get('process_dir'), params.get('results_file'), status, time.time(), json.dumps(params),
+                 json.dumps(metrics) if metrics is not None else None, run_id))
+            connection.execute("DELETE FROM run_params WHERE run_id = ?", (run_id,))
+            connection.executemany("INSERT INTO run_params (run_id, name, value) VALUES (?, ?, ?)",
+                                   [(run_id, name, value) for name, value in params.items()])
+
+    def select(self, status=None, **filters):
+        query = "SELECT " + ", ".join(RUN_COLUMNS) + " FROM runs WHERE 1"
+        args = []
+        if status is not None:
+            query += " AND status = ?"
+            args.append(status)
+        for name, value in filters.items():
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            query += (" AND id IN (SELECT run_id FROM run_params WHERE name = ? AND value IN ("
+                      + ", ".join("?" * len(values)) + "))")
+            args += [name] + values
+        with self._connect() as connection:
+            rows = connection.execute(query + " ORDER BY id", args).fetchall()
+        runs = []
+        for row in rows:
+            run = dict(zip(RUN_COLUMNS, row))
+            run['params'] = json.loads(run['params'])
+            run['metrics'] = json.loads(run['metrics']) if run['metrics'] else None
+            runs.append(run)
+        return runs
+
+
+class _Closing:
+    """Commits (or rolls back) and closes a connection at the end of a with block."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.connection.commit()
+            else:
+                self.connection.rollback()
+        finally:
+            self.connection.close()
+
+
+def summarize(folder):
+    """
+    Summary metrics of the results of a simulation folder.
+
+    Args:
+        folder (str): The simulation folder.
+
+    Returns:
+        dict: final_weight_sum, weight_changes (total change of the weights along the run), membrane_max
+        and num_samples, or None when the folder has no results.
+    """
+    try:
+        data = result_store.load_results(folder)
+    except (OSError, ValueError):
+        return None
+    weights = np.asarray(data[:, 1:-1])
+    return {
+        'final_weight_sum': float(weights[-1].sum()),
+        'weight_changes': float(np.abs(np.diff(weights, axis=0)).sum()),
+        'membrane_max': float(np.max(data[:, -1])),
+        'num_samples': int(data.shape[0]),
+    }
+
+
+@contextmanager
+def record_runs(path, param_list):
+    """
+    Registers runs in the catalog for the duration of a with block, and marks them 'done' with their metrics,
+    or 'failed' if the block raises. Does nothing when path is empty.
+
+    Args:
+        path (str): The path of the catalog database, '' or None to disable the catalog.
+        param_list (list of dict): The parameters of the runs, process_dir and results_file are read at the end.
+    """
+    if not path:
+        yield
+        return
+    catalog = RunCatalog(path)
+    run_ids = [catalog.register(params) for params in param_list]
+    try:
+        yield
+    except BaseException:
+        for run_id, params in zip(run_ids, param_list):
+            catalog.finish(run_id, params, 'failed')
+        raise
+    for run_id, params in zip(run_ids, param_list):
+        metrics = summarize(params['process_dir']) if params.get('process_dir') else None
+        catalog.finish(run_id, params, 'done', metrics)
@@ -0,0 +1,248 @@
+"""
+This module instruments the runs of a sweep, to find where their time goes: the wall time of each stage of a run
+(input loading, netlist, OCEAN script substitution, Spectre, cleanup, result store, ...), the CPU time of the Python
+process and of its child processes (ocean and spectre) from `resource.getrusage`, the peak resident memory of the run
+(of the Python process since the start of the run, and of the commands it ran, see add_command), and the
+statistics of the Spectre log (accepted and rejected time steps, ...). Each design is written as one JSON line appended
+to a metrics file shared by the processes of the sweep, with its own parameters: the designs of an OCEAN session or of
+a native batch each get an equal share of its stage times, and the Spectre statistics of their own point. The report
+command aggregates these lines by parameter, e.g. the runtime of each stage against num_cells.
+
+Functions:
+    RunMetrics: The measures of a run, with a stage context manager.
+    record: Context manager that measures a run and appends its JSON line to the metrics file.
+    spectre_log_stats: Statistics of a Spectre log.
+    load_metrics: Reads the JSON lines of a metrics file.
+    report: Aggregates the metrics by parameters, as a printable table.
+
+Example Usage:
+```python
+with record("../../snn_sim_folders/run_metrics.jsonl", [params]) as metrics:
+    with metrics.stage('spectre'):
+        metrics.add_command(subst_run.exec_cmd(command))
+    metrics.add_spectre_log(os.path.join(params['process_dir'], "psf", "spectre.out"), 0)
+```
+```bash
+>> python run_metrics.py ../../snn_sim_folders/run_metrics.jsonl num_cells
+```
+"""
+
+import json
+import os
+import re
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+import result_store
+
+# Counters of the transient analysis summary printed by Spectre (and APS)
+SPECTRE_STATS = {
+    'accepted_steps': r"Number of accepted tran steps\s*=\s*(\d+)",
+    'rejected_steps': r"Number of rejected tran steps\s*=\s*(\d+)",
+    'timepoints': r"Number of timepoints\s*=\s*(\d+)",
+    'newton_iterations': r"Number of Newton iterations\s*=\s*(\d+)",
+}
+
+
+class RunMetrics:
+    """
+    The measures of a run: the wall time and the CPU times of its stages, its peak memory and its Spectre statistics.
+
+    Attributes:
+        stages [dict]: For each stage: wall, cpu_self and cpu_children in seconds (summed if a stage is repeated).
+        spectre [dict]: The statistics of the Spectre log of each point of the run, by index in the run.
+        start [float]: The wall clock time at the start of the run.
+        peak_rss_children_kb [int]: The largest peak resident memory of the commands of the run, in kB.
+        tracks_rss [bool]: Whether the peak resident memory of the process was reset at the start of the run.
+
+    Methods
+    -------
+    stage(name):
+        Context manager that measures a stage of the run.
+    add_spectre_log(log_file, point):
+        Adds the statistics of the Spectre log of a point.
+    add_command(usage):
+        Adds the resource usage of a command run by exec_cmd.
+    as_records(param_list, status):
+        The JSON records of the designs of the run.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.spectre = {}
+        self.start = time.time()
+        self.peak_rss_children_kb = 0
+        # getrusage only gives the high-water mark of the whole life of a (pool worker) process, Linux can reset it
+        self.tracks_rss = _reset_peak_rss()
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu_self, cpu_children = time.perf_counter(), _cpu_time(resource.RUSAGE_SELF), _cpu_time(resource.RUSAGE_CHILDREN)
+        try:
+            yield
+        finally:
+            measures = self.stages.setdefault(name, {'wall': 0.0, 'cpu_self': 0.0, 'cpu_children': 0.0})
+            measures['wall'] += time.perf_counter() - wall
+            measures['cpu_self'] += _cpu_time(resource.RUSAGE_SELF) - cpu_self
+            measures['cpu_children'] += _cpu_time(resource.RUSAGE_CHILDREN) - cpu_children
+
+    def add_spectre_log(self, log_file, point):
+        stats = self.spectre.setdefault(point, {})
+        for name, count in spectre_log_stats(log_file).items():
+            stats[name] = stats.get(name, 0) + count
+
+    def add_command(self, usage):
+        # On Linux a command starts from the peak of this process at its spawn, which is reset per run as well
+        self.peak_rss_children_kb = max(self.peak_rss_children_kb, usage.ru_maxrss)
+
+    def as_records(self, param_list, status):
+        # The stages of a session or a batch are shared by its designs, each one is charged an equal share
+        share = 1 / max(len(param_list), 1)
+        wall = time.time() - self.start
+        stages = {name: {key: value * share for key, value in measures.items()} for name, measures in self.stages.items()}
+        return [{
+            'time': self.start,
+            'status': status,
+            'wall': wall * share,
+            'session_points': len(param_list),
+            'params': result_store.json_params(params),
+            'process_dir': params.get('process_dir'),
+            'stages': stages,
+            # None when the peak of the process cannot be measured per run
+            'peak_rss_kb': _peak_rss() if self.tracks_rss else None,
+            'peak_rss_children_kb': self.peak_rss_children_kb,
+            'spectre': self.spectre.get(point, {}),
+        } for point, params in enumerate(param_list)]
+
+
+def _reset_peak_rss():
+    """Resets the peak resident memory (VmHWM) of the process, returns False when the system does not allow it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss():
+    """The peak resident memory of the process since the last reset, in kB."""
+    with open("/proc/self/status", "r") as file:
+        for line in file:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return None
+
+
+def _cpu_time(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def spectre_log_stats(log_file):
+    """
+    Statistics of a Spectre log (see SPECTRE_STATS), summed over the analyses of the log.
+
+    Args:
+        log_file (str): The path of the log, e.g. psf/spectre.out in the results directory.
+
+    Returns:
+        dict: The counters found in the log, empty if the log does not exist.
+    """
+    try:
+        with open(log_file, "r", errors="replace") as file:
+            text = file.read()
+    except OSError:
+        return {}
+    stats = {}
+    for name, pattern in SPECTRE_STATS.items():
+        values = [int(value) for value in re.findall(pattern, text)]
+        if values:
+            stats[name] = sum(values)
+    return stats
+
+
+@contextmanager
+def record(path, param_list):
+    """
+    Measures a run for the duration of a with block, and appends the JSON records of its designs to the metrics file,
+    with the status 'done', or 'failed' if the block raises. The run is measured but not written when path is empty.
+
+    Args:
+        path (str): The path of the metrics file (JSON lines), '' or None to not write it.
+        param_list (list of dict): The parameters of the designs of the run, process_dir is read at the end.
+
+    Yields:
+        RunMetrics: The measures of the run.
+    """
+    metrics = RunMetrics()
+    status = 'failed'
+    try:
+        yield metrics
+        status = 'done'
+    finally:
+        if path:
+            lines = "".join(json.dumps(rec) + "\n" for rec in metrics.as_records(param_list, status)).encode()
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # A single write in append mode, so the lines of concurrent processes are not interleaved
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, lines)
+            finally:
+                os.close(fd)
+
+
+def load_metrics(path):
+    """
+    Reads the records of a metrics file.
+
+    Args:
+        path (str): The path of the metrics file.
+
+    Returns:
+        list of dict: The records, in the order they were written.
+    """
+    with open(path, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def report(records, by=('num_cells',)):
+    """
+    Aggregates the records of the successful designs by the values of their parameters: number of designs,
+    mean wall time, mean wall time of each stage, mean child CPU time and largest peak memory per design.
+
+    Args:
+        records (list of dict): The records of load_metrics.
+        by (tuple of str): The parameters to group by.
+
+    Returns:
+        str: The report, one line per group.
+    """
+    groups = {}
+    for rec in records:
+        if rec['status'] == 'done':
+            groups.setdefault(tuple(rec['params'].get(name) for name in by), []).append(rec)
+    stages = sorted({name for rec in records for name in rec['stages']})
+    header = list(by) + ['points', 'wall/point'] + stages + ['cpu_child/point', 'rss_MB']
+    rows = []
+    for key in sorted(groups, key=lambda key: tuple(str(value) for value in key)):
+        recs = groups[key]
+        points = len(recs)
+        rows.append([str(value) for value in key] + [str(points), f"{sum(rec['wall'] for rec in recs) / points:.2f}"]
+            + [f"{sum(rec['stages'].get(name, {}).get('wall', 0.0) for rec in recs) / points:.2f}" for name in stages]
+            + [f"{sum(sum(s['cpu_children'] for s in rec['stages'].values()) for rec in recs) / points:.2f}",
+               _rss_mb(recs)])
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in [header] + rows)
+
+
+def _rss_mb(recs):
+    """The largest peak memory of some records, in MB, '-' when none of them measured it."""
+    peaks = [max(rec['peak_rss_kb'] or 0, rec['peak_rss_children_kb'] or 0) for rec in recs]
+    return f"{max(peaks) / 1024:.0f}" if any(peaks) else "-"
+
+
+if __name__ == '__main__':
+    print(report(load_metrics(sys.argv[1]), tuple(sys.argv[2:]) or ('num_cells',)))
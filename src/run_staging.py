@@ -0,0 +1,67 @@
+"""
+This module stages the Spectre runs in a node-local scratch directory (e.g. a tmpfs such as /dev/shm), so the files
+written during a run (the OCEAN script, the log, the psf folder filled by Spectre, the results) do not go through the
+shared file system of the simulation folders. Each run gets its own scratch folder, where the read-only inputs are
+symlinked instead of copied (the netlist_ocn folder of the simulation folder, the .va models are included by
+the netlist from their absolute path), and only the keep-set of files (results, log and substituted OCEAN script) is
+copied back to the simulation folder at the end. The scratch folders are removed even if the run fails.
+
+Functions:
+    staged_runs: Context manager that redirects the runs of a job to scratch folders.
+
+Example Usage:
+```python
+prepare_spectre(params, n_spik_vec)
+with staged_runs([params], "/dev/shm/snn_scratch"):
+    # params['process_dir'], params['results_file'] and params['netlist'] point to the scratch folder here
+    subst_run.substitute_templ("./oceanScript.ocn", os.path.join(params['process_dir'], "updated_template.ocn"), params)
+```
+"""
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+KEEP_FILES = ("results.txt", "oceanScript.log", "updated_template.ocn")
+STAGED_PARAMS = ('process_dir', 'results_file', 'netlist')
+
+
+@contextmanager
+def staged_runs(param_list, scratch_root, keep=KEEP_FILES):
+    """
+    Redirects the process_dir, results_file and netlist of each run to its own scratch folder for the duration
+    of a with block. At the end (also when the block raises), the keep-set files that were written are copied back
+    to the simulation folder, the scratch folders are removed and the parameters are restored.
+    Does nothing when scratch_root is empty.
+
+    Args:
+        param_list (list of dict): The parameters of the runs, prepared with prepare_spectre.
+        scratch_root (str): The node-local directory of the scratch folders, '' or None to run in place.
+        keep (tuple of str): The names of the files copied back to the simulation folder.
+    """
+    if not scratch_root:
+        yield
+        return
+    os.makedirs(scratch_root, exist_ok=True)
+    staged = []
+    try:
+        for params in param_list:
+            original = {k: params[k] for k in STAGED_PARAMS}
+            run_dir = tempfile.mkdtemp(prefix=os.path.basename(original['process_dir']) + "_", dir=scratch_root)
+            staged.append((params, original, run_dir))
+            netlist_dir = os.path.dirname(original['netlist'])
+            os.symlink(netlist_dir, os.path.join(run_dir, os.path.basename(netlist_dir)))  # Read-only input
+            params['process_dir'] = run_dir
+            params['results_file'] = os.path.join(run_dir, os.path.basename(original['results_file']))
+            params['netlist'] = os.path.join(run_dir, os.path.basename(netlist_dir), os.path.basename(original['netlist']))
+        yield
+    finally:
+        for params, original, run_dir in staged:
+            try:
+                for name in keep:
+                    if os.path.isfile(os.path.join(run_dir, name)):
+                        shutil.copyfile(os.path.join(run_dir, name), os.path.join(original['process_dir'], name))
+            finally:
+                shutil.rmtree(run_dir, ignore_errors=True)
+                params.update(original)
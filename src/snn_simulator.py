@@ -7,20 +7,40 @@ This module:
     1. Accepts user-specificatied parameter combinations for different SNN designs.
     2. Loads the generated input images, flattens them, and uses frequency coding proportional to pixel intensity
     3. Generates files and process-specific directory for each SNN simulation named with the date, process ID, and parameter details 
-    4. Creates the netlist for each simulation using the net_generator module.
+    4. Creates the netlist for each simulation using the net_generator module, netlists that do not depend on the swept
+       parameter (e.g. dev) are generated once and shared through the netlist_cache module.
     5. Substitutes parameters into the OCEAN script template and launches the SPICE simulation using the subst_run module. 
     6. Collects and saves the waveforms results of the selected signals.
     7. Executes the simulations of different SNN designs in parallel. 
+
+The simulation backend is selected with the 'backend' parameter: 'spectre' runs the OCEAN script with Cadence Spectre,
+'native' runs the NumPy port of the Verilog-A models (native_sim module) and writes the same results file,
+'native_batch' runs all the combinations of the sweep with the native backend, stacked in batches,
+'spectre_batch' runs the combinations that share a netlist in a single OCEAN session.
+Except for 'native_batch', the simulations are run as jobs of the sweep_scheduler module, which skips the jobs already
+done when a sweep is started again, retries the failed ones and kills the jobs that exceed 'job_timeout'.
 """
 
 import subst_run 
+import native_sim
 import time as tm
 import datetime
 import numpy as np
-from multiprocessing import Pool
 import os
 from distutils.dir_util import copy_tree
 from net_generator import *
+from netlist_cache import NetlistCache, netlist_key
+import result_store
+import run_catalog
+import sweep_scheduler
+import sweep_cluster
+import run_staging
+import run_metrics
+import connectivity
+import mnist_dataset
+import step_policy
+import early_stop
+import output_profile
 import shutil
 
 '''
@@ -39,8 +59,44 @@ variables = {
     'num_cells': 2,
     'cod_base': 3, 
     'cod_max': 10, 
-    'inp_img': 'U', 
-    'dev': 0
+    'inp_img': 'U',             # a letter, or a sequence of letters presented in the same simulation, e.g. 'I,O,C'
+    'epochs': 1,                # number of presentations of the sequence of letters
+    'mnist_dir': './input_images/mnist_data',  # idx files of the MNIST images selected by 'mnist<index>' in inp_img
+    'mnist_set': 'train',       # 'train' or 'test'
+    'mnist_size': 0,            # side of the rescaled MNIST images, e.g. 5 or 10 (0: 28x28)
+    'connectivity': 'dense',    # 'dense', 'receptive_field', 'fan_in' or a connectivity matrix file (see connectivity)
+    'field_size': 3,            # receptive_field only: side of the patch of each output neuron, in pixels
+    'field_stride': 1,          # receptive_field only: distance between the patches of two output neurons
+    'fan_in': 8,                # fan_in only: number of synapses of each output neuron, drawn with connectivity_seed
+    'connectivity_seed': 10,
+    'dev': 0,
+    'backend': 'spectre',       # 'spectre', 'spectre_batch', 'native' or 'native_batch'
+    'session_points': 0,        # spectre_batch only: maximum number of points per OCEAN session (0: whole netlist group)
+    'output_profile': 'full',   # 'full', 'decimated' (every print_step), 'final' (initial and final states) or 'subset' (see output_profile)
+    'print_step': 1e-3,         # decimated and subset only: time step of the printed rows
+    'output_synapses': [],      # subset only: the (input, output) neurons of the printed synapses, 1-based
+    'step_policy': 'fixed',     # spectre only: 'fixed' (100 ns grid) or 'spike' (experimental, 100 ns only around the spikes, see step_policy)
+    'max_step': 10e-6,          # spike step policy only: largest time step between the spike windows
+    'time_mode': 'grid',        # native backend only: 'grid' (fixed step) or 'event' (spike edge to spike edge)
+    'early_stop': 0,            # end a run once no MTJ switched for this window, in s (0: never, see early_stop)
+    'save_devices': False,      # native backend only: also write the sampled MTJ parameters (see mtj_sampler)
+    'switching_delay': 'closed_form',  # native backend only: 'closed_form' or 'table' (Neel-Brown delays, see delay_table)
+    'delay_tables': '../../snn_sim_folders/delay_tables',  # cache of the switching delay tables
+    'netlist_seed': 10,         # seed of the MTJs seeds and initial states of the synapses
+    'legacy_rng': False,        # True: draw them with random.seed(netlist_seed) as the original netlist generator
+    'netlist_cache': '../../snn_sim_folders/netlist_cache',  # shared netlists of the sweep ('' to generate one per run)
+    'netlist_cache_size': 1 << 30,                             # size cap of the netlist cache, in bytes (LRU eviction)
+    'result_store': True,       # also write the results as results.npy + results.json (see result_store), for fast loading
+    'run_catalog': '../../snn_sim_folders/catalog.sqlite',     # SQLite catalog of the runs ('' to disable)
+    'sweep_manifest': '../../snn_sim_folders/sweep_manifest.json',  # state of the sweep jobs, to resume an interrupted sweep
+    'max_retries': 2,           # number of times a failed job is run again
+    'job_timeout': 0,           # maximum duration of a design in seconds, the OCEAN process tree is killed after it (0: no limit)
+    'core_budget': 0,           # number of cores used by the sweep (0: all the cores of the machine)
+    'spectre_threads': 2,       # threads of each Spectre job, the sweep runs core_budget // spectre_threads jobs at once
+    'cluster_address': '',      # 'host:port' to serve the sweep to worker nodes (see sweep_cluster) instead of running it here
+    'scratch_dir': '',          # node-local folder (e.g. '/dev/shm/snn_scratch') where the Spectre runs are staged ('' to run in place)
+    'scratch_keep': run_staging.KEEP_FILES,  # files copied back from the scratch folder to the simulation folder
+    'metrics_file': '../../snn_sim_folders/run_metrics.jsonl'  # timing and resources of each run, one JSON line per run ('' to disable)
 }
 
 # Prepare combinations to run multiprocessing simulations
@@ -53,49 +109,63 @@ mtjs = [2, 4, 6, 8]
 for a in inputs: 
     for b in deviation:
         for c in mtjs:
-            variables['inp_img'] = a  
-            variables['dev'] = b
-            variables['num_cells'] = c
-            param_combinations.append(variables.copy())
+            param_combinations.append(dict(variables, inp_img=a, dev=b, num_cells=c))  # variables keeps the default design
 
-def run_simulation(params):
+def load_input(params):
     """
-    Runs a single SNN simulation with the given parameters.
+    Loads and flattens the input image of a design, and codes it into the number of spikes of each input neuron.
+    When params['inp_img'] is a sequence of letters separated by commas (e.g. 'I,O,C'), the images are presented
+    one after the other in the same simulation, params['epochs'] times, each for sim_time divided by the number
+    of presentations, and the MTJ states carry over from an image to the next.
+    The names 'mnist<index>' select images of the MNIST set params['mnist_set'], read from the memory map of
+    its idx files and rescaled to params['mnist_size'] x params['mnist_size'] pixels (see mnist_dataset).
 
     Args:
-        params (dict): A dictionary containing global and local simulation parameters.
+        params (dict): A dictionary containing global and local simulation parameters, num_input is set here.
 
-    Steps:
-        1. Load and flatten input image.
-        2. Calculate the number of spikes for each input neuron based on pixel intensity.
-        3. Generate and prepare directories and files for the simulation.
-        4. Create the netlist for the simulation.
-        5. Substitute parameters into the OCEAN script and run the simulation.
-        6. Clean up temporary files.
+    Returns:
+        numpy.ndarray: The number of spikes of each input neuron, (num_input,),
+        or (num_images, num_input) for a sequence of images.
     """
-    # Load and flatten spiking neurons intensity
-    input_data = np.load(f'./input_images/letter_imgs/generated_{params["inp_img"]}.npy')
-    flat_input_data = input_data.flatten()
+    names = str(params["inp_img"]).split(',')
+    pixels = [None] * len(names)
+    mnist = [k for k, name in enumerate(names) if name.startswith(mnist_dataset.PREFIX)]
+    if mnist:
+        # MNIST images are read from the memory map of the idx files, and rescaled as a batch
+        dataset = mnist_dataset.load_dataset(params['mnist_dir'], params['mnist_set'])
+        batch = dataset.pixels([int(names[k][len(mnist_dataset.PREFIX):]) for k in mnist], params['mnist_size'])
+        for k, image in zip(mnist, batch):
+            pixels[k] = image
+    for k, name in enumerate(names):
+        if pixels[k] is None:
+            # Load and flatten spiking neurons intensity
+            pixels[k] = np.load(f'./input_images/letter_imgs/generated_{name}.npy').flatten()
     # Use frequency coding proportional to pixel intensity + baseline
-    n_spik_vec = params['cod_base'] + params['cod_max'] * (flat_input_data / 255.0)    
-    params['num_input'] = len(flat_input_data)
-
-    # Create a string that contains result signals, to insert in .ocn file 
-    save_states = "" 
-    for i in range(1, params['num_input'] * params['num_output'] + 1):
-        input_index = (i - 1) % params['num_input'] + 1
-        output_index = (i - 1) // params['num_input'] + 1
-        for j in range(1, params['num_cells'] + 1):
-            save_states += f'v("synapse{input_index}_{output_index}.cell{j}.I:ix") '
-            if j < params['num_cells']:
-                save_states += '+'
+    n_spik_seq = mnist_dataset.rate_code(np.array(pixels), params['cod_base'], params['cod_max'])
+    params['num_input'] = n_spik_seq.shape[1]
+    if len(names) == 1 and params.get('epochs', 1) == 1:
+        return n_spik_seq[0]
+    return np.tile(n_spik_seq, (params.get('epochs', 1), 1))
+
+def create_process_dir(params):
+    """
+    Creates the process-specific directory of a design, named with the date, process ID and parameters.
+    The design hash (the first characters of its sweep_scheduler.job_id) tells apart the designs that only differ in
+    the parameters not in the name (e.g. connectivity, output_profile or netlist_seed).
 
+    Args:
+        params (dict): A dictionary containing global and local simulation parameters.
+
+    Returns:
+        str: The absolute path of the process directory.
+    """
     base_dir = os.path.abspath("../../snn_sim_folders/")
     # Format date and time as a string in the format 'MMDD_HHMM'
     now = datetime.datetime.now()
     date = now.strftime("%m%d_%H%M")     
     #process_dir = f"dat_{date}_pross_{os.getpid()}"          # name the folder with date,time & process
-    process_dir = f"dat_{date}_pross_{os.getpid()}_let{params['inp_img']}_dev{params['dev']}_cells{params['num_cells']}" #include the paramters with date & process
+    design = sweep_scheduler.job_id([params])[:8]
+    process_dir = f"dat_{date}_pross_{os.getpid()}_{design}_let{params['inp_img']}_dev{params['dev']}_cells{params['num_cells']}" #include the paramters with date & process
 
     abs_process_dir = os.path.join(base_dir, process_dir)
     
@@ -103,38 +173,281 @@ def run_simulation(params):
     if not os.path.exists(abs_process_dir):   
         os.mkdir(abs_process_dir)             
         os.mkdir(abs_process_dir + "/netlist_ocn")
-    copy_tree("./netlist_ocn", f"{abs_process_dir}/netlist_ocn")   
+    return abs_process_dir
+
+def save_states_string(params):
+    """
+    Creates the string of the result signals to insert in the .ocn file, one sum of the MTJ states per synapse
+    (only the synapses of the connectivity of the design, see the connectivity module, and of its output profile).
+
+    Args:
+        params (dict): A dictionary containing global and local simulation parameters.
+
+    Returns:
+        str: The signals given to ocnPrint.
+    """
+    cells = [f'v("synapse{{0}}_{{1}}.cell{j}.I:ix") ' for j in range(1, params['num_cells'] + 1)]
+    template = "+".join(cells)
+    # One sum per synapse, in netlist order, following the connectivity of the design
+    return "".join(template.format(i, o) for i, o in zip(*output_profile.printed_synapses(params)))
+
+def design_synapses(params, n_spik_vec):
+    """
+    The synapses of a design (seeds & initial states), as in its netlist, without writing the netlist.
+
+    Args:
+        params (dict): A dictionary containing global and local simulation parameters.
+        n_spik_vec (numpy.ndarray): The number of spikes of each input neuron.
+
+    Returns:
+        SynapseArray: The synapses, in netlist order.
+    """
+    network_generator = NetworkGenerator(None, params['num_input'], params['num_output'], params['num_cells'], n_spik_vec,
+                                         params['netlist_seed'], params['legacy_rng'], connectivity.edges(params))
+    return network_generator.generate_synapses()
+
+def write_step_policy(param_group, n_spik_vec):
+    """
+    Writes the spike-aware time-step policy of runs sharing a netlist (see step_policy) next to the netlist
+    of the first run, the one read by OCEAN, and records its number of time points in their parameters.
+
+    Args:
+        param_group (list of dict): The parameters of the runs, prepared by prepare_spectre.
+        n_spik_vec (numpy.ndarray): The number of spikes of each input neuron.
+    """
+    policy = step_policy.build_policy(param_group, n_spik_vec, design_synapses(param_group[0], n_spik_vec))
+    policy.write(os.path.join(os.path.dirname(param_group[0]['netlist']), step_policy.POLICY_FILE))
+    for params in param_group:
+        params['policy_timepoints'] = policy.timepoints()
+
+def prepare_spectre(params, n_spik_vec, write_policy=True):
+    """
+    Creates the process directory and the netlist of a design simulated with Spectre, and sets the parameters
+    to include in the .ocn file (netlist, process_dir, results_file, save_states, tran_maxstep, and the saved signals,
+    strobe period and print step of the output profile).
+
+    Args:
+        params (dict): A dictionary containing global and local simulation parameters.
+        n_spik_vec (numpy.ndarray): The number of spikes of each input neuron.
+        write_policy (bool): Whether to write the step policy of the design ('step_policy': 'spike'),
+            the OCEAN sessions of several designs write the policy of the whole group instead.
+    """
+    abs_process_dir = create_process_dir(params)
     netlist = os.path.join(abs_process_dir, "netlist_ocn", "netlist")
-    results_file = os.path.join(abs_process_dir, "results.txt") 
 
     # Params to include in .ocn file
     params["netlist"] = netlist  # Path to the complete netlist file 
     params["process_dir"] = abs_process_dir  # Path to simulation process dir
-    params["results_file"] = results_file  # Path to the file where results are written 
-    params["save_states"] = save_states  # A string containing signals to be written in results file
+    params["results_file"] = os.path.join(abs_process_dir, "results.txt")  # Path to the file where results are written 
+    params["save_states"] = save_states_string(params)  # A string containing signals to be written in results file
+    spike_policy = params['step_policy'] == 'spike'
+    params["tran_maxstep"] = params['max_step'] if spike_policy else native_sim.TRAN_STEP  # Relaxed between the spikes
+    params["save_signals"] = output_profile.save_signals(params)  # The MTJ states saved by Spectre
+    params["strobe_period"] = output_profile.strobe_period(params)
+    params["ocn_print_step"] = output_profile.print_step(params)
    
-    random.seed(10)
-    network_generator = NetworkGenerator(netlist, params['num_input'], params['num_output'], params['num_cells'], n_spik_vec)
-    network_generator.generate_netlist_file()  # The complete netlist file is created 
-        
-    updated_template_file = os.path.join(abs_process_dir, "updated_template.ocn")
-    log_file = os.path.join(abs_process_dir, "oceanScript.log") 
-    subst_run.substitute_templ("./oceanScript.ocn", updated_template_file, params)
-    subst_run.exec_cmd(f"ocean -nograph < {updated_template_file} > {log_file}") 
-    shutil.rmtree(f"{abs_process_dir}/psf")  # Remove the psf directory
+    def generate_netlist(netlist_dir):
+        copy_tree("./netlist_ocn", netlist_dir)
+        network_generator = NetworkGenerator(os.path.join(netlist_dir, "netlist"), params['num_input'], params['num_output'],
+                                             params['num_cells'], n_spik_vec, params['netlist_seed'], params['legacy_rng'],
+                                             connectivity.edges(params), step_policy.POLICY_FILE if spike_policy else None,
+                                             params['sim_time'], params.get('early_stop', 0) > 0)
+        network_generator.generate_netlist_file()  # The complete netlist file is created 
+
+    if params['netlist_cache']:
+        # The netlist does not depend on dev, it is generated once and hard-linked in each process dir
+        cache = NetlistCache(params['netlist_cache'], params['netlist_cache_size'])
+        cache.link(netlist_key(params, n_spik_vec, read_header()), os.path.dirname(netlist), generate_netlist)
+    else:
+        generate_netlist(os.path.dirname(netlist))
+    if spike_policy and write_policy:
+        write_step_policy([params], n_spik_vec)  # Per run, next to the (shared) netlist
+
+def run_simulation(params):
+    """
+    Runs a single SNN simulation with the given parameters.
+
+    Args:
+        params (dict): A dictionary containing global and local simulation parameters.
+
+    Steps:
+        1. Load and flatten input image.
+        2. Calculate the number of spikes for each input neuron based on pixel intensity.
+        3. Generate and prepare directories and files for the simulation.
+        4. Create the netlist for the simulation (or hard-link it from the netlist cache).
+        5. Substitute parameters into the OCEAN script and run the simulation
+           (or run the native backend when params['backend'] is 'native').
+        6. Clean up temporary files, and convert the results into the binary store.
+           With params['scratch_dir'] set, steps 5 and 6 run in a node-local scratch folder (see run_staging).
+    """
+    with run_catalog.record_runs(params['run_catalog'], [params]), \
+         run_metrics.record(params['metrics_file'], [params]) as metrics:  # Timing and resources of each stage
+        with metrics.stage('input'):
+            n_spik_vec = load_input(params)
+
+        if params.get('backend', 'spectre') in ('native', 'native_batch'):
+            # The native backend uses the same synapses (seeds & initial states) as the netlist, without Spectre
+            with metrics.stage('synapses'):
+                abs_process_dir = create_process_dir(params)
+                params["process_dir"] = abs_process_dir
+                params["results_file"] = os.path.join(abs_process_dir, "results.txt")
+                synapses = design_synapses(params, n_spik_vec)
+            with metrics.stage('native'):
+                native_sim.run_native(params, n_spik_vec, synapses)
+            return
+
+        with metrics.stage('netlist'):
+            prepare_spectre(params, n_spik_vec)
+        with run_staging.staged_runs([params], params['scratch_dir'], params['scratch_keep']):
+            abs_process_dir = params["process_dir"]  # The scratch folder of the run when it is staged
+
+            updated_template_file = os.path.join(abs_process_dir, "updated_template.ocn")
+            log_file = os.path.join(abs_process_dir, "oceanScript.log") 
+            with metrics.stage('substitute'):
+                subst_run.substitute_templ("./oceanScript.ocn", updated_template_file, params)
+            with metrics.stage('spectre'):
+                metrics.add_command(subst_run.exec_cmd(f"ocean -nograph < {updated_template_file} > {log_file}"))
+            metrics.add_spectre_log(f"{abs_process_dir}/psf/spectre.out", 0)
+            early_stop.record_stop(params, f"{abs_process_dir}/psf/spectre.out")
+            early_stop.trim_final(params)
+            with metrics.stage('cleanup'):
+                shutil.rmtree(f"{abs_process_dir}/psf")  # Remove the psf directory
+        if params['result_store']:
+            with metrics.stage('result_store'):
+                result_store.convert_results(params["process_dir"], params)  # Binary copy of results.txt, for fast loading
+
+def group_sweep(param_list, session_points=0):
+    """
+    Groups the designs that share the same netlist (see netlist_cache.netlist_key) and the same signals saved by
+    Spectre (see output_profile), so that each group is simulated by a single OCEAN session, which pays the startup,
+    the licence checkout and the netlist parsing once for all its points.
+
+    Args:
+        param_list (list of dict): The parameters of each design.
+        session_points (int): The maximum number of points of a group, 0 for no limit.
+            Smaller groups keep more workers busy when there are few distinct netlists.
+
+    Returns:
+        list of list of dict: The groups of designs, in the order of param_list.
+    """
+    groups = {}
+    for params in param_list:
+        n_spik_vec = load_input(params)
+        key = (netlist_key(params, n_spik_vec, read_header()), output_profile.save_signals(params))
+        groups.setdefault(key, []).append(params)
+    sessions = []
+    for group in groups.values():
+        size = session_points or len(group)
+        sessions.extend(group[i:i + size] for i in range(0, len(group), size))
+    return sessions
+
+def run_spectre_group(param_group):
+    """
+    Runs several SNN simulations that share the same netlist in a single OCEAN session. The point section of
+    the OCEAN script (results directory, analysis, desVars, run and ocnPrint) is repeated for each design,
+    so each design still gets its own process directory and results file.
+
+    Args:
+        param_group (list of dict): The parameters of the designs of the group (see group_sweep).
+    """
+    with run_catalog.record_runs(param_group[0]['run_catalog'], param_group), \
+         run_metrics.record(param_group[0]['metrics_file'], param_group) as metrics:
+        for params in param_group:
+            with metrics.stage('input'):
+                n_spik_vec = load_input(params)
+            with metrics.stage('netlist'):
+                prepare_spectre(params, n_spik_vec, write_policy=False)
+        if param_group[0]['step_policy'] == 'spike':
+            with metrics.stage('netlist'):
+                write_step_policy(param_group, n_spik_vec)  # The group shares the netlist of its first point
+        with run_staging.staged_runs(param_group, param_group[0]['scratch_dir'], param_group[0]['scratch_keep']):
+            abs_process_dir = param_group[0]["process_dir"]  # The script and the log of the session are kept in the first point
+
+            updated_template_file = os.path.join(abs_process_dir, "updated_template.ocn")
+            log_file = os.path.join(abs_process_dir, "oceanScript.log") 
+            with metrics.stage('substitute'):
+                subst_run.substitute_sweep("./oceanScript.ocn", updated_template_file, param_group[0], param_group)
+            with metrics.stage('spectre'):
+                metrics.add_command(subst_run.exec_cmd(f"ocean -nograph < {updated_template_file} > {log_file}"))
+            for point, params in enumerate(param_group):
+                metrics.add_spectre_log(f"{params['process_dir']}/psf/spectre.out", point)
+                early_stop.record_stop(params, f"{params['process_dir']}/psf/spectre.out")
+                early_stop.trim_final(params)
+                with metrics.stage('cleanup'):
+                    shutil.rmtree(f"{params['process_dir']}/psf", ignore_errors=True)  # Remove the psf directories
+        for params in param_group:
+            if params['result_store']:
+                with metrics.stage('result_store'):
+                    result_store.convert_results(params['process_dir'], params)
+
+def run_batch(param_list):
+    """
+    Runs many SNN simulations with the native backend, stacking the designs that share the network shape
+    and time grid (see native_sim.batch_key) along a leading design axis. Each batch advances all its
+    designs in one time loop, the results are then split into the process directory of each design.
+
+    Args:
+        param_list (list of dict): The parameters of each design.
+    """
+    batches = {}
+    for params in param_list:
+        n_spik_vec = load_input(params)
+        abs_process_dir = create_process_dir(params)
+        params["process_dir"] = abs_process_dir
+        params["results_file"] = os.path.join(abs_process_dir, "results.txt")
+        batches.setdefault(native_sim.batch_key(params), []).append((params, n_spik_vec, design_synapses(params, n_spik_vec)))
+
+    for batch in batches.values():
+        params_batch, n_spik_batch, synapses_batch = (list(x) for x in zip(*batch))
+        with run_catalog.record_runs(params_batch[0]['run_catalog'], params_batch), \
+             run_metrics.record(params_batch[0]['metrics_file'], params_batch) as metrics:
+            with metrics.stage('native'):
+                native_sim.run_native_batch(params_batch, n_spik_batch, synapses_batch)
+
+def run_job(param_list):
+    """
+    Runs a job of the sweep scheduler: a group of designs in one OCEAN session with the 'spectre_batch' backend,
+    otherwise a single design.
+
+    Args:
+        param_list (list of dict): The parameters of the designs of the job.
+    """
+    if param_list[0]['backend'] == 'spectre_batch':
+        run_spectre_group(param_list)
+    else:
+        for params in param_list:
+            run_simulation(params)
 
 def main():
     """
     Main function to run all simulations using multiprocessing.
     
     Steps:
-        1. Distribute parameter combinations across multiple processes.
-        2. Run simulations in parallel.
+        1. Distribute parameter combinations across multiple processes
+           (or stack them in batches when the backend is 'native_batch',
+           or group them by netlist when the backend is 'spectre_batch').
+        2. Run simulations in parallel, the longest first, within the core budget, skipping those done
+           by a previous run of the sweep, retrying the failed ones (see sweep_scheduler),
+           or serve them to worker nodes when 'cluster_address' is set (see sweep_cluster).
         3. Measure and print the total simulation time.
     """
-    with Pool() as p:
-        p.map(run_simulation, param_combinations)  # Distribute combinations sets and run
-        simul_t = datetime.timedelta(seconds=tm.time() - start_time)
+    if variables['backend'] == 'native_batch' and not variables['cluster_address']:
+        run_batch(param_combinations)  # All the combinations are advanced together
+    else:
+        if variables['backend'] == 'spectre_batch':
+            jobs = group_sweep(param_combinations, variables['session_points'])  # One OCEAN session per netlist
+        else:
+            jobs = [[params] for params in param_combinations]
+        if variables['cluster_address']:
+            # The jobs are run by the workers started with `python sweep_cluster.py <host>:<port>` on each node
+            sweep_cluster.Coordinator(jobs, variables['sweep_manifest'], variables['max_retries'],
+                                      variables['job_timeout'] or None).serve(sweep_cluster.parse_address(variables['cluster_address']))
+        else:
+            threads = 1 if variables['backend'] == 'native' else variables['spectre_threads']
+            sweep_scheduler.run_sweep(jobs, run_job, variables['sweep_manifest'], variables['max_retries'],
+                                      variables['job_timeout'] or None,
+                                      sweep_scheduler.num_workers(variables['core_budget'], threads))
+    simul_t = datetime.timedelta(seconds=tm.time() - start_time)
     print(f" --- The simulation finished after {simul_t} - at {datetime.datetime.now()} ---")
 
 if __name__ == '__main__':
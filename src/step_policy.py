@@ -0,0 +1,374 @@
+"""
+This module generates the spike-aware time-step policy of a Spectre run. The `tran` analysis of `oceanScript.ocn`
+takes every step of the 100 ns grid, but most of the time no MTJ can switch: the input spikes are known in advance
+(set by `n_spik_vec`, `spike_duration` and `sim_time`), and between the firing pulses the output nodes are weighted
+means of the input voltages, with weights (the conductances of the synapses) whose ratio is bounded by the devices.
+This bounds the bias of every MTJ: while none can reach the lowest switching bias of the MTJs, no `above()` event
+can fire and no MTJ can switch. The policy keeps the 100 ns step in the intervals where one can (widened by a guard),
+and relaxes the step to `max_step` between them. It is written per run in a small netlist file included by the
+netlist: a pwl vsource whose voltage is the step bound (its corners are breakpoints, so a relaxed step never
+overshoots into a tight interval) and a `Step_policy` instance (`step_policy.va`) that applies it with `$bound_step`,
+while the maxstep of the OCEAN script is relaxed. The firing pulses depend on the learned weights, so they are not
+part of the policy: the output neurons of the netlist place a time point where their membrane crosses the threshold
+and bound the step while they fire (fire_step of `out_neuron.va`). The Neel-Brown durations are drawn again at
+each time point, so the steps are only relaxed where no MTJ is biased above its threshold.
+The policy is experimental and 'fixed' stays the default: its final weights have not yet been checked against the fixed
+step on a real Spectre run, which is what `validate` (--validate) does.
+
+Functions:
+    input_voltages: The voltages of the input neurons at some times.
+    node_bounds: The bounds of the voltage of an output node at some times.
+    tight_intervals: The intervals where an MTJ can switch between the firing pulses.
+    StepPolicy: The time-step policy of a run, with its netlist bloc.
+    quiet_bias: The lowest bias at which an MTJ of a design can switch.
+    conductance_ratio: The largest ratio between the conductances of two synapses of a design.
+    build_policy: The policy of a group of runs sharing a netlist.
+    compare_final: Compares the final weights of a run with those of its fixed-step baseline.
+    validate: Runs a design with both policies and compares them.
+
+Example Usage:
+```python
+policy = build_policy([params], n_spik_vec, synapses)
+policy.write(os.path.join(netlist_dir, POLICY_FILE))
+print(policy.timepoints(), "time points instead of", policy.fixed_timepoints())
+```
+```bash
+>> python step_policy.py --validate        # Runs the default design with both policies (needs ocean)
+```
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+import mtj_sampler
+import result_store
+from mtj_sampler import MTJ_PARAMETERS
+from native_sim import OCEAN_DESVARS, SPIKE_AMPLITUDE, SPIKE_MINIMUM, TRAN_STEP
+
+POLICY_FILE = "step_policy"  # The netlist file of the policy, next to the netlist
+GUARD = 20e-6                # Widening of the tight intervals, a margin on the resolution of their search
+RESOLUTION = 1e-6            # Time resolution of the search of the tight intervals
+BIAS_MARGIN = 0.8            # The devices of Spectre are not the draws of mtj_sampler, only the same distributions
+STEP_UNIT = 1e-6             # Seconds of step bound per volt of the pwl source of the policy (see step_policy.va)
+
+
+def input_voltages(n_spik_vec, spike_duration, sim_time, times):
+    """
+    The voltages of the input neurons at some times, for exactly periodic spike trains (as `in_neuron.va`
+    and `in_neuron_seq.va`, whose spike trains restart at the beginning of each presented image).
+
+    Args:
+        n_spik_vec (numpy.ndarray): The number of spikes of each input neuron, (num_input,) or (num_images, num_input).
+        spike_duration (float): The duration of a spike.
+        sim_time (float): The simulated time.
+        times (numpy.ndarray): The times, (num_times,).
+
+    Returns:
+        numpy.ndarray: The voltages, (num_times, num_input).
+    """
+    n_spik = np.atleast_2d(np.asarray(n_spik_vec, dtype=float))
+    presenting_time = sim_time / len(n_spik)
+    times = np.asarray(times, dtype=float)[:, None]
+    k = np.minimum(np.floor(times[:, 0] / presenting_time).astype(np.intp), len(n_spik) - 1)
+    t_window = presenting_time / n_spik[k]
+    elapsed = times - k[:, None] * presenting_time
+    phase = elapsed - np.floor(elapsed / t_window) * t_window
+    ramp = phase <= np.minimum(spike_duration, t_window)
+    slope = -(SPIKE_AMPLITUDE - SPIKE_MINIMUM) / spike_duration
+    return np.where(ramp, slope * phase + SPIKE_AMPLITUDE, 0.0)
+
+
+def node_bounds(voltages, ratio):
+    """
+    The bounds of the voltage of an output node between its firing pulses: the mean of the voltages of its inputs
+    weighted by conductances whose ratio is at most ratio. The largest mean gives the largest weight to the highest
+    voltages, so it is the largest of the means where the k highest voltages have the weight ratio and the others 1.
+
+    Args:
+        voltages (numpy.ndarray): The voltages of the inputs of the node, (num_times, num_inputs).
+        ratio (float): The largest ratio between the conductances of two synapses.
+
+    Returns:
+        tuple: The lowest and the highest voltage of the node, (num_times,) each.
+    """
+    def highest(v):
+        v = -np.sort(-v, axis=1)
+        top = np.concatenate([np.zeros((len(v), 1)), np.cumsum(v, axis=1)], axis=1)
+        k = np.arange(v.shape[1] + 1)
+        return ((top[:, -1:] + (ratio - 1) * top) / (v.shape[1] + (ratio - 1) * k)).max(axis=1)
+    return -highest(-voltages), highest(voltages)
+
+
+def tight_intervals(n_spik_vec, spike_duration, sim_time, bias, ratio=1.0, input_groups=None, guard=GUARD,
+                    resolution=RESOLUTION, chunk=1 << 22):
+    """
+    The intervals where an MTJ can switch between the firing pulses: the bias of a synapse (its input voltage
+    minus the voltage of its output node, see node_bounds) can reach the bias. They are widened by the guard,
+    and merged. The firing pulses are not known in advance, the output neurons bound the step while they fire
+    (fire_step of out_neuron.va).
+
+    Args:
+        n_spik_vec (numpy.ndarray): The number of spikes of each input neuron (see input_voltages).
+        spike_duration (float): The duration of a spike.
+        sim_time (float): The simulated time.
+        bias (float): The lowest bias at which an MTJ can switch (see quiet_bias).
+        ratio (float): The largest ratio between the conductances of two synapses (see conductance_ratio).
+        input_groups (list of numpy.ndarray): The 0-based inputs of each distinct set of inputs of the output
+            neurons, None when every output neuron is connected to every input.
+        guard (float): The widening of the intervals on each side.
+        resolution (float): The time resolution of the search.
+        chunk (int): The number of voltages evaluated at once.
+
+    Returns:
+        numpy.ndarray: The (start, end) of each interval, (num_intervals, 2).
+    """
+    num_input = np.shape(n_spik_vec)[-1]
+    input_groups = [np.arange(num_input)] if input_groups is None else input_groups
+    times = np.arange(int(np.ceil(sim_time / resolution)) + 1) * resolution
+    tight = np.zeros(len(times), dtype=bool)
+    step = max(1, chunk // num_input)
+    for start in range(0, len(times), step):
+        v = input_voltages(n_spik_vec, spike_duration, sim_time, times[start:start + step])
+        for inputs in input_groups:
+            low, high = node_bounds(v[:, inputs], ratio)
+            tight[start:start + step] |= ((v[:, inputs].max(axis=1) - low >= bias)
+                                          | (high - v[:, inputs].min(axis=1) >= bias))
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], tight, [False]]).astype(np.int8)))
+    starts, ends = times[edges[0::2]] - guard, times[edges[1::2] - 1] + resolution + guard
+    return _merge(np.column_stack([starts, ends]), sim_time)
+
+
+def _merge(intervals, sim_time, gap=0.0):
+    """Sorts and merges the intervals that overlap or are closer than gap, clipped to [0, sim_time]."""
+    intervals = np.clip(np.asarray(intervals, dtype=float).reshape(-1, 2), 0.0, sim_time)
+    intervals = intervals[np.argsort(intervals[:, 0], kind='stable')]
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1] + gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        elif end > start:
+            merged.append([start, end])
+    return np.array(merged).reshape(-1, 2)
+
+
+class StepPolicy:
+    """
+    The time-step policy of a run: the time step is bounded by fine_step in the tight intervals and by max_step
+    between them. The relaxed intervals shorter than two max_step are not worth their breakpoints, they are tight.
+
+    Attributes:
+        tight [numpy.ndarray]: The (start, end) of each tight interval, sorted and disjoint.
+        sim_time [float]: The simulated time.
+        fine_step [float]: The time step in the tight intervals (the step of the fixed grid).
+        max_step [float]: The largest time step between the tight intervals.
+
+    Methods
+    -------
+    intervals():
+        The start and the step bound of each interval of the policy.
+    timepoints():
+        The number of time points of the policy (at most), without the firing pulses of the output neurons.
+    fixed_timepoints():
+        The number of time points of the fixed grid.
+    union(other):
+        The policy that is tight where either policy is.
+    wave():
+        The (time, voltage) corners of the pwl source of the step bound.
+    generate_netlist_bloc():
+        The pwl source and the Step_policy instance of the netlist.
+    write(path):
+        Writes the netlist file of the policy.
+    """
+
+    def __init__(self, tight, sim_time, fine_step=TRAN_STEP, max_step=10e-6):
+        tight = _merge(tight, sim_time, gap=2 * max_step)
+        if len(tight):  # Neither a short relaxed interval at the start nor at the end
+            tight[0, 0] = 0.0 if tight[0, 0] < 2 * max_step else tight[0, 0]
+            tight[-1, 1] = sim_time if sim_time - tight[-1, 1] < 2 * max_step else tight[-1, 1]
+        self.tight = tight
+        self.sim_time = sim_time
+        self.fine_step = fine_step
+        self.max_step = max_step
+
+    def intervals(self):
+        bounds = np.concatenate([[0.0], self.tight.ravel(), [self.sim_time]])
+        starts, steps = bounds[:-1], np.tile([self.max_step, self.fine_step], len(self.tight) + 1)[:len(bounds) - 1]
+        keep = np.diff(bounds) > 0  # Drops the empty relaxed intervals
+        return starts[keep], steps[keep]
+
+    def timepoints(self):
+        starts, steps = self.intervals()
+        durations = np.diff(np.append(starts, self.sim_time))
+        return int(np.ceil(durations / steps).sum())
+
+    def fixed_timepoints(self):
+        return int(np.ceil(self.sim_time / self.fine_step))
+
+    def union(self, other):
+        return StepPolicy(np.concatenate([self.tight, other.tight]), max(self.sim_time, other.sim_time),
+                          min(self.fine_step, other.fine_step), min(self.max_step, other.max_step))
+
+    def wave(self):
+        starts, steps = self.intervals()
+        points = [(0.0, steps[0])]
+        for start, previous, step in zip(starts[1:], steps[:-1], steps[1:]):
+            # The step changes within a fine step, at the start of a tight interval or right after its end
+            edge = (start - self.fine_step, start) if step < previous else (start, start + self.fine_step)
+            points += [(edge[0], previous), (edge[1], step)]
+        return [(t, step / STEP_UNIT) for t, step in points]
+
+    def generate_netlist_bloc(self):
+        return ("// Spike-aware time-step policy of the run (see step_policy.py), step bound: V(step_bound) * unit\n"
+                "step_policy_bound (step_bound 0) vsource type=pwl wave=[{}]\n"
+                "step_policy (step_bound) Step_policy unit={:g}\n").format(
+                    " ".join(f"{t:.12g} {v:.9g}" for t, v in self.wave()), STEP_UNIT)
+
+    def write(self, path):
+        with open(path, "w") as file:
+            file.write(self.generate_netlist_bloc())
+
+
+def quiet_bias(seeds, dev, rv=OCEAN_DESVARS['gl_RV'], temp=OCEAN_DESVARS['gl_T'], margin=BIAS_MARGIN):
+    """
+    The lowest bias at which an MTJ of a design can switch, or an above() event of `mtj_model.va` can fire:
+    the Neel-Brown thresholds, or the critical current times Ro of the weakest device, lowered by a margin.
+
+    Args:
+        seeds (numpy.ndarray): The mtj_seed of each cell.
+        dev (float): The process variability.
+        rv (int): The variability mode (gl_RV).
+        temp (float): The temperature (gl_T).
+        margin (float): The margin on the bias of the weakest device.
+
+    Returns:
+        float: The bias, in V.
+    """
+    devices = mtj_sampler.sample_devices(np.asarray(seeds), dev, rv, temp)
+    ic_ro = np.minimum(devices['IcP'], devices['IcAP']) * devices['Ro']
+    return margin * min(MTJ_PARAMETERS['brown_threshold_P2AP'], MTJ_PARAMETERS['brown_threshold_AP2P'], ic_ro.min())
+
+
+def conductance_ratio(seeds, dev, rv=OCEAN_DESVARS['gl_RV'], temp=OCEAN_DESVARS['gl_T']):
+    """
+    The largest ratio between the conductances of two synapses of a design: the most conductive synapse with all its
+    cells parallel over the least conductive one with all its cells antiparallel (at zero bias, where the TMR is the
+    largest).
+
+    Args:
+        seeds (numpy.ndarray): The mtj_seed of each cell, (num_synapses, num_cells).
+        dev (float): The process variability.
+        rv (int): The variability mode (gl_RV).
+        temp (float): The temperature (gl_T).
+
+    Returns:
+        float: The ratio.
+    """
+    devices = mtj_sampler.sample_devices(np.asarray(seeds), dev, rv, temp)
+    parallel = (1.0 / devices['Ro']).sum(axis=-1)
+    antiparallel = (1.0 / (devices['Ro'] * (1.0 + devices['TMRreal']))).sum(axis=-1)
+    return float(parallel.max() / antiparallel.min())
+
+
+def _input_groups(synapses):
+    """The 0-based inputs of each distinct set of inputs of the output neurons."""
+    groups = {}
+    for output in np.unique(synapses.output_index):
+        inputs = np.unique(synapses.input_index[synapses.output_index == output]) - 1
+        groups.setdefault(inputs.tobytes(), inputs)
+    return list(groups.values())
+
+
+def build_policy(param_group, n_spik_vec, synapses):
+    """
+    The policy of a group of runs sharing a netlist (see snn_simulator.group_sweep): it is tight where the policy
+    of any of its runs is, as the policy is part of their netlist.
+
+    Args:
+        param_group (list of dict): The parameters of the runs (spike_duration, sim_time, dev, max_step
+            and the desVar overrides gl_RV, gl_T).
+        n_spik_vec (numpy.ndarray): The number of spikes of each input neuron.
+        synapses (net_generator.SynapseArray): The synapses of the netlist (their neurons and the mtj_seed of
+            each cell).
+
+    Returns:
+        StepPolicy: The policy.
+    """
+    policy = None
+    input_groups = _input_groups(synapses)
+    for params in param_group:
+        rv, temp = params.get('gl_RV', OCEAN_DESVARS['gl_RV']), params.get('gl_T', OCEAN_DESVARS['gl_T'])
+        bias = quiet_bias(synapses.seeds, params['dev'], rv, temp)
+        ratio = conductance_ratio(synapses.seeds, params['dev'], rv, temp)
+        tight = tight_intervals(n_spik_vec, params['spike_duration'], params['sim_time'], bias, ratio, input_groups)
+        run_policy = StepPolicy(tight, params['sim_time'], max_step=params['max_step'])
+        policy = run_policy if policy is None else policy.union(run_policy)
+    return policy
+
+
+def compare_final(baseline_dir, policy_dir):
+    """
+    Compares the final weights of a run with those of its fixed-step baseline.
+
+    Args:
+        baseline_dir (str): The simulation folder of the fixed-step run.
+        policy_dir (str): The simulation folder of the run with the step policy.
+
+    Returns:
+        dict: The largest difference of a synapse weight, the number of synapses whose weight differs,
+        and the Euclidean distance between the final weights.
+    """
+    baseline, policy = result_store.final_row(baseline_dir)[1:-1], result_store.final_row(policy_dir)[1:-1]
+    return {'max_difference': float(np.abs(policy - baseline).max()),
+            'different_synapses': int(np.count_nonzero(policy != baseline)),
+            'distance': float(np.linalg.norm(policy - baseline))}
+
+
+def _run(params):
+    import snn_simulator
+    snn_simulator.run_simulation(params)
+    return params['process_dir']
+
+
+def validate(params):
+    """
+    Runs a design with the fixed 100 ns step and with the spike-aware policy (in two processes, so they get their
+    own folders), and compares their final weights and their Spectre time points.
+
+    Args:
+        params (dict): The parameters of the design.
+
+    Returns:
+        dict: The comparison of the final weights (see compare_final), and the Spectre statistics and the runtime
+        of each policy.
+    """
+    import run_metrics
+    with tempfile.TemporaryDirectory() as directory:
+        metrics_file = os.path.join(directory, "metrics.jsonl")
+        runs = [dict(params, step_policy=policy, metrics_file=metrics_file) for policy in ('fixed', 'spike')]
+        with multiprocessing.Pool(2) as pool:
+            baseline_dir, policy_dir = pool.map(_run, runs)
+        records = {record['params']['step_policy']: record for record in run_metrics.load_metrics(metrics_file)}
+    comparison = compare_final(baseline_dir, policy_dir)
+    for policy, record in records.items():
+        comparison[policy] = dict(record['spectre'], spectre_wall=record['stages'].get('spectre', {}).get('wall'))
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Spike-aware time-step policy of the default design.")
+    parser.add_argument("--validate", action="store_true",
+                        help="run the design with both policies and compare their final weights")
+    args = parser.parse_args()
+    import snn_simulator
+    params = dict(snn_simulator.variables)  # The default design, the sweep of snn_simulator does not change variables
+    n_spik_vec = snn_simulator.load_input(params)
+    policy = build_policy([params], n_spik_vec, snn_simulator.design_synapses(params, n_spik_vec))
+    print(f"{len(policy.tight)} tight intervals, {policy.timepoints()} time points "
+          f"instead of {policy.fixed_timepoints()}")
+    if args.validate:
+        for name, value in validate(params).items():
+            print(f"{name}: {value}")
@@ -8,18 +8,30 @@ https://github.com/servinagrero/monaco/tree/develop
 Functions:
     substitute_templ: Reads a template from a file, substitutes values from
     provided dictionaries, and writes the result to an output file.
-    exec_cmd: Executes a given shell command, optionally displaying the output.
+    substitute_sweep: Same as substitute_templ, but repeats the point section of
+    the template (between POINT_BEGIN and POINT_END) once for each sweep point.
+    exec_cmd: Executes a given shell command, optionally displaying the output,
+    kills its whole process tree on timeout, and returns its resource usage.
+    kill_group: Kills the process group of a command.
 
 Example Usage:
 ```python
 substitute_templ('input_template.txt', 'output_file.txt', {'key1': 'value1'}, {'key2': 'value2'})
+substitute_sweep('oceanScript.ocn', 'sweep.ocn', group_params, [point1_params, point2_params])
 exec_cmd('ls -la', verbose=True)
 ```
 """
 
+import os
+import resource
+import signal
+import time
 from string import Template
-from subprocess import run, DEVNULL
-from typing import Dict
+from subprocess import Popen, CalledProcessError, DEVNULL, TimeoutExpired
+from typing import Dict, List, Optional
+
+POINT_BEGIN = "; ==== point begin ===="
+POINT_END = "; ==== point end ===="
 
 def substitute_templ(template_file: str, output_file: str, *substitution_dicts: Dict[str, str]):
     """Substitute values into a template read from a file.
@@ -38,22 +50,95 @@ def substitute_templ(template_file: str, output_file: str, *substitution_dicts:
             result_file.write(substituted_content)
 
 
-def exec_cmd(command: str, *, verbose: bool = False) -> None:
-    """Execute a given shell command using subprocess.run.
+def substitute_sweep(template_file: str, output_file: str, shared: Dict[str, str], points: List[Dict[str, str]]):
+    """Substitute a template for several sweep points, in a single output file.
+
+    The lines before POINT_BEGIN and after POINT_END are substituted once with the shared values,
+    the lines in between are repeated and substituted for each point (with the shared values
+    overridden by the values of the point).
+
+    Args:
+      template_file: Path to the input file containing the template, with the point markers.
+      output_file: Path to the output file to write the substituted content.
+      shared: Values common to all the points (e.g. the netlist).
+      points: Values of each point (e.g. dev, results_file).
+    """
+    with open(template_file, 'r') as tmpl_file:
+        content = tmpl_file.read()
+    if POINT_BEGIN not in content or POINT_END not in content:
+        raise ValueError(f"{template_file} has no '{POINT_BEGIN}' ... '{POINT_END}' section")
+    head, rest = content.split(POINT_BEGIN, 1)
+    point, tail = rest.split(POINT_END, 1)
+    point = Template(POINT_BEGIN + point + POINT_END)
+
+    with open(output_file, 'w+') as result_file:
+        result_file.write(Template(head).safe_substitute(shared))
+        for values in points:
+            result_file.write(point.safe_substitute({**shared, **values}))
+        result_file.write(Template(tail).safe_substitute(shared))
+
+
+def exec_cmd(command: str, *, verbose: bool = False, timeout: Optional[float] = None) -> resource.struct_rusage:
+    """Execute a given shell command in its own process group.
     
+    If the command times out, or the caller is interrupted while waiting (e.g. by a job timeout),
+    the whole process group is killed, so no `ocean` or `spectre` process is left behind.
+
     Args:
       command: Shell command to execute.
       verbose: Whether to display the output of the command.
+      timeout: Maximum duration of the command in seconds, None for no limit.
+
+    Returns:
+      The resource usage of the command and of the descendants it reaped (ru_maxrss is the peak
+      resident memory of the largest of them, e.g. spectre), from os.wait4.
+
+    Raises:
+      subprocess.CalledProcessError: If the command returns a non-zero exit status.
+      subprocess.TimeoutExpired: If the command does not finish within timeout.
     """
     run_args = {
-        'args': command,  # Corrected this line
+        'args': command,
         'shell': True,
-        'check': True
+        'start_new_session': True  # The shell and its children (ocean, spectre) form a new process group
     }
     
     if not verbose:
         run_args['stdout'] = DEVNULL
         run_args['stderr'] = DEVNULL
 
-    run(**run_args)
+    process = Popen(**run_args)
+    try:
+        returncode, usage = _wait4(process, timeout)
+    except BaseException:
+        kill_group(process)
+        raise
+    if returncode:
+        raise CalledProcessError(returncode, command)
+    return usage
+
+
+def _wait4(process: Popen, timeout: Optional[float]):
+    """Reap a process with os.wait4, which unlike Popen.wait also returns its resource usage."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        pid, status, usage = os.wait4(process.pid, 0 if deadline is None else os.WNOHANG)
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return process.returncode, usage
+        if time.monotonic() >= deadline:
+            raise TimeoutExpired(process.args, timeout)
+        time.sleep(0.05)
 
+
+def kill_group(process: Popen) -> None:
+    """Kill the process group of a process started with start_new_session, and reap the process.
+
+    Args:
+      process: The leader of the process group.
+    """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
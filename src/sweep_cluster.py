@@ -0,0 +1,282 @@
+"""
+This module runs a sweep on several machines: a coordinator holds the queue of the jobs of the sweep (the same jobs
+as sweep_scheduler, lists of the parameter dicts taken by run_simulation) and serves them over TCP to worker daemons,
+started on any number of nodes, which pull a job, run it and push back its status and its result files.
+While it runs a job, a worker sends a heartbeat at a regular interval; a worker that disconnects or stays silent for
+longer than the heartbeat timeout is considered dead, and its job is put back in the queue for another worker (it
+counts as a failed attempt, up to max_retries). The jobs are served longest first, and their state is kept in the
+manifest of sweep_scheduler, so a coordinator that is started again resumes the sweep.
+The result files (results.npy, results.json or results.txt) are sent back to the coordinator, which writes them into a
+folder of the same name under its own results directory, so the nodes do not need a shared file system.
+The connections are authenticated with a key, which is required: the SNN_CLUSTER_KEY environment variable must be
+set to the same secret value on the coordinator and on every worker node, there is no default. The messages are
+pickled, so anyone who knows the key can run code on the coordinator and on the workers: keep it secret, and only
+bind the coordinator to an address reachable from the worker nodes.
+
+Functions:
+    Coordinator: The queue of the jobs of a sweep, served to the workers.
+    work: Runs a worker daemon, with one or more worker processes.
+    parse_address: Converts 'host:port' to an address tuple.
+    cluster_key: The authentication key of the connections.
+
+Example Usage:
+```bash
+# On every node, the same secret key (e.g. generated once with `python -c "import secrets; print(secrets.token_hex(32))"`)
+>> export SNN_CLUSTER_KEY=<secret>
+# On the coordinator node, with 'cluster_address': '0.0.0.0:6000' in the variables of snn_simulator.py
+>> python snn_simulator.py
+# On each worker node, from the src folder
+>> python sweep_cluster.py coordinator-host:6000 8
+```
+"""
+
+import os
+import sys
+import threading
+import time
+from multiprocessing import Process
+from multiprocessing.connection import Client, Listener
+
+import result_store
+import sweep_scheduler
+
+HEARTBEAT_INTERVAL = 10   # Seconds between the heartbeats of a worker running a job
+HEARTBEAT_TIMEOUT = 60    # Seconds of silence after which a worker is considered dead
+WAIT_INTERVAL = 5         # Seconds an idle worker waits before asking again for a job
+RESULT_FILES = (result_store.DATA_FILE, result_store.HEADER_FILE, result_store.TEXT_FILE)
+
+
+def parse_address(address):
+    """
+    Converts an address 'host:port' to the (host, port) tuple of multiprocessing.connection.
+
+    Args:
+        address (str): The address, e.g. '0.0.0.0:6000' for the coordinator, 'node1:6000' for a worker.
+
+    Returns:
+        tuple: The host and the port.
+    """
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def cluster_key():
+    """
+    The authentication key of the connections, from the SNN_CLUSTER_KEY environment variable.
+
+    Returns:
+        bytes: The key.
+
+    Raises:
+        RuntimeError: If SNN_CLUSTER_KEY is not set, or empty.
+    """
+    key = os.environ.get('SNN_CLUSTER_KEY', '')
+    if not key:
+        raise RuntimeError("SNN_CLUSTER_KEY is not set: the coordinator and the workers need the same secret key "
+                           "to authenticate their connections (see sweep_cluster)")
+    return key.encode()
+
+
+class Coordinator:
+    """
+    The queue of the jobs of a sweep, served to the workers that connect to it. Each connection is handled by
+    a thread, which assigns the next job, waits for its heartbeats and its result, and puts the job back in the
+    queue if the worker is lost.
+
+    Attributes:
+        jobs [dict]: The parameters of the designs of each job, by job identifier.
+        manifest [sweep_scheduler.Manifest]: The persistent state of the jobs.
+        max_retries [int]: The number of times a failed job is run again.
+        timeout [float]: The maximum duration of a design in seconds, None for no limit.
+        heartbeat_timeout [float]: The seconds of silence after which a worker is considered dead.
+        results_dir [str]: The folder where the result files pushed by the workers are written.
+
+    Methods
+    -------
+    serve(address, authkey):
+        Serves the jobs until they are all done or failed, returns the manifest.
+    """
+
+    def __init__(self, jobs, manifest_path, max_retries=2, timeout=None, heartbeat_timeout=HEARTBEAT_TIMEOUT,
+                 results_dir="../../snn_sim_folders/"):
+        self.jobs = {sweep_scheduler.job_id(job): job for job in jobs}
+        self.manifest = sweep_scheduler.Manifest(manifest_path)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.heartbeat_timeout = heartbeat_timeout
+        self.results_dir = os.path.abspath(results_dir)
+        self.condition = threading.Condition()
+        self.running = {}
+        self.attempts = dict.fromkeys(self.jobs, 0)  # Attempts of this run, the manifest adds up those of all the runs
+        self.queue = [key for key in self.jobs if not self.manifest.is_complete(key)]
+        self.queue.sort(key=lambda key: sweep_scheduler.job_cost(self.jobs[key]), reverse=True)  # Longest first
+        skipped = len(self.jobs) - len(self.queue)
+        if skipped:
+            print(f" --- {skipped} of {len(self.jobs)} jobs already done, skipped ---")
+
+    def serve(self, address, authkey=None):
+        listener = Listener(address, authkey=authkey or cluster_key())
+        print(f" --- coordinator listening on {listener.address}, {len(self.queue)} jobs queued ---")
+        threading.Thread(target=self._accept, args=(listener,), daemon=True).start()
+        with self.condition:
+            self.condition.wait_for(self._finished)
+        listener.close()
+        failed = [key for key in self.jobs if not self.manifest.is_complete(key)]
+        if failed:
+            print(f" --- {len(failed)} jobs failed after {self.max_retries + 1} attempts, see {self.manifest.path} ---")
+        return self.manifest
+
+    def _finished(self):
+        return not self.queue and not self.running
+
+    def _accept(self, listener):
+        while True:
+            try:
+                connection = listener.accept()
+            except OSError:
+                return  # The listener is closed at the end of the sweep
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def _handle(self, connection):
+        key, worker = None, "?"
+        try:
+            while True:
+                if not connection.poll(self.heartbeat_timeout):
+                    raise TimeoutError(f"no heartbeat for {self.heartbeat_timeout} s")
+                message = connection.recv()
+                if message[0] == 'heartbeat':
+                    continue
+                if message[0] == 'ready':
+                    worker = message[1]
+                elif message[0] == 'result':
+                    self._finish(*message[1:])
+                    key = None
+                key = self._assign(worker)
+                if key is not None:
+                    connection.send(('job', key, self.jobs[key], self.timeout and self.timeout * len(self.jobs[key])))
+                else:
+                    with self.condition:
+                        connection.send(('stop',) if self._finished() else ('wait', WAIT_INTERVAL))
+        except (EOFError, OSError, TimeoutError) as exc:
+            if key is not None:
+                print(f" --- worker {worker} lost ({str(exc) or type(exc).__name__}), job {key} is put back in the queue ---")
+                self._finish(key, 'failed', f"worker {worker} lost", [], None, {})
+        finally:
+            connection.close()
+
+    def _assign(self, worker):
+        with self.condition:
+            if not self.queue:
+                return None
+            key = self.queue.pop(0)
+            self.running[key] = worker
+            self.attempts[key] += 1
+            attempts = self.manifest.jobs.get(key, {}).get('attempts', 0)
+            self.manifest.update(key, status='running', attempts=attempts + 1, worker=worker)
+            return key
+
+    def _finish(self, key, status, error, process_dirs, wall_time, files):
+        with self.condition:
+            process_dirs = [self._store(folder, files.get(os.path.basename(folder), {})) for folder in process_dirs]
+            self.manifest.update(key, status=status, error=error, process_dirs=process_dirs, wall_time=wall_time)
+            self.running.pop(key, None)
+            print(f" --- job {key} {status} on {self.manifest.jobs[key].get('worker')}"
+                  + (f" in {wall_time:.1f} s" if wall_time is not None else "") + (f": {error}" if error else "") + " ---")
+            if status != 'done' and self.attempts[key] <= self.max_retries:
+                self.queue.append(key)
+                self.queue.sort(key=lambda key: sweep_scheduler.job_cost(self.jobs[key]), reverse=True)
+            self.condition.notify_all()
+
+    def _store(self, folder, files):
+        """Writes the result files pushed by a worker, unless the folder is already there (shared file system)."""
+        if os.path.isdir(folder) or not files:
+            return folder
+        local = os.path.join(self.results_dir, os.path.basename(folder))
+        os.makedirs(local, exist_ok=True)
+        for name, content in files.items():
+            with open(os.path.join(local, name), "wb") as file:
+                file.write(content)
+        return local
+
+
+def _collect(process_dirs):
+    """Reads the result files of the process directories of a job, to push them to the coordinator."""
+    files = {}
+    for folder in process_dirs:
+        files[os.path.basename(folder)] = {}
+        for name in RESULT_FILES:
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as file:
+                    files[os.path.basename(folder)][name] = file.read()
+    return files
+
+
+def _worker(address, run, authkey, heartbeat, push_results):
+    """A worker process: pulls the jobs from the coordinator and runs them until it is told to stop."""
+    name = f"{os.uname().nodename}:{os.getpid()}"
+    connection = Client(address, authkey=authkey)
+    lock = threading.Lock()
+
+    def send(message):
+        with lock:
+            connection.send(message)
+
+    def beat(stop):
+        while not stop.wait(heartbeat):
+            try:
+                send(('heartbeat',))
+            except OSError:
+                return
+
+    send(('ready', name))
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            return  # The coordinator has finished
+        if message[0] == 'stop':
+            return
+        if message[0] == 'wait':
+            time.sleep(message[1])
+            send(('ready', name))
+            continue
+        _, key, param_list, timeout = message
+        stop = threading.Event()
+        beater = threading.Thread(target=beat, args=(stop,), daemon=True)
+        beater.start()
+        try:
+            outcome = sweep_scheduler.attempt_job((key, run, param_list, timeout))
+        finally:
+            stop.set()
+            beater.join()
+        files = _collect(outcome[3]) if push_results else {}
+        send(('result',) + outcome + (files,))
+
+
+def work(address, run, authkey=None, processes=1, heartbeat=HEARTBEAT_INTERVAL, push_results=True):
+    """
+    Runs a worker daemon: starts processes that each pull the jobs of the coordinator and run them,
+    and returns when the coordinator has no more jobs.
+
+    Args:
+        address (tuple): The (host, port) of the coordinator.
+        run (callable): The function that runs a job from the list of its parameters.
+        authkey (bytes): The authentication key, defaults to cluster_key().
+        processes (int): The number of jobs run at once on this node.
+        heartbeat (float): The seconds between the heartbeats sent while a job runs.
+        push_results (bool): Whether to send the result files to the coordinator.
+    """
+    workers = [Process(target=_worker, args=(address, run, authkey or cluster_key(), heartbeat, push_results))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == '__main__':
+    import snn_simulator
+    work(parse_address(sys.argv[1]), snn_simulator.run_job,
+         processes=int(sys.argv[2]) if len(sys.argv) > 2 else
+         sweep_scheduler.num_workers(snn_simulator.variables['core_budget'], snn_simulator.variables['spectre_threads']))
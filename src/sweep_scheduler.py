@@ -0,0 +1,238 @@
+"""
+This module schedules the simulations of a sweep, so that a sweep can be stopped and restarted without losing the
+finished simulations, and one failing simulation does not stop the others.
+The jobs (one design, or a group of designs simulated by one OCEAN session) are identified by a hash of their
+parameters, and their state (pending, running, done or failed), attempts, folders and errors are kept in a JSON
+manifest, written after each completion. When a sweep is started again, the jobs that are done, and whose results
+are still on disk, are skipped, the failed and interrupted ones are run again. The jobs are distributed to a Pool
+and their completions are streamed with `imap_unordered`; a failed job is retried up to `max_retries` times, and a
+job that exceeds its timeout is interrupted, which kills the process group of its `ocean` command.
+Spectre runs multithreaded, so the number of workers is the core budget divided by the threads of each job, which
+keeps the machine from being oversubscribed. The jobs are dispatched longest first, by an estimate of their cost,
+so the longest simulations do not start last and stretch the end of the sweep.
+
+Functions:
+    job_id: Computes the identifier of a job from its parameters.
+    job_cost: Estimates the relative duration of a job.
+    num_workers: Number of jobs run at once within a core budget.
+    attempt_job: Runs an attempt of a job in a worker, with its timeout.
+    Manifest: The persistent state of the jobs of a sweep.
+    run_sweep: Runs the jobs of a sweep that are not complete, with retries and timeouts.
+
+Example Usage:
+```python
+jobs = [[params] for params in param_combinations]
+run_sweep(jobs, run_job, "../../snn_sim_folders/sweep_manifest.json", max_retries=2, timeout=3600,
+          processes=num_workers(core_budget=32, threads=4))
+```
+"""
+
+import hashlib
+import json
+import math
+import os
+import signal
+import time
+import traceback
+from multiprocessing import Pool
+
+import numpy as np
+
+import connectivity
+import mnist_dataset
+import result_store
+
+# Parameters set while a design is simulated, or that only change how the sweep is run, they do not identify it
+RUN_KEYS = ('process_dir', 'results_file', 'netlist', 'save_states', 'num_input',
+            'sweep_manifest', 'max_retries', 'job_timeout', 'core_budget', 'spectre_threads', 'cluster_address',
+            'scratch_dir', 'metrics_file', 'tran_maxstep', 'policy_timepoints', 'stop_time', 'stop_reason',
+            'save_signals', 'strobe_period', 'ocn_print_step')
+
+
+def job_id(param_list):
+    """
+    Computes the identifier of a job, the hash of the parameters of its designs.
+
+    Args:
+        param_list (list of dict): The parameters of the designs of the job.
+
+    Returns:
+        str: The identifier of the job.
+    """
+    designs = [{k: v for k, v in result_store.json_params(params).items() if k not in RUN_KEYS} for params in param_list]
+    return hashlib.sha256(json.dumps(designs, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _input_size(params):
+    """
+    The number of input neurons of a design, from the size of its image, before load_input sets params['num_input']
+    (the MNIST images are 28 x 28 unless rescaled to params['mnist_size'], the letter images are only read for their
+    shape).
+    """
+    name = str(params['inp_img']).split(',')[0]
+    if name.startswith(mnist_dataset.PREFIX):
+        return (params.get('mnist_size') or 28) ** 2
+    return np.load(f'./input_images/letter_imgs/generated_{name}.npy', mmap_mode='r').size
+
+
+def job_cost(param_list):
+    """
+    Estimates the relative duration of a job: the simulation time of each design times the number of its MTJs
+    (its synapses, from its input size and its connectivity, times num_cells), which set the number of time steps
+    and the size of the circuit.
+
+    Args:
+        param_list (list of dict): The parameters of the designs of the job.
+
+    Returns:
+        float: The estimated cost, only meaningful to compare jobs.
+    """
+    cost = 0.0
+    for params in param_list:
+        input_index, _ = connectivity.edges(dict(params, num_input=_input_size(params)))
+        cost += len(input_index) * params['num_cells'] * params['sim_time']
+    return cost
+
+
+def num_workers(core_budget=0, threads=1):
+    """
+    Number of jobs run at once, so that their threads fit in the core budget.
+
+    Args:
+        core_budget (int): The number of cores used by the sweep, 0 for all the cores of the machine.
+        threads (int): The number of threads of each job.
+
+    Returns:
+        int: The number of workers of the Pool, at least 1.
+    """
+    return max(1, (core_budget or os.cpu_count()) // max(1, threads))
+
+
+class Manifest:
+    """
+    The persistent state of the jobs of a sweep, in a JSON file that is replaced atomically at each update.
+    Only the process that runs the sweep writes it.
+
+    Attributes:
+        path [str]: The path of the manifest file.
+        jobs [dict]: For each job identifier: status, attempts (over all the runs of the sweep), process_dirs, error,
+            wall_time.
+
+    Methods
+    -------
+    is_complete(key):
+        Whether a job is done and its results are on disk.
+    update(key, **fields):
+        Updates the fields of a job and writes the manifest.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.jobs = {}
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as file:
+                self.jobs = json.load(file)
+
+    def is_complete(self, key):
+        job = self.jobs.get(key)
+        if not job or job['status'] != 'done':
+            return False
+        return all(os.path.isfile(os.path.join(folder, result_store.TEXT_FILE))
+                   or os.path.isfile(os.path.join(folder, result_store.DATA_FILE)) for folder in job['process_dirs'])
+
+    def update(self, key, **fields):
+        job = self.jobs.setdefault(key, {'status': 'pending', 'attempts': 0, 'process_dirs': [], 'error': None,
+                                         'wall_time': None})
+        job.update(fields)
+        self.write()
+
+    def write(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w") as file:
+            json.dump(self.jobs, file, indent=1)
+        os.replace(tmp_file, self.path)
+
+
+class JobTimeout(Exception):
+    """Raised in a worker when its job exceeds its timeout."""
+
+
+def _alarm(signum, frame):
+    raise JobTimeout("The job exceeded its timeout")
+
+
+def attempt_job(args):
+    """
+    Runs an attempt of a job in a worker, and returns its outcome instead of raising, so the other jobs go on.
+
+    Args:
+        args (tuple): The job identifier, the run function, the parameters of the designs and the timeout in seconds.
+
+    Returns:
+        tuple: The job identifier, the status ('done' or 'failed'), the error, the process directories and the wall time.
+    """
+    key, run, param_list, timeout = args
+    start = time.time()
+    if timeout:
+        signal.signal(signal.SIGALRM, _alarm)
+        signal.alarm(max(1, math.ceil(timeout)))
+    try:
+        run(param_list)
+        status, error = 'done', None
+    except BaseException as exc:  # The job fails, not the sweep
+        status, error = 'failed', "".join(traceback.format_exception_only(type(exc), exc)).strip()
+    finally:
+        if timeout:
+            signal.alarm(0)
+    process_dirs = [params['process_dir'] for params in param_list if params.get('process_dir')]
+    return key, status, error, process_dirs, time.time() - start
+
+
+def run_sweep(jobs, run, manifest_path, max_retries=2, timeout=None, processes=None):
+    """
+    Runs the jobs of a sweep that are not complete, in a Pool, the longest first, and records their state
+    in the manifest.
+
+    Args:
+        jobs (list of list of dict): The parameters of the designs of each job.
+        run (callable): The function that runs a job from the list of its parameters, it must be picklable.
+        manifest_path (str): The path of the manifest of the sweep.
+        max_retries (int): The number of times a failed job is run again.
+        timeout (float): The maximum duration of a design in seconds, None for no limit. An attempt of a job
+            of n designs is interrupted after n * timeout.
+        processes (int): The number of workers of the Pool, defaults to the number of CPUs.
+
+    Returns:
+        Manifest: The manifest at the end of the sweep.
+    """
+    manifest = Manifest(manifest_path)
+    keyed = {job_id(job): job for job in jobs}
+    skipped = [key for key in keyed if manifest.is_complete(key)]
+    if skipped:
+        print(f" --- {len(skipped)} of {len(keyed)} jobs already done, skipped ---")
+
+    # Each round runs the jobs that are not complete once, so a job gets max_retries + 1 attempts per invocation;
+    # the attempts of the manifest add up over the invocations and are only reported
+    for _ in range(max_retries + 1):
+        pending = [key for key in keyed if not manifest.is_complete(key)]
+        if not pending:
+            break
+        pending.sort(key=lambda key: job_cost(keyed[key]), reverse=True)  # Longest first
+        for key in pending:
+            attempts = manifest.jobs.get(key, {}).get('attempts', 0)
+            manifest.jobs.setdefault(key, {'process_dirs': [], 'error': None, 'wall_time': None})
+            manifest.jobs[key].update(status='running', attempts=attempts + 1)
+        manifest.write()
+
+        with Pool(processes) as pool:
+            tasks = [(key, run, keyed[key], timeout and timeout * len(keyed[key])) for key in pending]
+            for done, (key, status, error, process_dirs, wall_time) in enumerate(pool.imap_unordered(attempt_job, tasks), 1):
+                manifest.update(key, status=status, error=error, process_dirs=process_dirs, wall_time=wall_time)
+                print(f" --- job {key} {status} in {wall_time:.1f} s ({done}/{len(pending)})"
+                      + (f": {error}" if error else "") + " ---")
+
+    failed = [key for key in keyed if not manifest.is_complete(key)]
+    if failed:
+        print(f" --- {len(failed)} jobs failed after {max_retries + 1} attempts, see {manifest.path} ---")
+    return manifest